@@ -0,0 +1 @@
+# the tests import the oresreverter package from the repository root
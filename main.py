@@ -2,12 +2,27 @@
 # -*- coding: utf-8  -*-
 # type: ignore
 
-import datetime
+import asyncio
+import heapq
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 import pywikibot
-from oresreverter.change import Change
+from oresreverter.change import check_blp
 from oresreverter.config import BotConfig
+from oresreverter.engine import AsyncEngine
+from oresreverter.fakeserver import use_fake_family
+from oresreverter.metrics import get_metrics
+from oresreverter.eventstream import EventStream
+from oresreverter.pipeline import ScoringPipeline
 from oresreverter.recentchanges import recentchanges
-from cronjobs.blp import BLPBot, blp_remove_generator
+from oresreverter.replay import Recorder, RecordingTransport
+from oresreverter.scheduler import get_scheduler
+from oresreverter.models.langid import get_language_identifier
+from oresreverter.transport import set_transport
+from oresreverter.workers import ShardedPipeline
+from oresreverter.writes import append_text
 from cronjobs.protection import ProtectionBot, page_protected_generator, page_unprotected_generator
 import time
 
@@ -15,6 +30,8 @@ def initialize_cronjobs(cfg: BotConfig, dry_run: bool):
 	cronjobs={}
 	for cronjob in cfg.cronjobs_interval_minutes:
 		if 'blp' in cronjob and cfg.enabled_tools['blp_remove']:
+			# connects to Wikidata on import
+			from cronjobs.blp import BLPBot
 			cronjobs[cronjob] = BLPBot(cronjob, dry_run=dry_run)
 		elif 'protected' in cronjob and cfg.enabled_tools['page_protection']:
 			cronjobs[cronjob] = ProtectionBot(cronjob, dry_run=dry_run)
@@ -22,22 +39,116 @@ def initialize_cronjobs(cfg: BotConfig, dry_run: bool):
 
 	return cronjobs
 
-def notify_maintainer(user, exception):
+def run_cronjobs(cfg: BotConfig, cronjobs: dict):
+	for cron in cronjobs:
+		if cron in cfg.cronjobs_interval_minutes:
+			interval = cfg.cronjobs_interval_minutes[cron]
+			if (time.time() - cronjobs[cron].last_run) < interval * 60:
+				continue
+			pywikibot.output(f"Running cronjob {cron}")
+			with get_metrics().cronjob.time(job=cron):
+				cronjobs[cron].run()
+			cronjobs[cron].last_run = time.time()
+
+# everything the bot keeps for one wiki
+Wiki = namedtuple("Wiki", "site cfg pipeline cronjobs")
+
+def notify_maintainer(cfg: BotConfig, exception):
 	error = f"\n==Eroare in PatrocleBot==\n{str(exception)}--~~~~\n"
 	try:
-		page = pywikibot.Page(pywikibot.Site(), user, ns=3)
-		text = page.get()
-		text += error
-		page.put(text, "Eroare")
+		page = pywikibot.Page(cfg.site, cfg.maintainer, ns=3)
+		append_text(page, error, "Eroare")
 		pywikibot.output(error)
 	except:
 		pywikibot.output(error)
 
+def stream_run(cfg: BotConfig, cronjobs: dict, pipeline: ScoringPipeline, stream: EventStream, dry_run: bool):
+	while True:
+		try:
+			for infos in stream.batches():
+				cfg.load_config()
+				run_cronjobs(cfg, cronjobs)
+				stats = pipeline.run(infos)
+				cfg.cursor.advance(infos)
+				pywikibot.output(f"Batch stats: {stats}")
+		except Exception as e:
+			if dry_run:
+				raise e
+			else:
+				notify_maintainer(cfg, e)
+
+def poll_once(wiki: Wiki) -> float:
+	"""Poll and treat the recent changes of one wiki; returns the seconds until its next poll."""
+	site, cfg, pipeline, cronjobs = wiki
+	cursor = cfg.cursor
+	# start with cronjobs if any
+	cfg.load_config()
+	run_cronjobs(cfg, cronjobs)
+	# then continue with recent changes
+	changes = recentchanges(site,
+							end=cursor.end,
+							namespaces=cfg.namespaces,
+							total=cfg.rc_limit,
+							top_only=True,
+							patrolled=None,
+							reverse=False)
+
+	with get_metrics().rc_fetch.time():
+		rows = list(changes)
+	get_metrics().rc_changes.inc(len(rows))
+	if len(rows) >= cfg.rc_limit and cursor.end is not None:
+		# the batch may not reach back to the cursor, fill the gap first
+		cursor.catch_up(site, cfg, pipeline,
+						until=pywikibot.Timestamp.fromISOformat(rows[-1]['timestamp']))
+	infos = cursor.filter(rows)
+	count = len(infos)
+	stats = pipeline.run(infos)
+	cursor.advance(infos)
+	pywikibot.output(f"Batch stats: {stats}")
+
+	cfg.poller.observe(infos, stats.total_s)
+	interval = cfg.poller.next_interval(len(rows), cfg.rc_limit, cfg.rc_interval_min, cfg.rc_interval_max)
+	print(f"{site}: treated {count} pages. Next poll in {interval:.1f}s, starting from {cursor.timestamp}.", flush=True)
+	return interval
+
+def poll_run(wikis: list, dry_run: bool):
+	"""Poll the wikis in turn, each one when its own poller says so."""
+	for wiki in wikis:
+		wiki.cfg.cursor.catch_up(wiki.site, wiki.cfg, wiki.pipeline)
+	due = [(time.monotonic(), idx) for idx in range(len(wikis))]
+	while True:
+		when, idx = heapq.heappop(due)
+		time.sleep(max(0, when - time.monotonic()))
+		wiki = wikis[idx]
+		interval = wiki.cfg.rc_interval_min
+		try:
+			interval = poll_once(wiki)
+		except Exception as e:
+			if dry_run:
+				raise e
+			else:
+				notify_maintainer(wiki.cfg, e)
+		heapq.heappush(due, (time.monotonic() + interval, idx))
+
+async def run_engines(engines: list):
+	await asyncio.gather(*(engine.run() for engine in engines))
+
 def single_run():
 	dry_run = False
+	use_async = False
+	use_stream = False
 	page="MediaWiki:Revertbot.json"
 	model=None
+	recorder=None
+	api_url=None
+	site_specs=[]
+	workers=1
+	store_path="shared.sqlite"
 
+	# handle_args() builds the default site, which must be the fake one with -api:
+	for arg in sys.argv[1:]:
+		if arg.startswith('-api:'):
+			use_fake_family(arg.split(':', maxsplit=1)[1])
 	local_args = pywikibot.handle_args()
 	for arg in local_args:
 		# Handle args whether we are running in dry run mode
@@ -47,66 +158,94 @@ def single_run():
 			page = arg.split(':', maxsplit=1)[1]
 		if arg.startswith('-model:'):
 			model = arg.split(':')[1]
+		if arg == '-async':
+			use_async = True
+		if arg == '-stream':
+			use_stream = True
+		if arg.startswith('-api:'):
+			api_url = arg.split(':', maxsplit=1)[1]
+		if arg.startswith('-record:'):
+			recorder = Recorder(arg.split(':', maxsplit=1)[1])
+		# -site:<code>.<family>[=<config page>], once per wiki
+		if arg.startswith('-site:'):
+			site_specs.append(arg.split(':', maxsplit=1)[1])
+		# -workers:<N> treats the changes in N processes sharing the state in -store:<file>
+		if arg.startswith('-workers:'):
+			workers = int(arg.split(':')[1])
+		if arg.startswith('-store:'):
+			store_path = arg.split(':', maxsplit=1)[1]
 
-	site = pywikibot.Site("ro", "wikipedia")
-	site.login()
-	processed_timestamp = None
+	if api_url:
+		# use_fake_family() made it the default site
+		sites = [(pywikibot.Site(), page)]
+	else:
+		sites = []
+		for spec in site_specs or ["ro.wikipedia"]:
+			name, _, site_page = spec.partition('=')
+			code, _, family = name.partition('.')
+			sites.append((pywikibot.Site(code, family or "wikipedia"), site_page or page))
+	if use_stream and not use_async and len(sites) > 1:
+		pywikibot.error("-stream needs -async to follow several wikis")
+		return
+	if workers > 1 and (use_async or recorder is not None):
+		pywikibot.error("-workers cannot be combined with -async or -record")
+		return
 
-	cfg = BotConfig(site, page=page, model_name=model, dry_run=dry_run)
-	backoff_factor = 1
-	min_backoff_factor = 1
-	max_backoff_factor = int((cfg.rc_interval_max + cfg.rc_interval_min - 1) / cfg.rc_interval_min)
+	wikis = []
+	for site, site_page in sites:
+		site.login()
+		# only the first wiki is recorded
+		wiki_recorder = recorder if not wikis else None
+		if wiki_recorder is not None:
+			set_transport(RecordingTransport(recorder))
+			recorder.record_config(site, pywikibot.Page(site, site_page).get())
+		# the first wiki configures the components shared by all of them
+		cfg = BotConfig(site, page=site_page, model_name=model, dry_run=dry_run, shared=not wikis)
+		# the cron jobs are written for the first wiki
+		cronjobs = initialize_cronjobs(cfg, dry_run) if not wikis else {}
+		if workers > 1:
+			pipeline = ShardedPipeline(site, site_page, model, workers, store_path, dry_run=dry_run, api_url=api_url)
+		else:
+			pipeline = ScoringPipeline(site, cfg, recorder=wiki_recorder)
+		wikis.append(Wiki(site, cfg, pipeline, cronjobs))
+		pywikibot.output(f"Started bot on {site} with config {site_page}, model {cfg.model_name}, {workers} worker(s)")
 
-	cronjobs = initialize_cronjobs(cfg, dry_run)
+	by_name = {wiki.site.sitename: wiki for wiki in wikis}
+	def blp_job(title, site=None):
+		# jobs saved before several wikis were supported have no site
+		wiki = by_name.get(site, wikis[0])
+		check_blp(pywikibot.Page(wiki.site, title), wiki.cfg.reporter)
 
-	pywikibot.output(f"Started bot with config {page}, model {cfg.model_name}")
+	scheduler = get_scheduler()
+	scheduler.register("blp", blp_job)
+	scheduler.start()
+	if any(wiki.cfg.enabled_tools['new_article_watch'] for wiki in wikis):
+		get_language_identifier().start()
 
-	while True:
-		try:
-			# start with cronjobs if any
-			cfg.load_config()
-			for cron in cronjobs:
-				if cron in cfg.cronjobs_interval_minutes:
-					interval = cfg.cronjobs_interval_minutes[cron]
-					if (time.time() - cronjobs[cron].last_run) < interval * 60:
-						continue
-					pywikibot.output(f"Running cronjob {cron}")
-					cronjobs[cron].run()
-					cronjobs[cron].last_run = time.time()
-			# then continue with recent changes
-			changes = recentchanges(site,
-									end=processed_timestamp,
-									namespaces=cfg.namespaces,
-									total=cfg.rc_limit,
-									top_only=True,
-									patrolled=None,
-									reverse=False)
-
-			count = 0
-			for p in changes:
-				if count == 0:
-					processed_timestamp = pywikibot.Timestamp.fromISOformat(p.get('timestamp'))
-					timediff = datetime.timedelta(seconds=1)
-					processed_timestamp = processed_timestamp + timediff
-				#pywikibot.output(p)
-				change = Change(site, p, cfg)
-				change.treat()
-				count += 1
-
-			if count == 0:
-				if backoff_factor < max_backoff_factor:
-					backoff_factor += 1
-				processed_timestamp = pywikibot.Timestamp.utcnow()
-			elif backoff_factor > min_backoff_factor:
-				backoff_factor = int(backoff_factor / 2)
-			backoff_time = backoff_factor * cfg.rc_interval_min
-			print(f"Treated {count} pages. Now sleeping for {backoff_time}s, then starting from {processed_timestamp} UTC.", flush=True)
-			time.sleep(backoff_time)
-		except Exception as e:
-			if dry_run:
-				raise e
-			else:
-				notify_maintainer(cfg.maintainer, e)
+	streams = {}
+	if use_stream:
+		for wiki in wikis:
+			streams[wiki.site] = EventStream(wiki.site, wiki.cfg)
+			# resume with a catch-up from where the previous run stopped
+			streams[wiki.site].last_timestamp = wiki.cfg.cursor.end
+	if use_async:
+		# one thread pool for the blocking calls of all the wikis
+		executor = ThreadPoolExecutor(max_workers=int(getattr(wikis[0].cfg, "engine_threads", 8)),
+									  thread_name_prefix="engine")
+		engines = []
+		for wiki in wikis:
+			on_error = None if dry_run else lambda e, cfg=wiki.cfg: notify_maintainer(cfg, e)
+			engines.append(AsyncEngine(wiki.site, wiki.cfg,
+									   maintenance=lambda wiki=wiki: run_cronjobs(wiki.cfg, wiki.cronjobs),
+									   on_error=on_error, stream=streams.get(wiki.site), executor=executor))
+		asyncio.run(run_engines(engines))
+		return
+	if use_stream:
+		site, cfg, pipeline, cronjobs = wikis[0]
+		stream_run(cfg, cronjobs, pipeline, streams[site], dry_run)
+		return
+
+	poll_run(wikis, dry_run)
 
 if __name__ == "__main__":
 	single_run()
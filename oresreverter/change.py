@@ -3,18 +3,19 @@
 # type: ignore
 import time
 from contextlib import suppress
-from threading import Thread
+from datetime import datetime
 
-import mwparserfromhell
 import requests
-from cronjobs.blp import add_blp
-from langdetect import detect_langs
 
 import pywikibot
 from pywikibot.exceptions import NoPageError
 from .config import BotConfig
-from .models.langid import LangIdConfig
+from .metrics import get_metrics
+from .models.langid import get_language_identifier
+from .report import BotReporter
+from .scheduler import get_scheduler
 from .userwarn import RevertedUser
+from .writes import rollback
 
 
 def item_is_in_list(statement_list: list, itemlist: list[str]) -> bool:
@@ -32,23 +33,63 @@ return: Whether the item matches
 	return False
 
 
+def check_blp(article: pywikibot.Page, reporter: BotReporter) -> None:
+	"""Add the BLP template to the talk page of a new article about a living person."""
+	if not article.exists():
+		return
+	try:
+		item = article.data_item()
+	except NoPageError:
+		return
+	# humans
+	if (item is not None and item.get() and
+		    item_is_in_list(item.claims.get('P31'), ['Q5'])):
+		pywikibot.output(article.title() + " is human...")
+		if 'P569' in item.claims and 'P570' not in item.claims:
+			#pywikibot.output(item.claims)
+			# cronjobs.blp connects to Wikidata on import, offline runs never get here
+			from cronjobs.blp import add_blp
+			add_blp(article.toggleTalkPage())
+			reporter.report_successful_blp_add()
+
+
 class Change(object):
+	# decide() outcomes
+	SKIP = None
+	REVERT = "revert"
+	PATROL = "patrol"
+	NEAR_REVERT = "near_revert"
+	NO_REVERT = "no_revert"
+	NEW_ARTICLE = "new_article"
+
+	blp_delay_s = 5 * 60 # wait 5 minutes before adding BLP
+
 	def __init__(self, site, info, cfg: BotConfig):
 		self._site = site
+		self.info = info
 		self._revid = info['revid']
 		self._title = info['title']
 		self._type = info['type']
 		self._patrolled = info.get('patrolled')
-		self._article = pywikibot.Page(self._site, self._title)
-		self._user = RevertedUser(info['user'], cfg.tracker)
+		self._timestamp = info.get('timestamp')
+		# an empty list when ORES did not score the revision
+		self._rcscores = info.get('oresscores') or None
 		self._score = None
 		self._cfg = cfg
+		self._article = self.make_page(self._title)
+		self._user = self.make_user(info['user'])
 		self._model = cfg.model
 		self.score_penalty = 0
-		labels_with_penalty = list(set(info['tags']) & set(cfg.labels_penalty.keys()))
+		labels_with_penalty = cfg.penalty_labels.intersection(info['tags'])
 		if len(labels_with_penalty) > 0:
 			self.score_penalty = max([cfg.labels_penalty[label] for label in labels_with_penalty])
 
+	def make_page(self, title: str) -> pywikibot.Page:
+		return pywikibot.Page(self._site, title)
+
+	def make_user(self, username: str) -> RevertedUser:
+		return RevertedUser(username, self._site, self._cfg.tracker, self._cfg.warnings)
+
 	def get_score(self):
 		if not isinstance(self._revid, int):
 			raise TypeError(f"revid must be an int, not {type(self.revid)}")
@@ -56,7 +97,16 @@ class Change(object):
 		if self._score is not None:
 			return
 
-		self._score = self._model.get_score(lang=self._site.lang, revid=self._revid)
+		self._score = self._model.get_score(lang=self._site.lang, revid=self._revid,
+											rcscores=self._rcscores, wiki=self._site.dbName())
+
+	def set_score(self, score: float) -> None:
+		"""Use a score obtained elsewhere, e.g. from a batch request."""
+		self._score = score
+
+	@property
+	def rcscores(self):
+		return self._rcscores
 
 	@property
 	def score(self):
@@ -64,6 +114,16 @@ class Change(object):
 			self.get_score()
 		return self._score
 
+	@property
+	def decider(self):
+		"""The model whose thresholds apply to this revision's score."""
+		return self._model.model_for(self._revid)
+
+	@property
+	def needs_score(self) -> bool:
+		"""Whether treat() will ask the model for a score."""
+		return self._cfg.active and self._patrolled is None and self._score is None
+
 	@property
 	def revid(self):
 		return self._revid
@@ -72,56 +132,71 @@ class Change(object):
 	def article(self):
 		return self._article
 
+	@property
+	def lag(self) -> float:
+		"""Seconds since the edit was made, or None if the row has no timestamp."""
+		if not self._timestamp:
+			return None
+		return time.time() - datetime.fromisoformat(self._timestamp.replace('Z', '+00:00')).timestamp()
+
 	def tag_article(self, tag: str, reason: str) -> None:
+		self._cfg.writes.submit("tag", lambda: self.put_tag(tag, reason))
+
+	def put_tag(self, tag: str, reason: str) -> None:
 		if len(self.article.contributors()) == 1:
 			text = f"{tag}\n{self.article.text}"
 			expl = (f"Etichetez articolul pentru "
 					f"{reason}. Greșit? Raportați [[WP:AA|aici]].")
-			self.article.put(text, summary=expl, bot=False)
+			with get_metrics().write.time(action="tag"):
+				self.article.put(text, summary=expl, bot=False)
 			pywikibot.output(f"Speedy deletion tag added to {self._title}.")
 
 	def revert(self):
 		if not self._cfg.enabled_tools['revert']:
-			pywikibot.output(f"Found revert candidate: [[{self._title}]]@{self._revid} ({self._model.get_name()} score={self.score})")
+			pywikibot.output(f"Found revert candidate: [[{self._title}]]@{self._revid} ({self.decider.get_name()} score={self.score})")
 			#pywikibot.output(f"|-\n| [[Special:Diff/{self._revid}|{self._title}]] || || ")
 			return
 
 		user = self._user.username
-		docs_link = f"[[{self._model.get_docs()}|{self._model.get_name()}]]"
+		docs_link = f"[[{self.decider.get_docs()}|{self.decider.get_name()}]]"
 		extra = ""
 		if self.score_penalty > 0:
 			extra = f"+{self.score_penalty} penalizare"
 		expl = f"Se revine automat asupra unei modificări distructive (scor {docs_link}: {self.score}{extra}). Greșit? Raportați [[WP:AA|aici]]."
-		try:
-			self._cfg.tracker.add_change(self._title, user)
-			self._site.loadrevisions(self.article, content=False, total=10)
-			self._site.rollbackpage(self.article, user=user, summary=expl, markbot=False)
-			self._user.warn_or_report(self._title)
-		except Exception as e:
-			pywikibot.output(f"Error rollbacking page {self._title}: {e}")
-			import traceback
-			print(traceback.format_exc())
-			self._cfg.reporter.report_failed_revert()
-			self.tag_article("{{șr-g3-vandalism}}",
-										 f"vandalism (scor [[{self._model.get_docs()}|{self._model.get_name()}]]: {self.score})")
-		else:
-			self._cfg.reporter.report_successful_revert()
-			pywikibot.output(f"The edit(s) made in {self._title} by {user} was rollbacked.")
-		finally:
-			pass #TODO maybe warn here?
+		self._cfg.tracker.add_change(self._title, user)
+		self._cfg.writes.submit("rollback", lambda: self.rollback(expl), on_error=self.revert_failed)
+
+	def rollback(self, summary: str) -> None:
+		"""The rollback itself, run by the write queue."""
+		# the main loop reloads the config; it may have stopped the reverts meanwhile
+		if not self._cfg.active or not self._cfg.enabled_tools['revert']:
+			return
+		user = self._user.username
+		with get_metrics().write.time(action="rollback"):
+			rollback(self.article, user, summary)
+		self._cfg.reporter.report_successful_revert()
+		pywikibot.output(f"The edit(s) made in {self._title} by {user} was rollbacked.")
+		self._cfg.writes.submit("warn", lambda: self._user.warn_or_report(self._title))
+
+	def revert_failed(self, e: Exception) -> None:
+		pywikibot.output(f"Error rollbacking page {self._title}: {e}")
+		self._cfg.reporter.report_failed_revert()
+		self.tag_article("{{șr-g3-vandalism}}",
+						 f"vandalism (scor [[{self.decider.get_docs()}|{self.decider.get_name()}]]: {self.score})")
 
 	def patrol(self) -> None:
 		if not self._cfg.enabled_tools['patrol']:
-			pywikibot.output(f"Found patrol candidate: [[{self._title}]]@{self._revid} ({self._model.get_name()} score={self.score})")
+			pywikibot.output(f"Found patrol candidate: [[{self._title}]]@{self._revid} ({self.decider.get_name()} score={self.score})")
 			return
-		try:
-			list(self._site.patrol(revid=self._revid))
-		except Exception as e:
-			pywikibot.output(f"Error patrolling page {self._title}@{self._revid}: {e}")
-			self._cfg.reporter.report_failed_patrol()
-		else:
-			self._cfg.reporter.report_successful_patrol()
-			pywikibot.output(f"The edit(s) made in {self._title} by {self._user.username} was patrolled.")
+		self._cfg.patrols.add(self)
+
+	def patrol_succeeded(self) -> None:
+		self._cfg.reporter.report_successful_patrol()
+		pywikibot.output(f"The edit(s) made in {self._title} by {self._user.username} was patrolled.")
+
+	def patrol_failed(self, e: Exception) -> None:
+		pywikibot.output(f"Error patrolling page {self._title}@{self._revid}: {e}")
+		self._cfg.reporter.report_failed_patrol()
 
 	def work_on_blps(self) -> None:
 		if self._type != 'new':
@@ -130,27 +205,7 @@ class Change(object):
 			pywikibot.output(f"Found BLP candidate: [[{self._title}]]@{self._revid}")
 			return
 
-		thread = Thread(target=self.check_blps)
-		thread.start()
-
-	def check_blps(self) -> None:
-		#pywikibot.output(f"Working on blp in " + self._title)
-		pywikibot.sleep(5 * 60) # wait 5 minutes before adding BLP
-		#pywikibot.output(f"Working on blp {self._title} after sleep")
-		if not self._article.exists():
-			return
-		try:
-			item = self._article.data_item()
-		except NoPageError:
-			return
-		# humans
-		if (item is not None and item.get() and
-			    item_is_in_list(item.claims.get('P31'), ['Q5'])):
-			pywikibot.output(self._title + " is human...")
-			if 'P569' in item.claims and 'P570' not in item.claims:
-				#pywikibot.output(item.claims)
-				add_blp(self._article.toggleTalkPage())
-				self._cfg.reporter.report_successful_blp_add()
+		get_scheduler().schedule("blp", self.blp_delay_s, title=self._title, site=self._site.sitename)
 
 	def work_on_new_articles(self) -> None:
 		if self._type != 'new':
@@ -164,54 +219,54 @@ class Change(object):
 		# redirects are too short to analyze
 		if self._article.isRedirectPage():
 			return
-		langid = LangIdConfig()
-		text = self._article.text
-		wikicode = mwparserfromhell.parse(text)
-		to_check = wikicode.strip_code(keep_template_params=True)
-		if len(to_check) < 100: # code is too short for a reliable ID
-			return
-		# langdetect model, decent
-		detections = detect_langs(to_check)
-		if len(detections) > 0:
-			score, prediction = detections[0].prob, detections[0].lang
-		else:
-			# Wikimedia model, pretty rubbish
-			score, prediction = langid.get_result(wikicode.strip_code())
+		# parsing and detection run in the language identifier's process pool
+		get_language_identifier().identify(self._article.text, self.language_identified)
 
+	def language_identified(self, score: float, prediction: str) -> None:
 		if prediction != self._site.lang:
 			pywikibot.output(f"New article {self._title} is in language {prediction} (score {score})")
-			if score >= langid.threshold:
+			if score >= get_language_identifier().threshold:
 				self.tag_article(f"{{{{de tradus|{{{{nume limbă|{prediction}}}}}}}}}", "limbă greșită")
 
-	def treat(self) -> None:
-		if not self._cfg.active:
-			pywikibot.output(f"Dry run mode: skipping {self._title} @ {self._revid}")
-			return
-		# First, run the maintenance scripts
-		self.work_on_blps()
-
+	def decide(self) -> str:
+		"""Choose what to do with the change, without writing anything to the wiki."""
 		if self._patrolled is not None:
 			#pywikibot.output(f"Skipping patrolled change: {self._title} @ {self._revid}")
-			return
+			return self.SKIP
 		#pywikibot.output(self._title, self.revid, self.score, flush=True)
 		# failed to get score from the model
-		if self.score == 0:
-			self.work_on_new_articles() # one of the reason for score 0 could be new article
-			return
+		if not self.score:
+			return self.NEW_ARTICLE # one of the reason for score 0 could be new article
 		if self.score + self.score_penalty >= self._cfg.threshold:
-			self._cfg.load_config()
-			self._site.login()
+			return self.REVERT
+		if self.decider.likely_bad(self.score):
+			if self._cfg.tracker.tracked_change(self._title, self._user.username):
+				return self.REVERT
+			return self.NEAR_REVERT
+		elif self.decider.possibly_bad(self.score):
+			return self.NEAR_REVERT
+		elif self.decider.likely_constructive(self.score):
+			return self.PATROL
+		return self.NO_REVERT
+
+	def apply(self, action: str) -> None:
+		"""Carry out a decision taken by decide()."""
+		get_metrics().decisions.inc(action=action or "skip")
+		if action == self.REVERT:
 			self.revert()
-		else:
-			if self._model.likely_bad(self.score):
-				if self._cfg.tracker.tracked_change(self._title, self._user.username):
-					self.revert()
-				else:
-					self._cfg.reporter.report_near_revert()	
-			elif self._model.possibly_bad(self.score):
-				self._cfg.reporter.report_near_revert()
-			elif self._model.likely_constructive(self.score):
-				self.patrol()
-			else:
-				self._cfg.reporter.report_no_revert()
+		elif action == self.PATROL:
+			self.patrol()
+		elif action == self.NEAR_REVERT:
+			self._cfg.reporter.report_near_revert()
+		elif action == self.NO_REVERT:
+			self._cfg.reporter.report_no_revert()
+		elif action == self.NEW_ARTICLE:
+			self.work_on_new_articles()
+
+	def treat(self) -> None:
+		if not self._cfg.active:
+			pywikibot.output(f"Dry run mode: skipping {self._title} @ {self._revid}")
 			return
+		# First, run the maintenance scripts
+		self.work_on_blps()
+		self.apply(self.decide())
@@ -1,73 +1,82 @@
 #!/usr/bin/python3
 # -*- coding: utf-8  -*-
 
-from copy import copy
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from datetime import timezone
 
 class ChangeTracker:
+	"""Remember recently reverted (page, user) pairs and recently reported users.
+
+Entries are kept in insertion order, which is also time order, so expired
+ones are always at the front: expiring costs O(1) per removed entry and
+lookups never walk the whole structure.
+"""
 	timeout: int = 120
-	changelist = {}
-	user_report = {}
-	
+
 	def __init__(self, tz, timeout_s: int):
 		self.timeout = timeout_s
 		self.tz = tz
+		self.changelist = OrderedDict() # (page, user) -> time of the revert
+		self.user_report = OrderedDict() # user -> time of the report
+		self._lock = threading.Lock()
+
+	def __repr__(self) -> str:
+		return f"ChangeTracker({len(self.changelist)} changes, {len(self.user_report)} reports, timeout {self.timeout}s)"
+
+	@staticmethod
+	def _touch(entries: OrderedDict, key, now) -> None:
+		entries[key] = now
+		entries.move_to_end(key)
+
+	def _expire(self, entries: OrderedDict, now) -> None:
+		while entries:
+			key, when = next(iter(entries.items()))
+			if (now - when).total_seconds() <= self.timeout:
+				break
+			entries.popitem(last=False)
 
 	def should_report_user(self, user) -> bool:
 		"""Check if the user should be reported based on the time since last report."""
 		now = datetime.now(self.tz)
-		if user not in self.user_report:
-			ret = True
-		else:
-			tdelta = now - self.user_report[user]
-			if tdelta.total_seconds() > self.timeout:
-				ret = True
-			else:
-				ret = False
-		if ret:
-			self.user_report[user] = now
-		return ret
+		with self._lock:
+			self._expire(self.user_report, now)
+			if user in self.user_report:
+				return False
+			self._touch(self.user_report, user, now)
+			return True
 
 	def add_change(self, page, user):
 		now = datetime.now(self.tz)
-		if page not in self.changelist:
-			self.changelist[page] = {}
-		self.changelist[page][user] = now
+		with self._lock:
+			self._touch(self.changelist, (page, user), now)
+			self._expire(self.changelist, now)
 
 	def tracked_change(self, page, user):
 		now = datetime.now(self.tz)
-		self.cleanup_lists(now)
-		if page not in self.changelist:
-			return False
-		if user not in self.changelist[page]:
-			return False
-		tdelta = now - self.changelist[page][user]
-		if tdelta.total_seconds() <= self.timeout:
-			return True
-		else:
-			return False
+		with self._lock:
+			self._expire(self.changelist, now)
+			return (page, user) in self.changelist
 
 	def cleanup_lists(self, now):
-		for page in copy(self.changelist):
-			for user in copy(self.changelist[page]):
-				tdelta = now - self.changelist[page][user]
-				if tdelta.total_seconds() > self.timeout:
-					del self.changelist[page][user]
-					if len(self.changelist[page]) == 0:
-						del self.changelist[page]
-		for user in copy(self.user_report):
-			tdelta = now - self.user_report[user]
-			if tdelta.total_seconds() > self.timeout:
-				del self.user_report[user]
+		with self._lock:
+			self._expire(self.changelist, now)
+			self._expire(self.user_report, now)
 
 
 
-tracker = ChangeTracker(timezone.utc, 120)
+def new_tracker(tz=None, timeout_s=120) -> ChangeTracker:
+	"""A tracker for one wiki."""
+	return ChangeTracker(tz or timezone.utc, timeout_s)
 
-def get_tracker(timezone=None, timeout_s=120) -> ChangeTracker:
-	tracker.timeout = timeout_s
-	if timezone:
-		tracker.tz = timezone
-		tracker.cleanup_lists(datetime.now(tracker.tz))
-	return tracker
+# benchmark: the lookup cost should not depend on the number of tracked pairs
+if __name__ == "__main__":
+	import timeit
+	for size in (1000, 10000, 100000):
+		bench = ChangeTracker(timezone.utc, 3600)
+		for idx in range(size):
+			bench.add_change(f"Page {idx}", f"User {idx % 1000}")
+		lookups = 10000
+		elapsed = timeit.timeit(lambda: bench.tracked_change("Page 17", "User 17"), number=lookups)
+		print(f"{size:>7} tracked pairs: {elapsed * 1e6 / lookups:.2f}µs per lookup")
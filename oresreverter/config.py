@@ -3,24 +3,89 @@
 
 import datetime
 import json
+import os
+import time
 import oresreverter.models as models
+from .models.langid import get_language_identifier
+from .polling import AdaptivePoller
+from .metrics import get_metrics
 import pywikibot
-from .report import get_reporter
-from .changetrack import get_tracker
+from .report import new_reporter
+from .changetrack import new_tracker
+from .cursor import RCCursor
+from .scheduler import get_scheduler
+from .scorecache import get_score_cache
+from .textanalysis import get_text_analyser
+from .transport import get_transport
+from .userwarn import get_warning_cache
+from .writequeue import PatrolCollector, WriteQueue
 
 
 NAME_SEP = "."
+# the sections configuring the singletons shared by all the wikis of the process
+SHARED_SECTIONS = ("http", "delayed_jobs", "score_cache", "text_analysis", "metrics")
+# the shared sections applied by the first wiki
+_shared_sections = {}
 
 class BotConfig:
-	def __init__(self, site, page, model_name, dry_run=False):
+	"""The configuration of the bot on one wiki, read from its config page.
+
+Each wiki has its own reporter, tracker, RC cursor, poller and write
+queue; the models' transport, score cache and scoring pool are shared by
+all the wikis. In a worker process (`shard` is its index, out of `shards`), the reporter,
+tracker and warning cache come from the SharedStore `store` instead, and
+the write rate and burst are split between the workers.
+
+The sections of the shared components (SHARED_SECTIONS: transport, delayed
+jobs, score cache, text analysis, metrics) are only applied by the config
+of the first wiki (`shared`); the other wikis ignore theirs, with a
+warning when they differ.
+"""
+
+	def __init__(self, site, page, model_name, dry_run=False, store=None, shard=None, shards=1, shared=True):
 		self.site = site
+		self.shard = shard
+		self.shards = shards
+		self.shared = shared
 		self.page = page
 		self.active = not dry_run
 		self.model_name = model_name
+		self.model = None
+		self.scoring_concurrency = 4
+		self._model_override = model_name
+		self._model_section = None
+		self._config_page = None
+		self.config_revid = None
+		self.penalty_labels = frozenset()
+		self.reload_checks = 0
+		self.reloads = 0
+		self.reload_s = 0.0
 
 		tzoffset = datetime.timedelta(minutes=site.siteinfo['timeoffset'])
-		self.reporter = get_reporter(timezone=datetime.timezone(tzoffset), dry_run=dry_run)
-		self.tracker = get_tracker(timezone=datetime.timezone(tzoffset))
+		if store is not None:
+			self.reporter = store.reporter(site, datetime.timezone(tzoffset), dry_run=dry_run)
+			self.tracker = store.tracker(site, datetime.timezone(tzoffset))
+			self.warnings = store.warnings()
+		else:
+			self.reporter = new_reporter(site, datetime.timezone(tzoffset), dry_run=dry_run)
+			self.tracker = new_tracker(datetime.timezone(tzoffset))
+			self.warnings = get_warning_cache()
+		self.cursor = RCCursor()
+		self.poller = AdaptivePoller()
+		self.writes = WriteQueue(site)
+		# the workers share the wiki's write rate
+		self.writes.configure(self.shard_section({"rate": self.writes.bucket.rate,
+												  "burst": self.writes.bucket.burst}))
+		self.patrols = PatrolCollector(site, self.writes)
+		self.reporter.register_stats("Scoruri din cache", get_score_cache().summary)
+		self.reporter.register_stats("Modele", lambda: self.model.get_stats())
+		self.reporter.register_stats("Sarcini amânate", get_scheduler().summary)
+		self.reporter.register_stats("Reîncărcări configurație", self.reload_summary)
+		self.reporter.register_stats("Schimbări recente", self.cursor.summary)
+		self.reporter.register_stats("Interogări", self.poller.summary)
+		self.reporter.register_stats("Scrieri", self.writes.summary)
+		self.reporter.register_stats("Patrulări", self.patrols.summary)
+		self.reporter.register_stats("Identificare limbă", lambda: get_language_identifier().summary())
 
 		self.load_config()
 
@@ -28,35 +93,125 @@ class BotConfig:
 	def __repr__(self) -> str:
 		return str(self.__dict__)
 
-	def load_config(self):
-		page = pywikibot.Page(self.site, self.page)
-		if not page.exists():
+	def config_revision(self) -> int:
+		"""The latest revision id of the config page; a single prop=info query."""
+		self._config_page = pywikibot.Page(self.site, self.page)
+		if not self._config_page.exists():
 			raise Exception(f"Config page {self.page} does not exist.")
+		return self._config_page.latest_revision_id
+
+	def load_config(self, force: bool = False):
+		"""Reload the config page, unless it did not change since the last load."""
+		start = time.monotonic()
+		self.reload_checks += 1
+		revid = self.config_revision()
+		if revid == self.config_revid and not force:
+			get_metrics().config_reload.observe(time.monotonic() - start, result="unchanged")
+			return
+
+		data = json.loads(self._config_page.get())
+		self.apply_config(data)
+		self.config_revid = revid
+		self.reloads += 1
+		self.reload_s += time.monotonic() - start
+		get_metrics().config_reload.observe(time.monotonic() - start, result="reloaded")
+
+	def model_section(self, data: dict, model_name: str):
+		if model_name in data:
+			return data.get(model_name)
+		elif model_name.find(NAME_SEP) > -1:
+			return data.get(model_name.split(NAME_SEP)[0])
+		return None
 
-		data = json.loads(page.get())
+	def apply_config(self, data: dict):
 		#override config with local parameters
-		if self.model_name is not None:
-			data["model_name"] = self.model_name
+		if self._model_override is not None:
+			data["model_name"] = self._model_override
 		# Dry-run mode
 		if not self.active:
 			data["active"] = False
+		data = self.shared_config(data)
 		self.__dict__.update(data)
 
 		if "report_interval" in data:
 			self.reporter.interval = int(self.report_interval) # type: ignore
+		if "http" in data:
+			get_transport().configure(data["http"])
+		if "polling" in data:
+			self.poller.configure(data["polling"])
+		if "write_queue" in data:
+			self.writes.configure(self.shard_section(data["write_queue"]))
+			self.patrols.configure(data["write_queue"])
+		if "rc_cursor" in data:
+			self.cursor.configure(data["rc_cursor"])
+		if "delayed_jobs" in data:
+			get_scheduler().configure(self.shard_section(data["delayed_jobs"]))
+		if "score_cache" in data:
+			get_score_cache().configure(data["score_cache"])
+		if "text_analysis" in data:
+			get_text_analyser().configure(data["text_analysis"])
+		if "metrics" in data:
+			get_metrics().configure(self.shard_section(data["metrics"]))
+		if "warning_cache_ttl" in data:
+			self.warnings.ttl_s = int(self.warning_cache_ttl) # type: ignore
 		if "article_follow_interval" in data:
 			self.tracker.timeout = int(self.article_follow_interval) # type: ignore
-		if "model_name" in data:
-			self.model = models.get_model(data["model_name"])
-		if self.model is None:
-			self.model = models.get_model()
+		self.penalty_labels = frozenset(data.get("labels_penalty", {}))
+
+		# keep the model instance (and its state) unless another model was chosen
+		model_name = data.get("model_name")
+		if self.model is None or (model_name is not None and model_name != self.model.get_name()):
+			model = models.get_model(model_name) if model_name is not None else None
+			if model is None:
+				model = models.get_model()
+			self.model = model
+			self._model_section = None
 		self.model_name = self.model.get_name()
-		if self.model_name in data:
-			self.model.set_config(data.get(self.model_name))
-		elif self.model_name.find(NAME_SEP) > -1:
-			self.model.set_config(data.get(self.model_name.split(NAME_SEP)[0]))
-
-		
-		# don't go below the model's threshold
-		if not self.model.likely_bad(float(data["threshold"])):
-			raise Exception(f"Threshold {data['threshold']} is too low.")
+		section = self.model_section(data, self.model_name)
+		if getattr(self.model, "composite", False):
+			# the members fall back to their own sections of the page
+			self.model.sections = data
+			section_key = json.dumps(data, sort_keys=True, default=str)
+		else:
+			section_key = json.dumps(section, sort_keys=True)
+		if section_key != self._model_section:
+			self.model.set_config(section)
+			self._model_section = section_key
+
+		# don't go below the model's threshold; any member of a composite model may decide
+		for model in getattr(self.model, "members", [self.model]):
+			if not model.likely_bad(float(data["threshold"])):
+				raise Exception(f"Threshold {data['threshold']} is too low for {model.get_name()}.")
+
+	def shared_config(self, data: dict) -> dict:
+		"""Leave out the shared sections, unless this is the first wiki."""
+		if self.shared:
+			for key in SHARED_SECTIONS:
+				if key in data:
+					_shared_sections[key] = data[key]
+			return data
+		for key in SHARED_SECTIONS:
+			if key in data and data[key] != _shared_sections.get(key):
+				pywikibot.warning(f"{self.page} on {self.site}: the {key} section is shared by all the wikis, "
+								  f"only the one of the first wiki applies")
+		return {key: value for key, value in data.items() if key not in SHARED_SECTIONS}
+
+	def shard_section(self, section: dict) -> dict:
+		"""Give a worker process its own files and metrics port, and its share of the write rate."""
+		if self.shard is None:
+			return section
+		section = dict(section)
+		if "rate" in section:
+			section["rate"] = float(section["rate"]) / self.shards
+		if "burst" in section:
+			section["burst"] = max(1, int(section["burst"]) // self.shards)
+		for key in ("path", "textfile"):
+			if section.get(key):
+				root, ext = os.path.splitext(section[key])
+				section[key] = f"{root}.{self.shard}{ext}"
+		if section.get("port"):
+			section["port"] = int(section["port"]) + 1 + self.shard
+		return section
+
+	def reload_summary(self) -> str:
+		return f"{self.reloads} din {self.reload_checks} verificări, {self.reload_s:.2f}s"
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pywikibot
+from .recentchanges import recentchanges
+
+
+class RCCursor:
+	"""How far the bot got in the recent changes, kept on disk between runs.
+
+The cursor is the timestamp and rcid of the newest change treated so far,
+plus the rcids of the latest changes. The next poll asks for the changes
+made since that timestamp, *including* its second, and the remembered
+rcids drop the ones already treated, so edits saved in the same second
+are neither lost nor scored twice. When `path` is set, the cursor is
+written there after every batch and loaded again on the next start.
+
+Changes that were fetched but not treated yet can be held (see
+AsyncEngine), so a poll made meanwhile does not queue them again. The
+cursor never moves past the oldest held change, so after a restart the
+changes that were queued but not treated are listed again.
+"""
+
+	def __init__(self, path: str = None, remembered: int = 5000, catchup_limit: int = 5000):
+		self.path = None
+		self.remembered = remembered
+		self.catchup_limit = catchup_limit
+		self.timestamp = None
+		self._newest = None # of the treated changes; timestamp may be older
+		self.rcid = 0
+		self.duplicates = 0
+		self._seen = OrderedDict()
+		self._pending = {} # rcid -> timestamp of the held changes
+		self._lock = threading.Lock()
+		if path:
+			self.load(path)
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `rc_cursor` section of the config page."""
+		if "remembered" in config:
+			self.remembered = int(config["remembered"])
+		if "catchup_limit" in config:
+			self.catchup_limit = int(config["catchup_limit"])
+		if config.get("path") and config["path"] != self.path:
+			self.load(config["path"])
+
+	@property
+	def end(self) -> pywikibot.Timestamp:
+		"""The `end` of the next newest-first recentchanges() query."""
+		if self.timestamp is None:
+			return None
+		return pywikibot.Timestamp.fromISOformat(self.timestamp)
+
+	def load(self, path: str) -> None:
+		with self._lock:
+			self.path = path
+			if not os.path.exists(path):
+				return
+			try:
+				with open(path, encoding="utf-8") as f:
+					data = json.load(f)
+			except (OSError, ValueError) as e:
+				pywikibot.error(f"Could not load the recent changes cursor from {path}: {e}")
+				return
+			self.timestamp = self._newest = data.get("timestamp")
+			self.rcid = int(data.get("rcid", 0))
+			self._seen = OrderedDict((rcid, True) for rcid in data.get("seen", []))
+		pywikibot.output(f"Resuming the recent changes from {self.timestamp} (rcid {self.rcid})")
+
+	def _save(self) -> None:
+		if not self.path:
+			return
+		data = {"timestamp": self.timestamp, "rcid": self.rcid, "seen": list(self._seen)}
+		tmp = self.path + ".tmp"
+		try:
+			with open(tmp, "w", encoding="utf-8") as f:
+				json.dump(data, f)
+			os.replace(tmp, self.path)
+		except OSError as e:
+			pywikibot.error(f"Could not save the recent changes cursor to {self.path}: {e}")
+
+	def filter(self, infos: list) -> list:
+		"""Drop the changes that were already treated or are held."""
+		with self._lock:
+			fresh = [info for info in infos
+					 if info.get("rcid") not in self._seen and info.get("rcid") not in self._pending]
+		self.duplicates += len(infos) - len(fresh)
+		return fresh
+
+	def hold(self, infos: list) -> None:
+		"""Mark changes as queued; filter() drops them until they are advanced."""
+		with self._lock:
+			self._pending.update((info["rcid"], info["timestamp"]) for info in infos if info.get("rcid") is not None)
+
+	def advance(self, infos: list) -> None:
+		"""Record treated changes and save the cursor."""
+		if not infos:
+			return
+		with self._lock:
+			for info in infos:
+				if info.get("rcid") is not None:
+					self._pending.pop(info["rcid"], None)
+					self._seen[info["rcid"]] = True
+					self._seen.move_to_end(info["rcid"])
+					self.rcid = max(self.rcid, info["rcid"])
+				if self._newest is None or info["timestamp"] > self._newest:
+					self._newest = info["timestamp"]
+			# an older change is still being treated, resume from there
+			self.timestamp = min([self._newest, *self._pending.values()])
+			while len(self._seen) > self.remembered:
+				self._seen.popitem(last=False)
+			self._save()
+
+	def backlog(self, site, cfg, until: pywikibot.Timestamp = None):
+		"""Yield the changes made since the cursor, oldest first, in batches of `rc_limit`.
+
+Only changes that are still the top revision of their page are listed
+(rctoponly), so edits already replaced by a newer one are skipped; at most
+`catchup_limit` changes are listed.
+"""
+		if self.timestamp is None:
+			return
+		batch = []
+		for info in recentchanges(site,
+								  start=self.end,
+								  end=until,
+								  namespaces=cfg.namespaces,
+								  total=self.catchup_limit,
+								  top_only=True,
+								  patrolled=None,
+								  reverse=True):
+			batch.append(info)
+			if len(batch) >= int(cfg.rc_limit):
+				yield self.filter(batch)
+				batch = []
+		if batch:
+			yield self.filter(batch)
+
+	def catch_up(self, site, cfg, pipeline, until: pywikibot.Timestamp = None) -> int:
+		"""Treat the changes made since the cursor with the pipeline; returns how many."""
+		count = 0
+		for infos in self.backlog(site, cfg, until):
+			stats = pipeline.run(infos)
+			self.advance(infos)
+			count += len(infos)
+			pywikibot.output(f"Catch-up batch stats: {stats}")
+		if count:
+			pywikibot.output(f"Caught up {count} changes, the cursor is now at {self.timestamp}")
+		return count
+
+	def summary(self) -> str:
+		return f"cursor {self.timestamp} (rcid {self.rcid}), {self.duplicates} duplicate ignorate"
+
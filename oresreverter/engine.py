@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+# type: ignore
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pywikibot
+from .change import Change
+from .config import BotConfig
+from .metrics import get_metrics
+from .pipeline import ScoringPipeline
+from .recentchanges import recentchanges
+from .scheduler import get_scheduler
+from .transport import get_transport
+
+
+class AsyncEngine:
+	"""Event-driven alternative to the polling loop in main.single_run.
+
+Ingestion polls recentchanges() or, when given an EventStream, reads
+the server-sent events stream.
+
+Concurrency model: one asyncio event loop owns four stages connected by
+bounded queues:
+
+  ingest --batches--> score --changes--> decide --actions--> write
+                                            \\--> delayed jobs (BLP checks)
+
+The delayed jobs go to the shared DelayedJobScheduler, which runs them on
+its own small pool of worker threads.
+
+Only the event loop thread touches the queues. Every blocking call
+(pywikibot, model HTTP requests) runs in a dedicated thread pool of
+`engine_threads` threads, so the stages overlap: while a rollback is being
+saved, the next batch is already being scored. The write stage hands the
+actions to the wiki's WriteQueue, which saves them most urgent first
+(rollbacks before warnings before patrols). The decisions are the same as
+in the polling loop, since each stage calls Change.decide()/Change.apply().
+
+Backpressure: when writes fall behind, the WriteQueue fills up and blocks
+the write stage, the action queue fills up, the decision stage blocks,
+then scoring, then ingestion stops polling. The queue sizes
+(`engine_queue_size`, `write_queue.max_depth`) therefore bound the work
+in flight.
+
+The RC cursor advances past a change once its action was handed to the
+WriteQueue (or nothing had to be done), never past the oldest change
+still in the stages; on start the changes made since the saved cursor
+are queued first.
+"""
+
+	def __init__(self, site, cfg: BotConfig, maintenance=None, on_error=None, stream=None, executor=None):
+		self._site = site
+		self._stream = stream
+		self._cfg = cfg
+		self._maintenance = maintenance
+		self._on_error = on_error
+		self._pipeline = ScoringPipeline(site, cfg)
+		# several engines (one per wiki) may share the executor
+		self._executor = executor or ThreadPoolExecutor(max_workers=int(getattr(cfg, "engine_threads", 8)),
+														thread_name_prefix="engine")
+		size = int(getattr(cfg, "engine_queue_size", 500))
+		self._batches = asyncio.Queue(maxsize=max(1, size // max(1, int(cfg.rc_limit))))
+		self._changes = asyncio.Queue(maxsize=size)
+		self._actions = asyncio.Queue(maxsize=size)
+		self._cursor = cfg.cursor
+		self._poller = cfg.poller
+		self._fetched = 0
+
+	async def blocking(self, func, *args):
+		"""Run a blocking call in the engine's thread pool."""
+		return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+	def error(self, stage: str, e: Exception) -> None:
+		pywikibot.output(f"Error in the {stage} stage: {e}")
+		if self._on_error is None:
+			raise e
+		self._on_error(e)
+
+	def fetch(self) -> list:
+		"""Poll the recent changes; returns the batches to queue, oldest first.
+
+The changes are held by the cursor until their actions are queued, so the
+next poll does not queue them again. When the batch is full, the
+changes between the cursor and its oldest row are fetched too.
+"""
+		changes = recentchanges(self._site,
+								end=self._cursor.end,
+								namespaces=self._cfg.namespaces,
+								total=self._cfg.rc_limit,
+								top_only=True,
+								patrolled=None,
+								reverse=False)
+		with get_metrics().rc_fetch.time():
+			rows = list(changes)
+		get_metrics().rc_changes.inc(len(rows))
+		self._fetched = len(rows)
+		batches = []
+		if len(rows) >= self._cfg.rc_limit and self._cursor.end is not None:
+			# the batch may not reach back to the cursor, fill the gap first
+			until = pywikibot.Timestamp.fromISOformat(rows[-1]['timestamp'])
+			for infos in self._cursor.backlog(self._site, self._cfg, until):
+				self._cursor.hold(infos)
+				batches.append(infos)
+		infos = self._cursor.filter(rows)
+		self._cursor.hold(infos)
+		batches.append(infos)
+		return batches
+
+	async def catch_up(self) -> None:
+		"""Queue the changes made since the saved cursor, oldest first."""
+		backlog = self._cursor.backlog(self._site, self._cfg)
+		while True:
+			try:
+				infos = await self.blocking(next, backlog, None)
+			except Exception as e:
+				self.error("ingest", e)
+				return
+			if infos is None:
+				return
+			if infos:
+				self._cursor.hold(infos)
+				await self._batches.put([Change(self._site, info, self._cfg) for info in infos])
+
+	async def ingest(self) -> None:
+		await self.catch_up()
+		while True:
+			count = 0
+			self._fetched = 0
+			try:
+				await self.blocking(self._cfg.load_config)
+				if self._maintenance is not None:
+					await self.blocking(self._maintenance)
+				batches = await self.blocking(self.fetch)
+				count = sum(len(infos) for infos in batches)
+				self._poller.observe(batches[-1])
+				for infos in batches:
+					if infos:
+						await self._batches.put([Change(self._site, info, self._cfg) for info in infos])
+			except Exception as e:
+				self.error("ingest", e)
+			interval = self._poller.next_interval(self._fetched, int(self._cfg.rc_limit),
+												  self._cfg.rc_interval_min, self._cfg.rc_interval_max)
+			pywikibot.output(f"Queued {count} changes (queues: {self._batches.qsize()} batches, "
+							 f"{self._changes.qsize()} changes, {self._actions.qsize()} actions, "
+							 f"{get_scheduler().depth} delayed jobs). Polling again in {interval:.1f}s.")
+			await asyncio.sleep(interval)
+
+	async def ingest_stream(self) -> None:
+		"""Ingestion from an EventStream instead of polling."""
+		batches = None
+		failures = 0
+		while True:
+			try:
+				await self.blocking(self._cfg.load_config)
+				if self._maintenance is not None:
+					await self.blocking(self._maintenance)
+				if batches is None:
+					# starts with a catch-up from the last batch
+					batches = self._stream.batches()
+				infos = await self.blocking(next, batches)
+				failures = 0
+				await self._batches.put([Change(self._site, info, self._cfg) for info in infos])
+			except Exception as e:
+				# a generator that raised is finished, make a new one
+				batches = None
+				failures += 1
+				self.error("ingest", e)
+				await asyncio.sleep(get_transport().backoff(min(failures, 5)))
+
+	async def score(self) -> None:
+		while True:
+			changes = await self._batches.get()
+			start = time.monotonic()
+			try:
+				await self.blocking(self._pipeline.score, changes)
+			except Exception as e:
+				# the changes will be scored one by one in the decision stage
+				self.error("score", e)
+			pywikibot.output(f"Scored {len(changes)} changes in {time.monotonic() - start:.2f}s")
+			for change in changes:
+				await self._changes.put(change)
+
+	async def decide(self) -> None:
+		while True:
+			change = await self._changes.get()
+			if not self._cfg.active:
+				pywikibot.output(f"Dry run mode: skipping {change.article.title()} @ {change.revid}")
+				self._cursor.advance([change.info])
+				continue
+			try:
+				change.work_on_blps()
+				# decide() may still need a score request
+				action = await self.blocking(change.decide)
+				get_metrics().observe_lag(change.lag)
+			except Exception as e:
+				self._cursor.advance([change.info])
+				self.error("decide", e)
+				continue
+			if action is Change.SKIP:
+				self._cursor.advance([change.info])
+			else:
+				await self._actions.put((change, action))
+
+	async def write(self) -> None:
+		while True:
+			change, action = await self._actions.get()
+			try:
+				await self.blocking(change.apply, action)
+			except Exception as e:
+				self.error("write", e)
+			finally:
+				# the write queue has the rollback now
+				self._cursor.advance([change.info])
+
+	async def run(self) -> None:
+		ingest = self.ingest() if self._stream is None else self.ingest_stream()
+		stages = [ingest, self.score(), self.decide(), self.write()]
+		await asyncio.gather(*stages)
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+# type: ignore
+
+import json
+import time
+from collections import OrderedDict
+
+import pywikibot
+import requests
+from .metrics import get_metrics
+from .recentchanges import recentchanges
+from .transport import get_transport
+
+
+def parse_sse(lines):
+	"""Turn the lines of a server-sent events stream into (id, event, data) tuples."""
+	event_id, event, data = None, "message", []
+	for line in lines:
+		if line is None:
+			continue
+		if line == "":
+			if data:
+				yield event_id, event, "\n".join(data)
+			event, data = "message", []
+			continue
+		if line.startswith(":"):
+			continue # comment/heartbeat
+		field, _, value = line.partition(":")
+		if value.startswith(" "):
+			value = value[1:]
+		if field == "data":
+			data.append(value)
+		elif field == "event":
+			event = value
+		elif field == "id":
+			event_id = value
+
+
+class EventStream:
+	"""Ingest recent changes from the Wikimedia EventStreams `recentchange` stream.
+
+The stream is filtered to our wiki, namespaces and edit/new changes and
+grouped in batches shaped like the list=recentchanges rows, so they can be
+fed to the same Change pipeline. After a disconnect the stream is resumed
+with Last-Event-ID; when the gap is longer than `catchup_after_s` (or on
+the first connection after a restart) the recentchanges() poller fills it.
+"""
+	url = "https://stream.wikimedia.org/v2/stream/recentchange"
+	read_timeout = 60
+	remembered = 5000 # revisions remembered to drop duplicates between stream and poller
+
+	def __init__(self, site, cfg, batch_size: int = 50, batch_wait_s: float = 2,
+				 catchup_after_s: float = 30):
+		self._site = site
+		self._cfg = cfg
+		self.batch_size = batch_size
+		self.batch_wait_s = batch_wait_s
+		self.catchup_after_s = catchup_after_s
+		self.last_event_id = None
+		self.last_timestamp = None
+		self.last_event_time = None
+		self.reconnects = 0
+		self._seen = OrderedDict()
+
+	@property
+	def stream_url(self) -> str:
+		return getattr(self._cfg, "eventstream_url", None) or self.url
+
+	def matches(self, event: dict) -> bool:
+		return (event.get("wiki") == self._site.dbName() and
+				event.get("type") in ("edit", "new") and
+				event.get("namespace") in [int(ns) for ns in self._cfg.namespaces])
+
+	@staticmethod
+	def to_rc(event: dict) -> dict:
+		"""Convert a stream event to the format of a list=recentchanges row."""
+		info = {
+			"type": event["type"],
+			"ns": event["namespace"],
+			"title": event["title"],
+			"revid": event["revision"]["new"],
+			"rcid": event.get("id"),
+			"old_revid": (event["revision"].get("old") or 0),
+			"user": event["user"],
+			"timestamp": pywikibot.Timestamp.utcfromtimestamp(event["timestamp"]).isoformat(),
+			"tags": [],
+		}
+		if event.get("patrolled"):
+			info["patrolled"] = ""
+		return info
+
+	def seen(self, revid: int) -> bool:
+		if revid in self._seen:
+			return True
+		self._seen[revid] = True
+		if len(self._seen) > self.remembered:
+			self._seen.popitem(last=False)
+		return False
+
+	def enrich(self, infos: list) -> list:
+		"""Add the change tags, which the stream does not carry."""
+		revids = "|".join(str(info["revid"]) for info in infos)
+		try:
+			data = self._site.simple_request(action="query", prop="revisions",
+											 revids=revids, rvprop="ids|tags").submit()
+			pages = data["query"]["pages"]
+			if isinstance(pages, dict):
+				pages = pages.values()
+			tags = {rev["revid"]: rev.get("tags", []) for page in pages for rev in page.get("revisions", [])}
+		except Exception as e:
+			pywikibot.warning(f"Could not load the tags of {len(infos)} revisions: {e}")
+			return infos
+		for info in infos:
+			info["tags"] = tags.get(info["revid"], [])
+		return infos
+
+	def top_only(self, infos: list) -> list:
+		"""Keep only the latest change per page, like rctoponly does."""
+		latest = {}
+		for info in infos:
+			latest[info["title"]] = info
+		return [info for info in infos if latest[info["title"]] is info]
+
+	def catch_up(self) -> list:
+		"""Poll the changes made while we were not connected."""
+		with get_metrics().rc_fetch.time():
+			rows = list(recentchanges(self._site,
+									  end=self.last_timestamp,
+									  namespaces=self._cfg.namespaces,
+									  total=self._cfg.rc_limit,
+									  top_only=True,
+									  patrolled=None,
+									  reverse=False))
+		get_metrics().rc_changes.inc(len(rows))
+		infos = [info for info in rows if not self.seen(info["revid"])]
+		pywikibot.output(f"Caught up {len(infos)} changes since {self.last_timestamp}")
+		return infos
+
+	def events(self):
+		"""Yield the matching events, reconnecting forever."""
+		while True:
+			headers = {"Accept": "text/event-stream"}
+			if self.last_event_id:
+				headers["Last-Event-ID"] = self.last_event_id
+			transport = get_transport()
+			try:
+				r = transport.get(self.stream_url, headers=headers, stream=True,
+								  timeout=(transport.connect_timeout, self.read_timeout))
+				if r.status_code != 200:
+					raise ValueError(f"code {r.status_code}")
+				with r:
+					for event_id, event, data in parse_sse(r.iter_lines(decode_unicode=True)):
+						if event_id:
+							self.last_event_id = event_id
+						if event != "message":
+							continue
+						yield json.loads(data)
+			except (requests.RequestException, ValueError) as e:
+				pywikibot.warning(f"Event stream {self.stream_url} interrupted: {e}")
+			self.reconnects += 1
+			time.sleep(transport.backoff(min(self.reconnects, 5)))
+
+	def needs_catch_up(self) -> bool:
+		if self.last_event_time is None:
+			return self.last_timestamp is not None
+		return time.monotonic() - self.last_event_time > self.catchup_after_s
+
+	def batches(self):
+		"""Yield lists of RC-like rows, in batches of at most `batch_size`."""
+		batch = []
+		batch_start = None
+		if self.needs_catch_up():
+			yield self.catch_up()
+		for event in self.events():
+			now = time.monotonic()
+			if self.last_event_time is not None and now - self.last_event_time > self.catchup_after_s:
+				# we were disconnected (or the stream stalled) for a while
+				caught_up = self.catch_up()
+				if caught_up:
+					yield caught_up
+			self.last_event_time = now
+			if self.matches(event) and not self.seen(event["revision"]["new"]):
+				batch.append(self.to_rc(event))
+				if batch_start is None:
+					batch_start = now
+			if batch and (len(batch) >= self.batch_size or now - batch_start >= self.batch_wait_s):
+				infos = self.enrich(self.top_only(batch))
+				self.last_timestamp = pywikibot.Timestamp.fromISOformat(batch[-1]["timestamp"])
+				batch = []
+				batch_start = None
+				yield infos
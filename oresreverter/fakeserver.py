@@ -0,0 +1,819 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+"""A local stand-in for ro.wikipedia.org, ORES, LiftWing and EventStreams, for load testing.
+
+    python3 -m oresreverter.fakeserver [--port 8765] [--rate 20] [--vandal-ratio 0.05]
+                                       [--read-latency S] [--write-latency S] [--model-latency S]
+                                       [--error-rate P] [--maxlag-rate P]
+                                       [--preload MediaWiki:Revertbot.json=revertbot.json]
+
+A background generator makes edits at `--rate` edits/second (Poisson
+arrivals); a share of them are vandalism, which the fake models score high.
+The server implements the subset of the APIs the bot uses:
+
+* /w/api.php: query (siteinfo, userinfo, tokens, recentchanges, revisions,
+  info), parse (sections), edit, rollback, patrol, login, wbgetentities and
+  a minimal paraminfo for pywikibot
+* /v3/scores/<dbname>/ and /v3/scores/<dbname>/<revid>/<model> (ORES v3)
+* /service/lw/inference/v1/models/<model>:predict (LiftWing revert risk and langid)
+* /v2/stream/recentchange (EventStreams, with Last-Event-ID)
+* /stats: request counters, as JSON
+
+Every request waits for the latency of its kind and fails with the given
+probabilities. Run the bot against it with
+`main.py -api:http://localhost:8765/w/api.php -user:PatrocleBot -pt:0`;
+the config page must exist, so preload it, and keep the cron jobs disabled,
+they talk to Wikidata directly. -pt:0 leaves the write rate to the write queue.
+"""
+
+import argparse
+import json
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# the hosts the bot talks to; they are all served by the fake server
+PRODUCTION_PREFIXES = (
+	"https://ro.wikipedia.org",
+	"https://ores.wikimedia.org",
+	"https://api.wikimedia.org",
+	"https://stream.wikimedia.org",
+)
+
+NAMESPACES = {
+	0: "", 1: "Discuție", 2: "Utilizator", 3: "Discuție Utilizator", 4: "Wikipedia",
+	5: "Discuție Wikipedia", 6: "Fișier", 7: "Discuție Fișier", 8: "MediaWiki",
+	9: "Discuție MediaWiki", 10: "Format", 11: "Discuție Format", 14: "Categorie",
+	15: "Discuție Categorie",
+}
+
+WRITE_ACTIONS = {"edit", "rollback", "patrol", "login", "clientlogin"}
+HEADING = re.compile(r"^(={1,6})\s*(.+?)\s*\1\s*$", re.M)
+
+SENTENCES = {
+	"ro": ["Orașul se află pe malul drept al râului.", "Clădirea a fost construită în secolul al XIX-lea.",
+		   "Populația comunei a crescut după război.", "Echipa a câștigat campionatul național de două ori.",
+		   "Lucrarea a fost publicată pentru prima dată la București."],
+	"en": ["The town lies on the right bank of the river.", "The building was completed in the nineteenth century.",
+		   "The team won the national championship twice.", "The book was first published in London."],
+}
+VANDALISM = ["ESTI PROST", "haha lol", "aaaaaaaaaaaaaaa", "nu citiți asta", "profa e cea mai rea"]
+
+
+def endpoints(root: str) -> dict:
+	"""The transport `endpoints` that send all the production traffic to the fake server at `root`."""
+	return {prefix: root.rstrip("/") for prefix in PRODUCTION_PREFIXES}
+
+
+def use_fake_family(api_url: str) -> None:
+	"""Make the fake server at `api_url` the default pywikibot site and send all the model traffic there.
+
+No site is created, so it can run before pywikibot.handle_args().
+"""
+	# the server itself runs without the bot's dependencies
+	import pywikibot
+	from .transport import get_transport
+	username = pywikibot.config.usernames['wikipedia'].get('ro') or pywikibot.config.usernames['wikipedia'].get('*')
+	pywikibot.config.family_files['fakewiki'] = api_url
+	pywikibot.config.usernames['fakewiki']['fakewiki'] = username
+	pywikibot.config.family = pywikibot.config.mylang = 'fakewiki'
+	get_transport().configure({"endpoints": endpoints(api_url.split('/w/api.php')[0])})
+
+
+def fake_site(api_url: str):
+	"""use_fake_family() and return the fake site."""
+	import pywikibot
+	use_fake_family(api_url)
+	return pywikibot.Site('fakewiki', 'fakewiki')
+
+
+def iso(t: float) -> str:
+	return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_timestamp(value: str) -> float:
+	if value.isdigit():
+		return datetime.strptime(value, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc).timestamp()
+	return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def split_values(value) -> list:
+	return [v for v in (value or "").split("|") if v]
+
+
+def namespace_of(title: str) -> int:
+	prefix, sep, _ = title.partition(":")
+	if sep:
+		for ns, name in NAMESPACES.items():
+			if ns and name == prefix:
+				return ns
+	return 0
+
+
+def normalize(title: str) -> str:
+	title = title.replace("_", " ").strip()
+	prefix, sep, rest = title.partition(":")
+	if sep and namespace_of(title):
+		return f"{prefix}:{rest[:1].upper()}{rest[1:]}"
+	return title[:1].upper() + title[1:]
+
+
+def split_sections(text: str) -> list:
+	bounds = [0] + [m.start() for m in HEADING.finditer(text)] + [len(text)]
+	if bounds[1] == 0:
+		bounds = bounds[1:]
+		return [""] + [text[a:b] for a, b in zip(bounds, bounds[1:])]
+	return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+class ApiError(Exception):
+	def __init__(self, code: str, info: str):
+		super(ApiError, self).__init__(info)
+		self.code = code
+		self.info = info
+
+
+class FakeWiki:
+	"""Pages, revisions and recent changes of the fake wiki, with an edit generator."""
+	rc_max = 100000 # recent changes kept
+
+	def __init__(self, lang: str = "ro", bot_name: str = "PatrocleBot", seed: int = 0,
+				 vandal_ratio: float = 0.05, new_ratio: float = 0.05, person_ratio: float = 0.2,
+				 foreign_ratio: float = 0.1, titles: int = 5000, users: int = 500):
+		self.lang = lang
+		self.dbname = lang + "wiki"
+		self.bot_name = bot_name
+		self.vandal_ratio = vandal_ratio
+		self.new_ratio = new_ratio
+		self.person_ratio = person_ratio
+		self.foreign_ratio = foreign_ratio
+		self.users = users
+		self.random = random.Random(seed)
+		self.lock = threading.RLock()
+		self.pages = {} # title -> {"pageid", "ns", "title", "revisions": [revid], "person"}
+		self.articles = [] # titles of the pages in the main namespace, in creation order
+		self.revisions = {} # revid -> revision
+		self.rc = [] # rows, in rcid order
+		self.rc_by_revid = {}
+		self.listeners = []
+		self.next_pageid = 1
+		self.next_revid = 1
+		self.next_rcid = 1
+		for idx in range(titles):
+			self.save(f"Articol {idx}", self.article_text(self.lang), "Importator", rc=False)
+
+	def article_text(self, lang: str) -> str:
+		return " ".join(self.random.choice(SENTENCES[lang]) for _ in range(8))
+
+	def save(self, title: str, text: str, user: str, summary: str = "", tags=(), vandal: bool = False,
+			 lang: str = None, rc: bool = True) -> dict:
+		with self.lock:
+			title = normalize(title)
+			page = self.pages.get(title)
+			new = page is None
+			if new:
+				page = {"pageid": self.next_pageid, "ns": namespace_of(title), "title": title,
+						"revisions": [], "person": self.random.random() < self.person_ratio}
+				self.pages[title] = page
+				if page["ns"] == 0:
+					self.articles.append(title)
+				self.next_pageid += 1
+			parent = page["revisions"][-1] if page["revisions"] else 0
+			now = time.time()
+			revision = {"revid": self.next_revid, "parentid": parent, "title": title, "user": user,
+						"time": now, "timestamp": iso(now), "comment": summary, "text": text,
+						"tags": list(tags), "vandal": vandal, "lang": lang or self.lang}
+			self.next_revid += 1
+			self.revisions[revision["revid"]] = revision
+			page["revisions"].append(revision["revid"])
+			if not rc:
+				return revision
+			row = {"type": "new" if new else "edit", "ns": page["ns"], "title": title,
+				   "pageid": page["pageid"], "revid": revision["revid"], "old_revid": parent,
+				   "rcid": self.next_rcid, "user": user, "time": now, "timestamp": revision["timestamp"],
+				   "comment": summary, "tags": list(tags), "bot": user == self.bot_name,
+				   "patrolled": user == self.bot_name}
+			self.next_rcid += 1
+			self.rc.append(row)
+			self.rc_by_revid[row["revid"]] = row
+			if len(self.rc) > self.rc_max:
+				del self.rc_by_revid[self.rc.pop(0)["revid"]]
+			for listener in list(self.listeners):
+				listener.put(row)
+			return revision
+
+	def page(self, title: str) -> dict:
+		return self.pages.get(normalize(title))
+
+	def top(self, page: dict) -> dict:
+		return self.revisions[page["revisions"][-1]]
+
+	def is_top(self, revid: int) -> bool:
+		revision = self.revisions.get(revid)
+		return revision is not None and self.pages[revision["title"]]["revisions"][-1] == revid
+
+	def generate_edit(self) -> dict:
+		with self.lock:
+			r = self.random
+			vandal = r.random() < self.vandal_ratio
+			if r.random() < 0.3:
+				user = f"10.{r.randrange(256)}.{r.randrange(256)}.{r.randrange(256)}"
+			else:
+				user = f"Utilizator {r.randrange(self.users)}"
+			if r.random() < self.new_ratio:
+				lang = "en" if r.random() < self.foreign_ratio else self.lang
+				title = f"Articol nou {self.next_pageid}"
+				return self.save(title, self.article_text(lang), user, "Pagină nouă", lang=lang)
+			title = r.choice(self.articles)
+			text = self.top(self.pages[title])["text"]
+			if vandal:
+				text = r.choice(VANDALISM) + " " + text[r.randrange(len(text) // 2):]
+				return self.save(title, text, user, tags=["mobile edit"], vandal=True)
+			return self.save(title, text + " " + r.choice(SENTENCES[self.lang]), user, "Completare")
+
+	def probability(self, revid: int, model: str) -> float:
+		"""The fake model score: high for vandalism, low otherwise; stable for a revision and model."""
+		revision = self.revisions.get(revid)
+		if revision is None:
+			return None
+		r = random.Random(f"{revid}/{model}")
+		damaging = r.uniform(0.85, 0.995) if revision["vandal"] else r.uniform(0.0, 0.45)
+		return 1 - damaging if model == "goodfaith" else damaging
+
+	def oresscores(self, revid: int) -> dict:
+		scores = {}
+		for model in ("damaging", "goodfaith"):
+			p = self.probability(revid, model)
+			scores[model] = {"true": round(p, 3), "false": round(1 - p, 3)}
+		return scores
+
+	def language(self, text: str) -> str:
+		with self.lock:
+			for revision in reversed(list(self.revisions.values())[-1000:]):
+				if text and text in revision["text"]:
+					return revision["lang"]
+		return self.lang
+
+	def recentchanges(self, params: dict, formatversion: int) -> (list, dict):
+		namespaces = {int(ns) for ns in split_values(params.get("rcnamespace"))}
+		types = set(split_values(params.get("rctype")))
+		show = set(split_values(params.get("rcshow")))
+		newer = params.get("rcdir") == "newer"
+		limit = params.get("rclimit", "10")
+		limit = 500 if limit == "max" else int(limit)
+		start = parse_timestamp(params["rcstart"]) if params.get("rcstart") else None
+		end = parse_timestamp(params["rcend"]) if params.get("rcend") else None
+		cont = None
+		if params.get("rccontinue"):
+			ts, _, rcid = params["rccontinue"].partition("|")
+			cont = (parse_timestamp(ts), int(rcid))
+		with self.lock:
+			rows = list(self.rc) if newer else list(reversed(self.rc))
+			result = []
+			for row in rows:
+				key = (int(row["time"]), row["rcid"])
+				if newer:
+					if (start and row["time"] < start) or (cont and key < cont):
+						continue
+					if end and row["time"] > end + 1:
+						break
+				else:
+					if (start and row["time"] >= start + 1) or (cont and key > cont):
+						continue
+					if end and row["time"] < end:
+						break
+				if namespaces and row["ns"] not in namespaces:
+					continue
+				if types and row["type"] not in types:
+					continue
+				if "rctoponly" in params and not self.is_top(row["revid"]):
+					continue
+				if ("patrolled" in show and not row["patrolled"]) or ("!patrolled" in show and row["patrolled"]):
+					continue
+				if ("bot" in show and not row["bot"]) or ("!bot" in show and row["bot"]):
+					continue
+				if len(result) == limit:
+					ts = datetime.fromtimestamp(row["time"], timezone.utc).strftime("%Y%m%d%H%M%S")
+					return result, {"rccontinue": f"{ts}|{row['rcid']}", "continue": "-||"}
+				result.append(self.rc_row(row, params, formatversion))
+		return result, None
+
+	def rc_row(self, row: dict, params: dict, formatversion: int) -> dict:
+		info = {key: row[key] for key in ("type", "ns", "title", "pageid", "revid", "old_revid",
+										  "rcid", "user", "timestamp", "comment", "tags")}
+		if "oresscores" in split_values(params.get("rcprop")):
+			info["oresscores"] = self.oresscores(row["revid"])
+		if formatversion == 2:
+			info.update(bot=row["bot"], new=row["type"] == "new", patrolled=row["patrolled"])
+		else:
+			# formatversion=1 booleans: the key is present when the flag is set
+			for flag in ("bot", "patrolled"):
+				if row[flag]:
+					info[flag] = ""
+			if row["type"] == "new":
+				info["new"] = ""
+			if not row["patrolled"]:
+				info["unpatrolled"] = ""
+		return info
+
+
+class FakeServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address, wiki: FakeWiki, latency: dict = None, jitter: float = 0.3,
+				 error_rate: float = 0, maxlag_rate: float = 0, stream_limit: int = None):
+		super(FakeServer, self).__init__(address, FakeHandler)
+		self.wiki = wiki
+		self.latency = {"read": 0.05, "write": 0.3, "model": 0.2}
+		self.latency.update(latency or {})
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.maxlag_rate = maxlag_rate
+		# events sent before the stream is dropped, to test the reconnections
+		self.stream_limit = stream_limit
+		self.counts = {}
+		self._lock = threading.Lock()
+
+	def count(self, name: str) -> None:
+		with self._lock:
+			self.counts[name] = self.counts.get(name, 0) + 1
+
+	def delay(self, kind: str) -> None:
+		mean = self.latency.get(kind, 0)
+		if mean > 0:
+			time.sleep(mean * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class EditGenerator(threading.Thread):
+	"""Make edits on the fake wiki with Poisson arrivals at `rate` edits/second."""
+
+	def __init__(self, wiki: FakeWiki, rate: float):
+		super(EditGenerator, self).__init__(name="edit-generator", daemon=True)
+		self.wiki = wiki
+		self.rate = rate
+
+	def run(self) -> None:
+		while self.rate > 0:
+			time.sleep(random.expovariate(self.rate))
+			self.wiki.generate_edit()
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+	server_version = "FakeWiki/1.0"
+
+	def log_message(self, format, *args) -> None:
+		pass
+
+	@property
+	def wiki(self) -> FakeWiki:
+		return self.server.wiki
+
+	def do_GET(self) -> None:
+		self.route({})
+
+	def do_POST(self) -> None:
+		length = int(self.headers.get("Content-Length") or 0)
+		body = self.rfile.read(length).decode("utf-8") if length else ""
+		if self.headers.get("Content-Type", "").startswith("application/json"):
+			self.route({}, json.loads(body or "null"))
+		else:
+			self.route(dict(parse_qsl(body, keep_blank_values=True)))
+
+	def route(self, form: dict, body=None) -> None:
+		url = urlsplit(self.path)
+		params = dict(parse_qsl(url.query, keep_blank_values=True))
+		params.update(form)
+		path = url.path
+		if path == "/stats":
+			return self.send_json(200, {"counts": self.server.counts, "recentchanges": len(self.wiki.rc)})
+		if path == "/v2/stream/recentchange":
+			self.server.count("stream")
+			return self.stream()
+		if path.endswith("/api.php"):
+			action = params.get("action", "help")
+			kind = "write" if action in WRITE_ACTIONS else "read"
+			name = f"api.{action}"
+		elif path.startswith("/v3/scores/") or path.startswith("/service/lw/"):
+			kind, name = "model", "ores" if path.startswith("/v3/") else path.rsplit("/", 1)[-1]
+		else:
+			return self.send_json(404, {"error": f"no such endpoint {path}"})
+		self.server.count(name)
+		self.server.delay(kind)
+		if random.random() < self.server.error_rate:
+			return self.send_json(503, {"error": "injected failure"}, {"Retry-After": "1"})
+		try:
+			if kind == "model" and path.startswith("/v3/"):
+				return self.ores(path, params)
+			if kind == "model":
+				return self.liftwing(path, body or {})
+			if "maxlag" in params and random.random() < self.server.maxlag_rate:
+				raise ApiError("maxlag", "Waiting for a database server: 5 seconds lagged.")
+			return self.send_json(200, self.api(params))
+		except ApiError as e:
+			headers = {"Retry-After": "5", "X-Database-Lag": "5"} if e.code == "maxlag" else {}
+			return self.send_json(200, {"error": {"code": e.code, "info": e.info}}, headers)
+
+	def send_json(self, status: int, data, headers: dict = None) -> None:
+		payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json; charset=utf-8")
+		self.send_header("Content-Length", str(len(payload)))
+		for key, value in (headers or {}).items():
+			self.send_header(key, value)
+		self.end_headers()
+		self.wfile.write(payload)
+
+	# ORES and LiftWing
+
+	def ores(self, path: str, params: dict) -> None:
+		parts = [part for part in path.split("/") if part][2:]
+		dbname = parts[0] if parts else self.wiki.dbname
+		if len(parts) >= 3:
+			revids, models = [parts[1]], [parts[2]]
+		else:
+			revids, models = split_values(params.get("revids")), split_values(params.get("models"))
+		scores = {}
+		for revid in revids:
+			scores[revid] = {}
+			for model in models:
+				p = self.wiki.probability(int(revid), model)
+				if p is None:
+					scores[revid][model] = {"error": {"type": "RevisionNotFound", "message": f"{revid} not found"}}
+				else:
+					scores[revid][model] = {"score": {"prediction": p > 0.5,
+													  "probability": {"true": p, "false": 1 - p}}}
+		self.send_json(200, {dbname: {"models": {model: {"version": "0.0.0"} for model in models},
+									  "scores": scores}})
+
+	def liftwing(self, path: str, body: dict) -> None:
+		model = path.rsplit("/", 1)[-1].split(":")[0]
+		if model == "langid":
+			lang = self.wiki.language(body.get("text", ""))
+			return self.send_json(200, {"language": lang, "wikicode": lang, "score": 0.99})
+		revid = int(body.get("rev_id", 0))
+		p = self.wiki.probability(revid, model)
+		if p is None:
+			return self.send_json(400, {"error": f"The MediaWiki API returned an error for revision {revid}"})
+		self.send_json(200, {"model_name": model, "model_version": "3", "wiki_db": self.wiki.dbname,
+							 "revision_id": revid, "output": {"prediction": p > 0.5,
+															  "probabilities": {"true": p, "false": 1 - p}}})
+
+	# EventStreams
+
+	def stream(self) -> None:
+		last = self.headers.get("Last-Event-ID")
+		last_rcid = 0
+		if last:
+			try:
+				last_rcid = int(json.loads(last)[0]["offset"])
+			except (ValueError, KeyError, IndexError, TypeError):
+				last_rcid = 0
+		events = queue.Queue()
+		with self.wiki.lock:
+			backlog = [row for row in self.wiki.rc if row["rcid"] > last_rcid] if last_rcid else []
+			self.wiki.listeners.append(events)
+		self.send_response(200)
+		self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+		self.send_header("Cache-Control", "no-cache")
+		self.end_headers()
+		limit = self.server.stream_limit
+		try:
+			for row in backlog[:limit]:
+				self.send_event(row)
+			sent = len(backlog[:limit])
+			while limit is None or sent < limit:
+				try:
+					self.send_event(events.get(timeout=15))
+					sent += 1
+				except queue.Empty:
+					self.wfile.write(b":\n\n")
+					self.wfile.flush()
+		except (BrokenPipeError, ConnectionResetError):
+			pass
+		finally:
+			self.wiki.listeners.remove(events)
+
+	def send_event(self, row: dict) -> None:
+		wiki = self.wiki
+		event = {"$schema": "/mediawiki/recentchange/1.0.0",
+				 "meta": {"domain": f"{wiki.lang}.wikipedia.org", "dt": row["timestamp"]},
+				 "id": row["rcid"], "type": row["type"], "namespace": row["ns"], "title": row["title"],
+				 "comment": row["comment"], "timestamp": int(row["time"]), "user": row["user"],
+				 "bot": row["bot"], "minor": False, "patrolled": row["patrolled"],
+				 "revision": {"old": row["old_revid"] or None, "new": row["revid"]},
+				 "server_url": f"https://{wiki.lang}.wikipedia.org", "wiki": wiki.dbname}
+		event_id = json.dumps([{"topic": "fake.mediawiki.recentchange", "partition": 0, "offset": row["rcid"]}])
+		self.wfile.write(f"event: message\nid: {event_id}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+		self.wfile.flush()
+
+	# MediaWiki action API
+
+	def api(self, params: dict) -> dict:
+		action = params.get("action")
+		formatversion = int(params.get("formatversion", 1))
+		if action in WRITE_ACTIONS - {"login", "clientlogin"} and not params.get("token"):
+			raise ApiError("missingparam", "The token parameter must be set.")
+		if action == "query":
+			return self.query(params, formatversion)
+		if action == "parse":
+			return self.parse(params)
+		if action == "edit":
+			return self.edit(params)
+		if action == "rollback":
+			return self.rollback(params)
+		if action == "patrol":
+			return self.patrol(params)
+		if action == "wbgetentities":
+			return self.wbgetentities(params)
+		if action == "paraminfo":
+			return self.paraminfo(params)
+		if action == "login":
+			return {"login": {"result": "Success", "lgusername": self.wiki.bot_name}}
+		if action == "clientlogin":
+			return {"clientlogin": {"status": "PASS", "username": self.wiki.bot_name}}
+		raise ApiError("badvalue", f"Unrecognized value for parameter \"action\": {action}.")
+
+	def query(self, params: dict, formatversion: int) -> dict:
+		wiki = self.wiki
+		result = {}
+		cont = None
+		meta = split_values(params.get("meta"))
+		if "siteinfo" in meta:
+			result.update(self.siteinfo(split_values(params.get("siprop")) or ["general"]))
+		if "userinfo" in meta:
+			rights = ["read", "edit", "patrol", "autopatrol", "rollback", "bot", "apihighlimits", "writeapi"]
+			result["userinfo"] = {"id": 1, "name": wiki.bot_name, "groups": ["*", "user", "bot", "sysop"],
+								  "rights": rights, "editcount": 0}
+		if "tokens" in meta:
+			types = split_values(params.get("type")) or ["csrf"]
+			result["tokens"] = {f"{token_type}token": "fake+\\" for token_type in types}
+		if params.get("list") == "recentchanges":
+			result["recentchanges"], cont = wiki.recentchanges(params, formatversion)
+		props = split_values(params.get("prop"))
+		if props:
+			pages = self.pages(params, props, formatversion)
+			result["pages"] = pages if formatversion == 2 else {str(page.get("pageid", -1 - idx)): page
+															   for idx, page in enumerate(pages)}
+		response = {"batchcomplete": True if formatversion == 2 else "", "query": result}
+		if cont:
+			response["continue"] = cont
+		return response
+
+	def siteinfo(self, props: list) -> dict:
+		wiki = self.wiki
+		info = {}
+		for prop in props:
+			if prop == "general":
+				info["general"] = {"mainpage": "Pagina principală", "base": f"http://{self.headers['Host']}/wiki/",
+								   "sitename": "Wikipedia", "generator": "MediaWiki 1.41.0",
+								   "case": "first-letter", "lang": wiki.lang, "dbname": wiki.dbname,
+								   "wikiid": wiki.dbname, "server": f"http://{self.headers['Host']}",
+								   "servername": self.headers["Host"], "articlepath": "/wiki/$1",
+								   "scriptpath": "/w", "script": "/w/index.php", "timezone": "UTC",
+								   "timeoffset": 0, "time": iso(time.time()), "legaltitlechars": " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+",
+								   "maxarticlesize": 2097152,
+								   # pywikibot post-processes these
+								   "thumblimits": {"0": 120, "1": 250}, "imagelimits": {"0": {"width": 320, "height": 240}},
+								   "magiclinks": {"ISBN": False, "PMID": False, "RFC": False}}
+			elif prop == "namespaces":
+				info["namespaces"] = {str(ns): {"id": ns, "case": "first-letter", "name": name, "*": name,
+												"canonical": name, "content": ns == 0, "subpages": ns % 2 == 1}
+									  for ns, name in NAMESPACES.items()}
+			else:
+				info[prop] = []
+		return info
+
+	def pages(self, params: dict, props: list, formatversion: int) -> list:
+		wiki = self.wiki
+		with wiki.lock:
+			if params.get("revids"):
+				revisions = [wiki.revisions.get(int(revid)) for revid in split_values(params["revids"])]
+				titles = list(dict.fromkeys(revision["title"] for revision in revisions if revision))
+				only = {revision["revid"] for revision in revisions if revision}
+			else:
+				titles = split_values(params.get("titles"))
+				only = None
+			pages = []
+			for title in titles:
+				page = wiki.page(title)
+				if page is None:
+					pages.append({"ns": namespace_of(normalize(title)), "title": normalize(title),
+								  "missing": True if formatversion == 2 else ""})
+					continue
+				entry = {"pageid": page["pageid"], "ns": page["ns"], "title": page["title"]}
+				top = wiki.top(page)
+				if "info" in props:
+					entry.update(contentmodel="json" if page["title"].endswith(".json") else "wikitext",
+								 lastrevid=top["revid"], length=len(top["text"]), touched=top["timestamp"],
+								 protection=[], restrictiontypes=["edit", "move"])
+				if "revisions" in props:
+					entry["revisions"] = self.revisions(page, params, only, formatversion)
+				pages.append(entry)
+			return pages
+
+	def revisions(self, page: dict, params: dict, only: set, formatversion: int) -> list:
+		wiki = self.wiki
+		rvprop = split_values(params.get("rvprop")) or ["ids", "timestamp", "flags", "comment", "user"]
+		revids = [revid for revid in reversed(page["revisions"]) if only is None or revid in only]
+		limit = params.get("rvlimit")
+		revids = revids[:500 if limit == "max" else int(limit)] if limit else revids[:1]
+		revisions = []
+		for revid in revids:
+			revision = wiki.revisions[revid]
+			entry = {"revid": revid, "parentid": revision["parentid"]}
+			for prop in ("user", "timestamp", "comment", "tags"):
+				if prop in rvprop:
+					entry[prop] = revision[prop]
+			if "content" in rvprop:
+				content = revision["text"]
+				if params.get("rvsection"):
+					sections = split_sections(content)
+					content = sections[int(params["rvsection"])] if int(params["rvsection"]) < len(sections) else ""
+				key = "content" if formatversion == 2 else "*"
+				slot = {"contentmodel": "wikitext", "contentformat": "text/x-wiki", key: content}
+				if "rvslots" in params:
+					entry["slots"] = {"main": slot}
+				else:
+					entry.update(slot)
+			revisions.append(entry)
+		return revisions
+
+	def parse(self, params: dict) -> dict:
+		page = self.wiki.page(params.get("page", ""))
+		if page is None:
+			raise ApiError("missingtitle", "The page you specified doesn't exist.")
+		text = self.wiki.top(page)["text"]
+		sections = []
+		for idx, m in enumerate(HEADING.finditer(text), start=1):
+			sections.append({"toclevel": len(m.group(1)) - 1, "level": str(len(m.group(1))), "line": m.group(2),
+							 "number": str(idx), "index": str(idx), "anchor": m.group(2).replace(" ", "_")})
+		return {"parse": {"title": page["title"], "pageid": page["pageid"], "sections": sections}}
+
+	def edit(self, params: dict) -> dict:
+		wiki = self.wiki
+		with wiki.lock:
+			page = wiki.page(params.get("title", ""))
+			if page is None and "nocreate" in params:
+				raise ApiError("missingtitle", "The page you specified doesn't exist.")
+			old = wiki.top(page)["text"] if page else ""
+			section = params.get("section")
+			if "text" in params and section not in (None, "", "new"):
+				sections = split_sections(old)
+				idx = int(section)
+				if idx >= len(sections):
+					raise ApiError("nosuchsection", f"There is no section {section}.")
+				sections[idx] = params["text"].rstrip("\n") + "\n" + ("\n" if idx < len(sections) - 1 else "")
+				text = "".join(sections)
+			elif section == "new":
+				text = f"{old}\n\n== {params.get('sectiontitle', '')} ==\n{params.get('text', '')}"
+			elif "text" in params:
+				text = params["text"]
+			else:
+				text = params.get("prependtext", "") + old + params.get("appendtext", "")
+			if page is not None and text == old:
+				return {"edit": {"result": "Success", "pageid": page["pageid"], "title": page["title"], "nochange": ""}}
+			old_revid = wiki.top(page)["revid"] if page else 0
+			revision = wiki.save(params["title"], text, wiki.bot_name, params.get("summary", ""))
+			page = wiki.page(params["title"])
+		return {"edit": {"result": "Success", "pageid": page["pageid"], "title": page["title"],
+						 "contentmodel": "wikitext", "oldrevid": old_revid, "newrevid": revision["revid"],
+						 "newtimestamp": revision["timestamp"]}}
+
+	def rollback(self, params: dict) -> dict:
+		wiki = self.wiki
+		with wiki.lock:
+			page = wiki.page(params.get("title", ""))
+			if page is None:
+				raise ApiError("missingtitle", "The page you specified doesn't exist.")
+			user = params.get("user", "")
+			top = wiki.top(page)
+			if top["user"] != user:
+				raise ApiError("alreadyrolled", "The page you tried to roll back was already rolled back.")
+			previous = [wiki.revisions[revid] for revid in page["revisions"] if wiki.revisions[revid]["user"] != user]
+			if not previous:
+				raise ApiError("onlyauthor", "The page you tried to roll back only has one author.")
+			target = previous[-1]
+			revision = wiki.save(page["title"], target["text"], wiki.bot_name, params.get("summary", ""),
+								 tags=["mw-rollback"])
+		return {"rollback": {"title": page["title"], "pageid": page["pageid"], "summary": params.get("summary", ""),
+							 "revid": revision["revid"], "old_revid": top["revid"], "last_revid": target["revid"]}}
+
+	def patrol(self, params: dict) -> dict:
+		wiki = self.wiki
+		with wiki.lock:
+			if params.get("rcid"):
+				row = next((row for row in wiki.rc if row["rcid"] == int(params["rcid"])), None)
+				if row is None:
+					raise ApiError("nosuchrcid", f"There is no recent change with ID {params['rcid']}.")
+			else:
+				row = wiki.rc_by_revid.get(int(params.get("revid") or 0))
+				if row is None:
+					raise ApiError("nosuchrevid", f"There is no revision with ID {params.get('revid')}.")
+			row["patrolled"] = True
+		return {"patrol": {"rcid": row["rcid"], "ns": row["ns"], "title": row["title"]}}
+
+	def wbgetentities(self, params: dict) -> dict:
+		wiki = self.wiki
+		entities = {}
+		if params.get("ids"):
+			pages = {qid: next((page for page in wiki.pages.values() if f"Q{page['pageid']}" == qid), None)
+					 for qid in split_values(params["ids"])}
+		else:
+			pages = {title: wiki.page(title) for title in split_values(params.get("titles"))}
+		for idx, (key, page) in enumerate(pages.items(), start=1):
+			if page is None:
+				entities[str(-idx)] = {"id": key, "missing": ""}
+				continue
+			qid = f"Q{page['pageid']}"
+			claims = {}
+			if page["person"]:
+				claims["P31"] = [self.statement(qid, "P31", "wikibase-item",
+												{"entity-type": "item", "numeric-id": 5, "id": "Q5"},
+												"wikibase-entityid")]
+				claims["P569"] = [self.statement(qid, "P569", "time",
+												 {"time": "+1970-01-01T00:00:00Z", "timezone": 0, "before": 0,
+												  "after": 0, "precision": 11,
+												  "calendarmodel": "http://www.wikidata.org/entity/Q1985727"}, "time")]
+			entities[qid] = {"type": "item", "id": qid, "lastrevid": 1, "labels": {}, "descriptions": {},
+							 "aliases": {}, "claims": claims,
+							 "sitelinks": {wiki.dbname: {"site": wiki.dbname, "title": page["title"], "badges": []}}}
+		return {"entities": entities, "success": 1}
+
+	@staticmethod
+	def statement(qid: str, prop: str, datatype: str, value: dict, value_type: str) -> dict:
+		return {"mainsnak": {"snaktype": "value", "property": prop, "datatype": datatype,
+							 "datavalue": {"value": value, "type": value_type}},
+				"type": "statement", "id": f"{qid}${prop}", "rank": "normal"}
+
+	def paraminfo(self, params: dict) -> dict:
+		"""Just enough module descriptions for pywikibot's ParamInfo."""
+		modules = []
+		for path in split_values(params.get("modules")):
+			name = path.rsplit("+", 1)[-1]
+			prefix = "".join(part[0] for part in name.split("_"))[:2] if path.startswith("query+") else ""
+			parameters = []
+			if name == "main":
+				actions = sorted(WRITE_ACTIONS | {"query", "parse", "paraminfo", "wbgetentities"})
+				parameters.append({"name": "action", "type": actions,
+								   "submodules": {action: action for action in actions}})
+			elif name == "query":
+				# pywikibot builds its module tree from the submodules
+				submodules = {"prop": ["info", "revisions"], "list": ["recentchanges"],
+							  "meta": ["siteinfo", "tokens", "userinfo"]}
+				for param, types in submodules.items():
+					parameters.append({"name": param, "type": types, "limit": 50,
+									   "submodules": {type: f"query+{type}" for type in types}})
+				parameters.append({"name": "generator", "type": ["recentchanges", "revisions"],
+								   "submodules": {"recentchanges": "query+recentchanges",
+												  "revisions": "query+revisions"}})
+			elif name == "recentchanges":
+				prefix = "rc"
+				parameters += [{"name": "show", "type": ["minor", "!minor", "bot", "!bot", "anon", "!anon",
+														 "redirect", "!redirect", "patrolled", "!patrolled"]},
+							   {"name": "namespace", "type": "namespace", "multi": ""},
+							   {"name": "limit", "type": "limit", "max": 500, "highmax": 5000}]
+			elif name == "revisions":
+				prefix = "rv"
+			elif name == "tokens":
+				# site.tokens loads every type listed here
+				parameters.append({"name": "type", "type": ["csrf", "patrol", "rollback"], "multi": ""})
+			modules.append({"name": name, "classname": f"Api{name.title()}", "path": path, "group": "",
+							"prefix": prefix, "parameters": parameters})
+		return {"paraminfo": {"modules": modules}}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serve a fake ro.wikipedia.org, ORES, LiftWing and EventStreams.")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8765)
+	parser.add_argument("--rate", type=float, default=2, help="generated edits per second")
+	parser.add_argument("--vandal-ratio", type=float, default=0.05)
+	parser.add_argument("--new-ratio", type=float, default=0.05, help="share of edits creating an article")
+	parser.add_argument("--read-latency", type=float, default=0.05, help="mean seconds per API read")
+	parser.add_argument("--write-latency", type=float, default=0.3, help="mean seconds per API write")
+	parser.add_argument("--model-latency", type=float, default=0.2, help="mean seconds per model request")
+	parser.add_argument("--error-rate", type=float, default=0, help="probability of a 503 answer")
+	parser.add_argument("--maxlag-rate", type=float, default=0, help="probability of a maxlag error")
+	parser.add_argument("--bot", default="PatrocleBot", help="the user name the bot logs in with")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--preload", action="append", default=[], metavar="TITLE=FILE",
+						help="create a page from a local file, e.g. the config page")
+	args = parser.parse_args()
+
+	wiki = FakeWiki(bot_name=args.bot, seed=args.seed, vandal_ratio=args.vandal_ratio, new_ratio=args.new_ratio)
+	wiki.save("Wikipedia:Reclamații", "{{Început tabel căsuțe}}\n{{Sfârșit tabel căsuțe}}\n", "Importator", rc=False)
+	for preload in args.preload:
+		title, _, path = preload.partition("=")
+		with open(path, encoding="utf-8") as f:
+			wiki.save(title, f.read(), "Importator", rc=False)
+	server = FakeServer((args.host, args.port), wiki,
+						latency={"read": args.read_latency, "write": args.write_latency, "model": args.model_latency},
+						error_rate=args.error_rate, maxlag_rate=args.maxlag_rate)
+	EditGenerator(wiki, args.rate).start()
+	print(f"Fake wiki on http://{args.host}:{args.port}/w/api.php, {args.rate} edits/s")
+	server.serve_forever()
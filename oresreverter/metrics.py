@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pywikibot
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+	pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+	if extra:
+		pairs.append(extra)
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+	kind = "counter"
+
+	def __init__(self, name: str, help: str, labels: tuple = ()):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.values = {}
+		self._lock = threading.Lock()
+
+	def key(self, labels: dict) -> tuple:
+		return tuple(str(labels.get(name, "")) for name in self.labels)
+
+	def inc(self, amount: float = 1, **labels) -> None:
+		key = self.key(labels)
+		with self._lock:
+			self.values[key] = self.values.get(key, 0) + amount
+
+	def samples(self) -> list:
+		with self._lock:
+			return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+	kind = "gauge"
+
+	def set(self, value: float, **labels) -> None:
+		key = self.key(labels)
+		with self._lock:
+			self.values[key] = value
+
+
+class Histogram(Counter):
+	kind = "histogram"
+	buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+	def observe(self, seconds: float, **labels) -> None:
+		key = self.key(labels)
+		idx = bisect_left(self.buckets, seconds)
+		with self._lock:
+			counts = self.values.get(key)
+			if counts is None:
+				# a count per bucket, then the sum
+				counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+			counts[idx] += 1
+			counts[-1] += seconds
+
+	@contextmanager
+	def time(self, **labels):
+		"""Observe the duration of a with block, even when it raises."""
+		start = time.monotonic()
+		try:
+			yield
+		finally:
+			self.observe(time.monotonic() - start, **labels)
+
+	def samples(self) -> list:
+		with self._lock:
+			values = {key: list(counts) for key, counts in self.values.items()}
+		lines = []
+		for key, counts in values.items():
+			cumulative = 0
+			for bucket, count in zip(self.buckets + ("+Inf",), counts):
+				cumulative += count
+				le = f'le="{bucket}"'
+				lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+			lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {counts[-1]}")
+			lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+		return lines
+
+
+class Metrics:
+	"""Per-stage latency histograms and counters, exported in the Prometheus text format.
+
+Observing is a lock and a bisect, cheap enough for every model call and
+write. The metrics are written to a textfile (for the node exporter) and/or
+served on /metrics, both set in the `metrics` section of the config page.
+"""
+
+	def __init__(self):
+		self.metrics = []
+		self.rc_fetch = self.histogram("oresreverter_rc_fetch_seconds", "Duration of a recent changes fetch")
+		self.rc_changes = self.counter("oresreverter_rc_changes_total", "Recent changes fetched")
+		self.model_request = self.histogram("oresreverter_model_request_seconds",
+											"Duration of the uncached model requests", ("model", "mode"))
+		self.config_reload = self.histogram("oresreverter_config_reload_seconds",
+											"Duration of the config page checks", ("result",))
+		self.write = self.histogram("oresreverter_write_seconds", "Duration of the wiki writes", ("action",))
+		self.write_errors = self.counter("oresreverter_write_errors_total", "Failed wiki writes", ("action",))
+		self.write_queue_depth = self.gauge("oresreverter_write_queue_depth", "Wiki writes waiting in the queue",
+											("action",))
+		self.write_queue_latency = self.histogram("oresreverter_write_queue_seconds",
+												  "Time from queuing a wiki write to its completion", ("action",))
+		self.cronjob = self.histogram("oresreverter_cronjob_seconds", "Duration of the cron jobs", ("job",))
+		self.decisions = self.counter("oresreverter_decisions_total", "Changes by decision", ("action",))
+		self.scoring_lag = self.histogram("oresreverter_scoring_lag_seconds",
+										  "Time from an edit to the decision about it")
+		self.last_lag = self.gauge("oresreverter_scoring_lag_last_seconds", "Scoring lag of the latest change")
+		self.lag_alert = self.gauge("oresreverter_scoring_lag_alert", "1 while the scoring lag is above lag_alert_s")
+		self.poll_interval = self.histogram("oresreverter_poll_interval_seconds",
+											"Interval chosen before the next recent changes poll")
+		self.edit_rate = self.gauge("oresreverter_edit_rate", "Estimated edits per second in the recent changes")
+		self.delayed_jobs_depth = self.gauge("oresreverter_delayed_jobs_depth", "Delayed jobs waiting or running")
+		self.delayed_job_lag = self.gauge("oresreverter_delayed_job_lag_last_seconds",
+										  "How late the latest delayed job started")
+		self.delayed_job_max_lag = self.gauge("oresreverter_delayed_job_lag_max_seconds",
+											  "How late the latest delayed job started, at most")
+		self.lag_alert_s = 300
+		self.textfile = None
+		self.interval_s = 15
+		self.port = None
+		self._writer = None
+		self._server = None
+		self._alerting = False
+
+	def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+		self.metrics.append(Counter(name, help, labels))
+		return self.metrics[-1]
+
+	def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+		self.metrics.append(Gauge(name, help, labels))
+		return self.metrics[-1]
+
+	def histogram(self, name: str, help: str, labels: tuple = ()) -> Histogram:
+		self.metrics.append(Histogram(name, help, labels))
+		return self.metrics[-1]
+
+	def observe_lag(self, seconds: float) -> None:
+		if seconds is None:
+			return
+		self.scoring_lag.observe(seconds)
+		self.last_lag.set(seconds)
+		alerting = seconds > self.lag_alert_s
+		self.lag_alert.set(int(alerting))
+		if alerting and not self._alerting:
+			pywikibot.warning(f"Scoring lag is {seconds:.0f}s, above the {self.lag_alert_s}s limit")
+		self._alerting = alerting
+
+	def render(self) -> str:
+		lines = []
+		for metric in self.metrics:
+			lines.append(f"# HELP {metric.name} {metric.help}")
+			lines.append(f"# TYPE {metric.name} {metric.kind}")
+			lines += metric.samples()
+		return "\n".join(lines) + "\n"
+
+	def write_textfile(self) -> None:
+		# the node exporter must never read a half-written file
+		tmp = self.textfile + ".tmp"
+		with open(tmp, "w", encoding="utf-8") as f:
+			f.write(self.render())
+		os.replace(tmp, self.textfile)
+
+	def _write_loop(self) -> None:
+		while self.textfile:
+			try:
+				self.write_textfile()
+			except OSError as e:
+				pywikibot.error(f"Could not write the metrics to {self.textfile}: {e}")
+			time.sleep(self.interval_s)
+		self._writer = None
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `metrics` section of the config page."""
+		if "lag_alert_s" in config:
+			self.lag_alert_s = float(config["lag_alert_s"])
+		if "interval_s" in config:
+			self.interval_s = float(config["interval_s"])
+		self.textfile = config.get("textfile")
+		if self.textfile and self._writer is None:
+			self._writer = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+			self._writer.start()
+		if config.get("port") and self._server is None:
+			self.port = int(config["port"])
+			self._server = ThreadingHTTPServer(("", self.port), MetricsHandler)
+			self._server.daemon_threads = True
+			threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+	def log_message(self, format, *args) -> None:
+		pass
+
+	def do_GET(self) -> None:
+		if self.path.split("?")[0] != "/metrics":
+			self.send_error(404)
+			return
+		payload = get_metrics().render().encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+		self.send_header("Content-Length", str(len(payload)))
+		self.end_headers()
+		self.wfile.write(payload)
+
+
+metrics = Metrics()
+
+def get_metrics() -> Metrics:
+	return metrics
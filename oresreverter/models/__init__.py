@@ -20,3 +20,6 @@ def get_model(name: str="ores") -> ModelConfig:
 			return model()
 	else:
 		return None
+
+from .allmodels import AllModelsConfig
+from .cascade import CascadeConfig
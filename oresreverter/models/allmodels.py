@@ -1,59 +1,134 @@
 #!/usr/bin/python3
 # -*- coding: utf-8  -*-
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from typing import Tuple
 import pywikibot
-from .base import RevertModelConfig
+from .base import CompositeModelConfig, RevertModelConfig
 from  . import all_subclasses
 
 
-class AllModelsConfig(RevertModelConfig):
+class ModelLatency:
+	"""Latency histogram and timeout count for one model."""
+	buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+	def __init__(self):
+		self.counts = [0] * (len(self.buckets) + 1)
+		self.calls = 0
+		self.timeouts = 0
+		self.errors = 0
+		self.total_s = 0.0
+		self._lock = threading.Lock()
+
+	def observe(self, seconds: float) -> None:
+		with self._lock:
+			self.calls += 1
+			self.total_s += seconds
+			for idx, bucket in enumerate(self.buckets):
+				if seconds <= bucket:
+					self.counts[idx] += 1
+					break
+			else:
+				self.counts[-1] += 1
+
+	def timeout(self) -> None:
+		with self._lock:
+			self.timeouts += 1
+
+	def error(self) -> None:
+		with self._lock:
+			self.errors += 1
+
+	def __str__(self) -> str:
+		average = self.total_s / self.calls if self.calls else 0
+		labels = [f"≤{bucket}s" for bucket in self.buckets] + [f">{self.buckets[-1]}s"]
+		histogram = " ".join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+		return (f"{self.calls} apeluri, medie {average:.2f}s, {self.timeouts} expirate, "
+				f"{self.errors} erori [{histogram}]")
+
+
+class AllModelsConfig(CompositeModelConfig):
+	"""Query every revert model in parallel and keep the highest score.
+
+Each model gets a deadline (`deadline_s`, or a per-model value from
+`deadlines` in the config section); models that do not answer in time are
+left out of the result for that revision and counted as timeouts. Their
+requests keep running in the background, so a late answer still ends up
+in the score cache.
+"""
+	deadline_s = 5.0
+
 	def __init__(self) -> None:
-		# at this point in the function, `self` does not have a name and is removed from the list
-		self.models = [x for x in all_subclasses(RevertModelConfig) if x.get_name() != None and x != self.__class__]
+		super(AllModelsConfig, self).__init__()
+		# all_subclasses() is a set, keep the order stable between runs
+		self.models = sorted((x() for x in all_subclasses(RevertModelConfig)
+							  if x.get_name() is not None and not getattr(x, "composite", False)),
+							 key=lambda model: model.get_name())
 		self.threshold = 0.909 # TODO
 		self.docs = "Utilizator:PatrocleBot"
-		self.latest_model = self.__class__ # what model score we choose to return
+		self.deadlines = {}
+		self.latency = {model.get_name(): ModelLatency() for model in self.models}
+		self.latest_model = self.models[0] # what model score we choose to return
+		self._executor = ThreadPoolExecutor(max_workers=4 * len(self.models),
+											thread_name_prefix="multi-model")
 
 	@staticmethod
 	def get_name() -> str:
 		return "multi-model"
 
-	def likely_bad(self, score:float) -> bool:
-		return self.latest_model.likely_bad(score)
-
-	def possibly_bad(self, score:float) -> bool:
-		return self.latest_model.possibly_bad(score)
+	def set_config(self, config: dict):
+		self.cfg = config or {}
+		self.deadline_s = float(self.cfg.get("deadline_s", AllModelsConfig.deadline_s))
+		self.deadlines = {name: float(value) for name, value in self.cfg.get("deadlines", {}).items()}
+		for model in self.models:
+			self.set_member_config(model)
 
-	def likely_constructive(self, score:float) -> bool:
-		return self.latest_model.likely_constructive(score)
-
-	def get_name() -> str:
-		return self.latest_model.get_name()
+	@property
+	def members(self) -> list:
+		return self.models
 
-	def get_docs(self) -> str:
-		return self.latest_model.get_docs()
+	def get_stats(self) -> str:
+		return "; ".join(f"{name}: {latency}" for name, latency in self.latency.items())
 
-	def get_score(self, lang: str, revid: int) -> float:
-		score, _ = self.get_result(lang, revid)
-		return score
+	def _timed_result(self, model: RevertModelConfig, lang: str, revid: int, rcscores: dict,
+					  wiki: str) -> Tuple[float, bool]:
+		start = time.monotonic()
+		try:
+			return model.get_cached_result(lang, revid, rcscores, wiki)
+		finally:
+			self.latency[model.get_name()].observe(time.monotonic() - start)
 
-	def get_result(self, lang: str, revid: int) -> Tuple[float, bool]:
+	def get_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
 		max_score = 0
 		max_prediction = False
+		winner = None
 		results = {"revid": revid}
-		try:
-			for model in self.models:
-				score, prediction = model.get_result(lang, revid)
-				name = model.get_name()
-				results[name + "_score"] = score
-				results[name + "_prediction"] = prediction
-				if score > max_score:
-					max_score = score
-					max_prediction = prediction
-					self.latest_model = model
-		except Exception as e:
-			pywikibot.output(e)
-		finally:
-			pywikibot.output(",".join([str(x) for x in results.values()]))
-			return max_score, max_prediction
\ No newline at end of file
+		start = time.monotonic()
+		futures = [(model, self._executor.submit(self._timed_result, model, lang, revid, rcscores, wiki))
+				   for model in self.models]
+		futures.sort(key=lambda pair: self.deadlines.get(pair[0].get_name(), self.deadline_s))
+		for model, future in futures:
+			name = model.get_name()
+			remaining = start + self.deadlines.get(name, self.deadline_s) - time.monotonic()
+			try:
+				score, prediction = future.result(timeout=max(0, remaining))
+			except TimeoutError:
+				self.latency[name].timeout()
+				results[name + "_score"] = "timeout"
+				continue
+			except Exception as e:
+				self.latency[name].error()
+				pywikibot.output(f"{name}: {e}")
+				continue
+			results[name + "_score"] = score
+			results[name + "_prediction"] = prediction
+			if score is not None and score > max_score:
+				max_score = score
+				max_prediction = prediction
+				winner = model
+		if winner is not None:
+			self.remember(revid, winner)
+		pywikibot.output(",".join([str(x) for x in results.values()]))
+		return max_score, max_prediction
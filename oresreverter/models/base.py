@@ -2,8 +2,17 @@
 # -*- coding: utf-8  -*-
 
 import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Tuple
+import pywikibot
 import requests
+from ..metrics import get_metrics
+from ..scorecache import get_score_cache
+
+# the threads sending single score requests, shared by all the wikis and models
+scoring_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="scoring")
 
 class ModelConfig(object):
 	"""Abstract Implementation for a generic ML model."""
@@ -11,17 +20,94 @@ class ModelConfig(object):
 	url: str
 	cfg: dict
 	docs:  str # a link to the documentation of the model
+	needs_config = False # whether the thresholds come from set_config()
+	batch_size = 1 # revisions scored by one get_results() request
 
 	@staticmethod
 	def get_name() -> str:
 		return None
 
-	def get_score(self, lang: str, revid: int) -> float:
+	def get_score(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> float:
+		"""Score a revision. `rcscores` are the oresscores embedded in the RC row, if any.
+
+`wiki` is the database name of the wiki (site.dbName()); it defaults to
+the Wikipedia of `lang`.
+"""
+		score, _ = self.get_cached_result(lang, revid, rcscores, wiki)
+		return score
+
+	def get_cached_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
+		"""get_result() behind the shared score cache."""
+		cache = get_score_cache()
+		wiki = wiki or lang + "wiki"
+		result = cache.get(self.get_name(), wiki, revid)
+		if result is None:
+			with get_metrics().model_request.time(model=self.get_name(), mode="single"):
+				result = self.get_result(lang, revid, rcscores, wiki)
+			cache.put(self.get_name(), wiki, revid, result)
+		return result
+
+	def get_cached_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+						   wiki: str = None) -> dict:
+		"""get_results() behind the shared score cache; only the misses are requested."""
+		cache = get_score_cache()
+		wiki = wiki or lang + "wiki"
+		results = {}
+		missing = []
+		for revid in revids:
+			result = cache.get(self.get_name(), wiki, revid)
+			if result is None:
+				missing.append(revid)
+			else:
+				results[revid] = result
+		if missing:
+			with get_metrics().model_request.time(model=self.get_name(), mode="batch"):
+				fetched = self.get_results(lang, missing, rcscores, workers, wiki)
+			for revid, result in fetched.items():
+				cache.put(self.get_name(), wiki, revid, result)
+				results[revid] = result
+		return results
+
+	def get_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
 		raise NotImplementedError
 
+	def get_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+					wiki: str = None) -> dict:
+		"""Score several revisions at once.
+
+`rcscores` maps revision ids to their embedded oresscores. Returns a
+{revid: (score, prediction)} dict; revisions that could not be scored are
+left out. Models without a batch endpoint send parallel single requests
+on the shared scoring pool, at most `workers` at a time for this call.
+"""
+		rcscores = rcscores or {}
+		results = {}
+		waiting = list(revids)
+		running = {}
+		while waiting or running:
+			while waiting and len(running) < max(1, workers):
+				revid = waiting.pop(0)
+				running[scoring_pool.submit(self.get_result, lang, revid, rcscores.get(revid), wiki)] = revid
+			done, _ = wait(running, return_when=FIRST_COMPLETED)
+			for future in done:
+				revid = running.pop(future)
+				try:
+					results[revid] = future.result()
+				except Exception as e:
+					pywikibot.error(f"Obtaining the {self.get_name()} score for revision {revid} failed: {e}")
+		return results
+
 	def get_docs(self) -> str:
 		return self.docs
 
+	def model_for(self, revid: int) -> "ModelConfig":
+		"""The model that produced the score of `revid`; composite models override this."""
+		return self
+
+	def get_stats(self) -> str:
+		"""A line for the periodic report, if the model keeps statistics."""
+		return ""
+
 	def set_config(self, config: dict):
 		self.cfg = config
 
@@ -36,3 +122,75 @@ class RevertModelConfig(ModelConfig):
 	def likely_constructive(self, score:float) -> bool:
 		raise NotImplementedError
 
+
+
+class CompositeModelConfig(RevertModelConfig):
+	"""A revert model combining the scores of other models.
+
+The member model that produced the score of a revision decides for it
+(see model_for). Only the members are cached, since the combination
+depends on which of them were consulted.
+"""
+	composite = True # never part of another composite model
+	remembered = 10000 # how many revisions we remember the deciding model for
+
+	def __init__(self) -> None:
+		self.cfg = {}
+		self.sections = {} # the whole config page, for the members' own sections
+		self.latest_model = None
+		self._winners = OrderedDict()
+		self._winners_lock = threading.Lock()
+
+	@property
+	def members(self) -> list:
+		"""The models combined by this one."""
+		raise NotImplementedError
+
+	@property
+	def batch_size(self) -> int:
+		return max(model.batch_size for model in self.members)
+
+	def set_member_config(self, model: ModelConfig) -> None:
+		"""Configure a member from its own entry in this model's config section,
+or else from the member's section at the top of the config page.
+"""
+		name = model.get_name()
+		for section in (self.cfg, self.sections):
+			model_cfg = section.get(name) or section.get(name.split(".")[0])
+			if model_cfg is not None:
+				model.set_config(model_cfg)
+				return
+		if model.needs_config:
+			raise ValueError(f"No configuration for {name}: add a \"{name.split('.')[0]}\" section "
+							 f"to the {self.get_name()} section or to the config page")
+
+	def likely_bad(self, score:float) -> bool:
+		return self.latest_model.likely_bad(score)
+
+	def possibly_bad(self, score:float) -> bool:
+		return self.latest_model.possibly_bad(score)
+
+	def likely_constructive(self, score:float) -> bool:
+		return self.latest_model.likely_constructive(score)
+
+	def get_docs(self) -> str:
+		return self.latest_model.get_docs()
+
+	def model_for(self, revid: int) -> ModelConfig:
+		with self._winners_lock:
+			return self._winners.get(revid, self)
+
+	def remember(self, revid: int, model: ModelConfig) -> None:
+		with self._winners_lock:
+			self._winners[revid] = model
+			self._winners.move_to_end(revid)
+			if len(self._winners) > self.remembered:
+				self._winners.popitem(last=False)
+			self.latest_model = model
+
+	def get_cached_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
+		return self.get_result(lang, revid, rcscores, wiki)
+
+	def get_cached_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+						   wiki: str = None) -> dict:
+		return self.get_results(lang, revids, rcscores, workers, wiki)
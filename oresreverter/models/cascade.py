@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+from typing import Tuple
+from .base import CompositeModelConfig
+from  . import get_model
+
+
+class CascadeConfig(CompositeModelConfig):
+	"""Score with a cheap model first and consult the expensive ones only when it is unsure.
+
+The `first` model (by default ores.damaging, which is free when the RC row
+carries its score) decides alone when its score is likely_constructive or
+likely_bad. Revisions in between are escalated to the `then` models and
+the highest of their scores is used, like in the multi-model mode.
+"""
+	default_first = "ores.damaging"
+	default_then = ["revertrisk.multilingual"]
+
+	def __init__(self) -> None:
+		super(CascadeConfig, self).__init__()
+		self.docs = "Utilizator:PatrocleBot"
+		self.first = get_model(self.default_first)
+		self.then = [get_model(name) for name in self.default_then]
+		self.latest_model = self.first
+		self.decided_first = 0
+		self.escalated = 0
+		self.avoided_calls = 0
+		self._stats_lock = threading.Lock()
+
+	@staticmethod
+	def get_name() -> str:
+		return "cascade"
+
+	def set_config(self, config: dict):
+		self.cfg = config or {}
+		first = self.cfg.get("first", self.default_first)
+		if first != self.first.get_name():
+			self.first = get_model(first)
+		then = self.cfg.get("then", self.default_then)
+		if then != [model.get_name() for model in self.then]:
+			self.then = [get_model(name) for name in then]
+		if self.first is None or None in self.then:
+			raise Exception(f"Unknown model in cascade configuration: {first}, {then}")
+		for model in [self.first] + self.then:
+			self.set_member_config(model)
+		self.latest_model = self.first
+
+	@property
+	def members(self) -> list:
+		return [self.first] + self.then
+
+	def get_stats(self) -> str:
+		return (f"{self.decided_first} decise de {self.first.get_name()}, {self.escalated} escaladate, "
+				f"{self.avoided_calls} apeluri evitate")
+
+	def is_certain(self, score: float) -> bool:
+		return self.first.likely_bad(score) or self.first.likely_constructive(score)
+
+	def get_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
+		results = self.get_results(lang, [revid], {revid: rcscores}, 1, wiki)
+		return results.get(revid, (0, False))
+
+	def get_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+					wiki: str = None) -> dict:
+		results = self.first.get_cached_results(lang, revids, rcscores, workers, wiki)
+		uncertain = []
+		for revid, (score, _) in list(results.items()):
+			if score is not None and self.is_certain(score):
+				self.remember(revid, self.first)
+			else:
+				uncertain.append(revid)
+		# the first stage failed for these, so the next ones have to score them
+		uncertain += [revid for revid in revids if revid not in results]
+		with self._stats_lock:
+			self.decided_first += len(revids) - len(uncertain)
+			self.escalated += len(uncertain)
+			self.avoided_calls += (len(revids) - len(uncertain)) * len(self.then)
+		if not uncertain:
+			return results
+
+		escalated = {}
+		for model in self.then:
+			for revid, (score, prediction) in model.get_cached_results(lang, uncertain, rcscores, workers, wiki).items():
+				if score is not None and (revid not in escalated or score > escalated[revid][0]):
+					escalated[revid] = (score, prediction, model)
+		for revid in uncertain:
+			if revid in escalated:
+				score, prediction, model = escalated[revid]
+				results[revid] = (score, prediction)
+				self.remember(revid, model)
+			elif revid in results:
+				# nobody else answered, keep the first opinion
+				self.remember(revid, self.first)
+		return results
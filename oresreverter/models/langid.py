@@ -1,11 +1,14 @@
 #!/usr/bin/python3
 # -*- coding: utf-8  -*-
 
-import json
+import time
+
 import pywikibot
-import requests
 
+from .allmodels import ModelLatency
 from .base import ModelConfig
+from ..textanalysis import MIN_LENGTH, TextAnalyser, get_text_analyser
+from ..transport import get_transport
 
 
 class LangIdConfig(ModelConfig):
@@ -18,9 +21,8 @@ class LangIdConfig(ModelConfig):
 	def get_result(self, text: str) -> (float, str):
 		score = None
 		prediction = False
-		headers = {'Content-Type': 'application/json', 'User-Agent': 'PatrocleBot (patroclebot@strainu.ro)' }
 		data = {"text": text}
-		r = requests.post(url=self.url, headers=headers, data=json.dumps(data))
+		r = get_transport().post(url=self.url, json=data)
 		if r.status_code != 200:
 			pywikibot.error(f"Obtaining the {self.get_name()} from {self.url} "
 							f"failed with code {r.status_code}")
@@ -38,4 +40,72 @@ class LangIdConfig(ModelConfig):
 
 	@staticmethod
 	def get_name() -> str:
-		return "langid"
\ No newline at end of file
+		return "langid"
+
+class LanguageIdentifier:
+	"""Long-lived language identification component, created once at startup.
+
+langdetect runs in the warm, seeded process pool of the TextAnalyser; the
+LiftWing langid model (through the pooled transport) is only the fallback
+when langdetect has no answer. Every identification is timed.
+"""
+
+	def __init__(self, analyser: TextAnalyser = None):
+		self.analyser = analyser or get_text_analyser()
+		self.liftwing = LangIdConfig()
+		self.latency = ModelLatency()
+		self.fallback_latency = ModelLatency()
+
+	@property
+	def threshold(self) -> float:
+		return self.liftwing.threshold
+
+	def start(self) -> None:
+		self.analyser.start()
+
+	def resolve(self, result: dict):
+		"""Turn an analysis result into (score, language), or None if the text is too short."""
+		if result is None or result["length"] < MIN_LENGTH:
+			return None
+		if len(result["detections"]) > 0:
+			language, score = result["detections"][0]
+			return score, language
+		start = time.monotonic()
+		score, language = self.liftwing.get_result(result["plain"])
+		self.fallback_latency.observe(time.monotonic() - start)
+		if score is None or language is None:
+			return None
+		return score, language
+
+	def identify(self, text: str, callback) -> None:
+		"""Identify the language of `text` in the background and call `callback(score, language)`."""
+		start = time.monotonic()
+		def done(result: dict):
+			identified = self.resolve(result)
+			self.latency.observe(time.monotonic() - start)
+			if identified is not None:
+				callback(*identified)
+		self.analyser.submit(text, done)
+
+	def identify_many(self, texts: list) -> list:
+		"""Identify several texts at once; returns a (score, language) tuple or None for each.
+
+The texts are analysed in parallel, so the call is timed as a whole.
+"""
+		start = time.monotonic()
+		identified = [self.resolve(result) for result in self.analyser.analyse_many(texts)]
+		if texts:
+			self.latency.observe(time.monotonic() - start)
+		return identified
+
+	def summary(self) -> str:
+		return f"{self.latency}; LiftWing: {self.fallback_latency}"
+
+
+identifier = None
+
+def get_language_identifier() -> LanguageIdentifier:
+	global identifier
+	if identifier is None:
+		identifier = LanguageIdentifier()
+	return identifier
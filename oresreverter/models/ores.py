@@ -2,10 +2,15 @@
 # -*- coding: utf-8  -*-
 from .base import RevertModelConfig
 from typing import Tuple
-import requests
+import pywikibot
+from ..transport import get_transport
 
 class OresBaseConfig(RevertModelConfig):
 	"""Configuration for the ORES model."""
+	batch_url = "https://ores.wikimedia.org/v3/scores/{dbname}/"
+	batch_size = 50 # revisions per ORES request
+	needs_config = True
+
 	def __init__(self):
 		self.url = "https://ores.wikimedia.org/v3/scores/{dbname}/{revid}/{type}"
 		self.type = None
@@ -20,16 +25,30 @@ class OresBaseConfig(RevertModelConfig):
 	def likely_constructive(self, score:float) -> bool:
 		return score <= self.cfg[self.type]['minimal']
 
-	def get_score(self, lang: str, revid: int) -> float:
-		score, _ = self.get_result(lang, revid)
-		return score
+	def get_embedded_result(self, rcscores: dict) -> Tuple[float, bool]:
+		"""Read the score from the oresscores returned by list=recentchanges.
 
-	def get_result(self, lang: str, revid: int) -> Tuple[float, bool]:
+The RC row only has the probabilities, so the prediction is the more likely class.
+Returns None if the row does not contain a score for this model.
+"""
+		if not isinstance(rcscores, dict) or self.type not in rcscores:
+			return None
+		try:
+			probability = rcscores[self.type]
+			score = float(probability["true"])
+			return score, score > float(probability["false"])
+		except (KeyError, TypeError, ValueError):
+			return None
+
+	def get_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
+		embedded = self.get_embedded_result(rcscores)
+		if embedded is not None:
+			return embedded
 		score = None
 		prediction = False
-		dbname = lang + "wiki"
+		dbname = wiki or lang + "wiki"
 		url = self.url.format(dbname=dbname, revid=revid, type=self.type)
-		r = requests.get(url)
+		r = get_transport().get(url)
 		if r.status_code != 200:
 			raise ValueError(f"Obtaining the {self.get_name()} score for revision {revid} failed with code {r.status_code}")
 		try:
@@ -42,6 +61,59 @@ class OresBaseConfig(RevertModelConfig):
 			r.close()
 			return score, prediction
 
+	def fetch_results(self, lang: str, revids: list, types: list, wiki: str = None) -> dict:
+		"""Score several revisions with several ORES models using as few requests as possible.
+
+Returns {revid: {type: (score, prediction)}} for the scores ORES returned.
+"""
+		results = {}
+		dbname = wiki or lang + "wiki"
+		url = self.batch_url.format(dbname=dbname)
+		for start in range(0, len(revids), self.batch_size):
+			chunk = revids[start:start + self.batch_size]
+			params = {"models": "|".join(types), "revids": "|".join(str(revid) for revid in chunk)}
+			try:
+				r = get_transport().get(url, params=params)
+			except Exception as e:
+				# the chunk falls back to single requests, the next chunks may still work
+				pywikibot.error(f"Obtaining the {self.get_name()} scores for {len(chunk)} revisions "
+								f"failed with error {e}. URL was {url}")
+				continue
+			try:
+				if r.status_code != 200:
+					raise ValueError(f"code {r.status_code}")
+				scores = r.json()[dbname]["scores"]
+			except Exception as e:
+				pywikibot.error(f"Obtaining the {self.get_name()} scores for {len(chunk)} revisions "
+								f"failed with error {e}. URL was {r.url}")
+				continue
+			finally:
+				r.close()
+			for revid in chunk:
+				for type in types:
+					try:
+						score = scores[str(revid)][type]["score"]
+						results.setdefault(revid, {})[type] = (score["probability"]["true"], score["prediction"])
+					except (KeyError, TypeError):
+						pass
+		return results
+
+	def get_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+					wiki: str = None) -> dict:
+		rcscores = rcscores or {}
+		results = {}
+		missing = []
+		for revid in revids:
+			embedded = self.get_embedded_result(rcscores.get(revid))
+			if embedded is None:
+				missing.append(revid)
+			else:
+				results[revid] = embedded
+		if missing:
+			for revid, scores in self.fetch_results(lang, missing, [self.type], wiki).items():
+				results[revid] = scores[self.type]
+		return results
+
 class OresDamagingConfig(OresBaseConfig):
 	def __init__(self):
 		super(OresDamagingConfig, self).__init__()
@@ -62,7 +134,7 @@ class OresGoodfaithConfig(OresBaseConfig):
 
 class OresConfig(OresBaseConfig):
 	def __init__(self):
-		super(OresBaseConfig, self).__init__()
+		super(OresConfig, self).__init__()
 		self.type = ""
 		self.gf = OresGoodfaithConfig()
 		self.dmg = OresDamagingConfig()
@@ -85,9 +157,34 @@ class OresConfig(OresBaseConfig):
 		self.dmg.set_config(config)
 		self.gf.set_config(config)
 
-	def get_result(self, lang: str, revid: int) -> Tuple[float, bool]:
-		gf_score, gf_prediction = self.gf.get_result(lang, revid)
-		dmg_score, dmg_prediction = self.dmg.get_result(lang, revid)
+	def get_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> Tuple[float, bool]:
+		gf_score, gf_prediction = self.gf.get_result(lang, revid, rcscores, wiki)
+		dmg_score, dmg_prediction = self.dmg.get_result(lang, revid, rcscores, wiki)
 		score = dmg_score
 		prediction = gf_prediction and dmg_prediction
 		return score, prediction
+
+	def get_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+					wiki: str = None) -> dict:
+		rcscores = rcscores or {}
+		partial = {}
+		missing = []
+		for revid in revids:
+			gf = self.gf.get_embedded_result(rcscores.get(revid))
+			dmg = self.dmg.get_embedded_result(rcscores.get(revid))
+			if gf is None or dmg is None:
+				missing.append(revid)
+			else:
+				partial[revid] = {self.gf.type: gf, self.dmg.type: dmg}
+		# goodfaith and damaging for the whole batch in the same requests
+		if missing:
+			partial.update(self.fetch_results(lang, missing, [self.gf.type, self.dmg.type], wiki))
+
+		results = {}
+		for revid, scores in partial.items():
+			if self.gf.type not in scores or self.dmg.type not in scores:
+				continue
+			_, gf_prediction = scores[self.gf.type]
+			dmg_score, dmg_prediction = scores[self.dmg.type]
+			results[revid] = (dmg_score, gf_prediction and dmg_prediction)
+		return results
@@ -1,10 +1,9 @@
 #!/usr/bin/python3
 # -*- coding: utf-8  -*-
 
-import json
 import pywikibot
-import requests
 from .base import RevertModelConfig
+from ..transport import get_transport
 
 
 class RevertriskBaseConfig(RevertModelConfig):
@@ -22,17 +21,12 @@ class RevertriskBaseConfig(RevertModelConfig):
 	def likely_constructive(self, score:float) -> bool:
 		return score <= 1 - self.threshold
 
-	def get_score(self, lang: str, revid: int) -> float:
-		score, _ = self.get_result(lang, revid)
-		return score
-
-	def get_result(self, lang: str, revid: int) -> (float, bool):
+	def get_result(self, lang: str, revid: int, rcscores: dict = None, wiki: str = None) -> (float, bool):
 		score = None
 		prediction = False
 		url = self.url.format(model=self.type)
-		headers = {'Content-Type': 'application/json', 'User-Agent': 'PatrocleBot (patroclebot@strainu.ro)' }
 		data = {"lang": lang, "rev_id": revid}
-		r = requests.post(url=url, headers=headers, data=json.dumps(data))
+		r = get_transport().post(url=url, json=data)
 		if r.status_code != 200:
 			pywikibot.error(f"Obtaining the {self.get_name()} score for revision {revid} from {url} failed with code {r.status_code}")
 			return 0, None
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+# type: ignore
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pywikibot
+from .change import Change
+from .config import BotConfig
+from .metrics import get_metrics
+
+
+class BatchStats:
+	"""Wall-clock statistics for one recent changes batch."""
+
+	def __init__(self):
+		self.count = 0
+		self.scored = 0
+		self.build_s = 0.0
+		self.score_s = 0.0
+		self.treat_s = 0.0
+		self.total_s = 0.0
+
+	def __str__(self) -> str:
+		return (f"{self.count} changes ({self.scored} scored) in {self.total_s:.2f}s: "
+				f"build {self.build_s:.2f}s, scoring {self.score_s:.2f}s, "
+				f"decisions {self.treat_s:.2f}s")
+
+
+class ScoringPipeline:
+	"""Score a recent changes batch concurrently while treating the changes in RC order.
+
+The changes to score are split in chunks of the model's `batch_size` (one
+request for models with a batch endpoint, like ORES; a single revision
+for the others), scored by at most `scoring_concurrency` threads through
+the model's batch API. The calling thread treats each change as soon as
+its chunk is scored, while the next chunks are still being scored.
+Changes a chunk could not score fall back to a single request in
+Change.treat().
+"""
+
+	change_class = Change
+
+	def __init__(self, site, cfg: BotConfig, recorder=None):
+		self._site = site
+		self._cfg = cfg
+		self.recorder = recorder
+		self._executor = None
+		self._workers = 0
+
+	@property
+	def workers(self) -> int:
+		return max(1, int(self._cfg.scoring_concurrency))
+
+	def executor(self) -> ThreadPoolExecutor:
+		# the limit can change when the config page is reloaded
+		if self._executor is None or self._workers != self.workers:
+			if self._executor is not None:
+				self._executor.shutdown(wait=False)
+			self._workers = self.workers
+			self._executor = ThreadPoolExecutor(max_workers=self._workers,
+												thread_name_prefix="pipeline")
+		return self._executor
+
+	def submit(self, changes: list) -> dict:
+		"""Start scoring the changes that need a score; returns {change: future of its chunk}."""
+		pending = [change for change in changes if change.needs_score]
+		size = max(1, int(self._cfg.model.batch_size))
+		futures = {}
+		for start in range(0, len(pending), size):
+			chunk = pending[start:start + size]
+			future = self.executor().submit(self._score_chunk, chunk)
+			futures.update((change, future) for change in chunk)
+		return futures
+
+	def _score_chunk(self, chunk: list) -> None:
+		results = self._cfg.model.get_cached_results(lang=self._site.lang,
+													 revids=[change.revid for change in chunk],
+													 rcscores={change.revid: change.rcscores for change in chunk},
+													 workers=self.workers,
+													 wiki=self._site.dbName())
+		for change in chunk:
+			score, _ = results.get(change.revid, (None, None))
+			if score is not None:
+				change.set_score(score)
+
+	def score(self, changes: list) -> int:
+		"""Score the changes and wait for all of them; returns how many needed a score."""
+		futures = self.submit(changes)
+		for future in set(futures.values()):
+			future.result()
+		return len(futures)
+
+	def run(self, infos: list) -> BatchStats:
+		stats = BatchStats()
+		start = time.monotonic()
+		if self.recorder is not None:
+			self.recorder.record_batch(infos)
+		changes = [self.change_class(self._site, info, self._cfg) for info in infos]
+		stats.count = len(changes)
+		stats.build_s = time.monotonic() - start
+
+		score_start = time.monotonic()
+		futures = self.submit(changes)
+		stats.scored = len(futures)
+		for change in changes:
+			future = futures.get(change)
+			if future is not None:
+				try:
+					future.result()
+				except Exception as e:
+					# scored again by treat()
+					pywikibot.error(f"Scoring {change.revid} with its batch failed: {e}")
+			treat_start = time.monotonic()
+			get_metrics().observe_lag(change.lag)
+			change.treat()
+			stats.treat_s += time.monotonic() - treat_start
+		# the scoring wait is what is left once the decisions are taken out
+		stats.score_s = time.monotonic() - score_start - stats.treat_s
+		# one write for the patrols of the whole batch
+		self._cfg.patrols.flush()
+		stats.total_s = time.monotonic() - start
+		return stats
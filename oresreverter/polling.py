@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import math
+import time
+from datetime import datetime
+
+from .metrics import get_metrics
+
+
+def rc_time(info: dict) -> float:
+	return datetime.fromisoformat(info["timestamp"].replace("Z", "+00:00")).timestamp()
+
+
+class AdaptivePoller:
+	"""Choose when to poll the recent changes again from the observed edit rate.
+
+An edit waits on average half a polling interval before it is seen, plus
+the time to treat its batch, so the interval is 2 * (target_latency_s -
+processing time). It is shortened further when, at the current edit rate
+(an EWMA over the RC timestamps, with time constant `tau_s`), a batch would
+be more than `fill` of rc_limit, and kept between rc_interval_min and
+rc_interval_max. A full batch means we are behind: poll again at once.
+"""
+
+	def __init__(self, target_latency_s: float = 30, tau_s: float = 300, fill: float = 0.8):
+		self.target_latency_s = target_latency_s
+		self.tau_s = tau_s
+		self.fill = fill
+		self.rate = 0.0 # edits per second
+		self.processing_s = 0.0
+		self.interval_s = None
+		self.polls = 0
+		self.immediate = 0
+		self.total_interval_s = 0.0
+		self._last_poll = None
+		self._newest = None
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `polling` section of the config page."""
+		for key in ("target_latency_s", "tau_s", "fill"):
+			if key in config:
+				setattr(self, key, float(config[key]))
+
+	def observe(self, infos: list, processing_s: float = 0.0, now: float = None) -> None:
+		"""Update the estimates with a polled batch (the new changes) and the time it took to treat it."""
+		now = time.monotonic() if now is None else now
+		elapsed = now - self._last_poll if self._last_poll is not None else None
+		self._last_poll = now
+		newest = max((rc_time(info) for info in infos), default=None)
+		if newest is not None and self._newest is not None:
+			span = max(newest - self._newest, 1.0)
+		else:
+			span = elapsed
+		if span:
+			weight = 1 - math.exp(-span / self.tau_s)
+			self.rate += weight * (len(infos) / span - self.rate)
+		if newest is not None:
+			self._newest = max(newest, self._newest or newest)
+		self.processing_s += 0.3 * (processing_s - self.processing_s)
+
+	def next_interval(self, count: int, rc_limit: int, min_s: float, max_s: float) -> float:
+		"""Seconds to wait before the next poll, after a batch of `count` changes."""
+		self.polls += 1
+		if count >= rc_limit:
+			self.immediate += 1
+			interval = 0.0
+		else:
+			interval = 2 * max(self.target_latency_s - self.processing_s, 0)
+			if self.rate > 0:
+				interval = min(interval, self.fill * rc_limit / self.rate)
+			interval = min(max(interval, min_s), max_s)
+		self.interval_s = interval
+		self.total_interval_s += interval
+		metrics = get_metrics()
+		metrics.poll_interval.observe(interval)
+		metrics.edit_rate.set(self.rate)
+		return interval
+
+	def summary(self) -> str:
+		average = self.total_interval_s / self.polls if self.polls else 0
+		return (f"{self.polls} interogări ({self.immediate} imediate), interval mediu {average:.1f}s, "
+				f"{self.rate * 60:.1f} modificări/minut")
+
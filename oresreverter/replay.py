@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+# type: ignore
+"""Record real recent changes and model traffic, then replay them offline to benchmark the pipeline.
+
+Recording: run main.py with -record:<file>. The config page, every RC batch
+and every HTTP exchange of the shared transport (model scores, warning
+level lookups) are appended to <file> as JSON lines.
+
+Replay:
+
+    python3 -m oresreverter.replay <file> [--model NAME] [--concurrency N]
+                                          [--model-latency S] [--write-latency S]
+
+The batches go through BotConfig, ScoringPipeline, the real models and
+Change.decide()/apply(), but HTTP answers come from the recording and the
+wiki is a fake site that only counts and delays the calls. The report
+gives edits/second, p50/p95/p99 per stage and API calls per edit. Change.apply()
+only queues the writes ("submit"); the write queue is drained after each
+batch ("writes (batch)"), so "edit" includes the wiki writes.
+"""
+
+import argparse
+import io
+import json
+import math
+import threading
+import time
+
+import pywikibot
+import requests
+
+from .change import Change
+from .config import BotConfig
+from .pipeline import ScoringPipeline
+from .transport import Transport, set_transport
+
+
+def request_key(method: str, url: str, params: dict = None, body=None) -> str:
+	"""A canonical key for an HTTP request, used to find its recorded answer."""
+	params = sorted((str(key), str(value)) for key, value in (params or {}).items())
+	return json.dumps([method.upper(), url, params, body], sort_keys=True)
+
+
+class Recorder:
+	"""Append the bot's inputs to a JSON lines file."""
+
+	def __init__(self, path: str):
+		self.path = path
+		self._file = open(path, "a", encoding="utf-8")
+		self._lock = threading.Lock()
+
+	def write(self, record: dict) -> None:
+		with self._lock:
+			self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+			self._file.flush()
+
+	def record_config(self, site, text: str) -> None:
+		self.write({"kind": "config", "lang": site.lang, "dbname": site.dbName(), "text": text})
+
+	def record_batch(self, infos: list) -> None:
+		self.write({"kind": "batch", "time": time.time(), "rows": infos})
+
+	def record_http(self, key: str, status: int, body: str) -> None:
+		self.write({"kind": "http", "key": key, "status": status, "body": body})
+
+
+class RecordingTransport(Transport):
+	"""The shared transport, also writing every exchange to a Recorder."""
+
+	def __init__(self, recorder: Recorder, **kwargs):
+		super(RecordingTransport, self).__init__(**kwargs)
+		self.recorder = recorder
+
+	def request(self, method: str, url: str, **kwargs) -> requests.Response:
+		r = super(RecordingTransport, self).request(method, url, **kwargs)
+		if not kwargs.get("stream"):
+			key = request_key(method, url, kwargs.get("params"), kwargs.get("json"))
+			self.recorder.record_http(key, r.status_code, r.text)
+		return r
+
+
+class ReplayTransport(Transport):
+	"""Answer HTTP requests from a recording, after an injected latency."""
+
+	def __init__(self, exchanges: dict, latency_s: float = 0):
+		super(ReplayTransport, self).__init__()
+		self.exchanges = exchanges
+		self.latency_s = latency_s
+		self.calls = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+
+	def request(self, method: str, url: str, **kwargs) -> requests.Response:
+		key = request_key(method, url, kwargs.get("params"), kwargs.get("json"))
+		with self._lock:
+			self.calls += 1
+			if key not in self.exchanges:
+				self.misses += 1
+		time.sleep(self.latency_s)
+		status, body = self.exchanges.get(key, (404, ""))
+		r = requests.Response()
+		r.status_code = status
+		r.url = url
+		r.encoding = "utf-8"
+		# a body to close, as with a real response
+		r.raw = io.BytesIO(body.encode("utf-8"))
+		r._content = body.encode("utf-8")
+		return r
+
+
+class FakeSite:
+	"""The subset of APISite used by Change; counts and delays the calls."""
+
+	def __init__(self, lang: str, dbname: str, latency_s: float = 0):
+		self.lang = lang
+		self._dbname = dbname
+		self.latency_s = latency_s
+		self.siteinfo = {"timeoffset": 0}
+		self.calls = {}
+		self._lock = threading.Lock()
+
+	def call(self, action: str) -> None:
+		with self._lock:
+			self.calls[action] = self.calls.get(action, 0) + 1
+		time.sleep(self.latency_s)
+
+	def dbName(self) -> str:
+		return self._dbname
+
+	@property
+	def sitename(self) -> str:
+		return self._dbname
+
+	def username(self) -> str:
+		return "ReplayBot"
+
+	def namespace(self, num: int) -> str:
+		return {2: "Utilizator", 3: "Discuție Utilizator"}.get(num, "")
+
+	def login(self) -> None:
+		self.call("login")
+
+	@property
+	def tokens(self) -> dict:
+		return {"rollback": "+\\", "patrol": "+\\"}
+
+	def simple_request(self, **params) -> "FakeRequest":
+		return FakeRequest(self, params)
+
+
+class FakeRequest:
+	def __init__(self, site: FakeSite, params: dict):
+		self.site = site
+		self.params = params
+
+	def submit(self) -> dict:
+		self.site.call(self.params["action"])
+		return {}
+
+
+class FakePage:
+	def __init__(self, site: FakeSite, title: str, text: str = ""):
+		self.site = site
+		self._title = title
+		self.text = text
+		self.latest_revision_id = 1
+
+	def title(self) -> str:
+		return self._title
+
+	def exists(self) -> bool:
+		return True
+
+	def get(self) -> str:
+		return self.text
+
+	def isRedirectPage(self) -> bool:
+		return False
+
+	def contributors(self) -> dict:
+		return {"creator": 1}
+
+	def put(self, text: str, **kwargs) -> None:
+		self.site.call("edit")
+
+
+class FakeUser:
+	def __init__(self, site: FakeSite, username: str):
+		self.site = site
+		self.username = username
+
+	def warn_or_report(self, article: str) -> None:
+		self.site.call("warn")
+
+
+class ReplayChange(Change):
+	def make_page(self, title: str) -> FakePage:
+		return FakePage(self._site, title)
+
+	def make_user(self, username: str) -> FakeUser:
+		return FakeUser(self._site, username)
+
+
+class ReplayConfig(BotConfig):
+	"""BotConfig reading the recorded config page; nothing is persisted or published."""
+
+	def __init__(self, site: FakeSite, text: str, model_name: str = None):
+		self._text = text
+		super(ReplayConfig, self).__init__(site, "MediaWiki:Revertbot.json", model_name)
+
+	def config_revision(self) -> int:
+		self._config_page = FakePage(self.site, self.page, self._text)
+		return 1
+
+	def apply_config(self, data: dict):
+		for key in ("score_cache", "delayed_jobs", "rc_cursor", "metrics", "report_interval", "write_queue"):
+			data.pop(key, None)
+		# these would need real pages and Wikidata items
+		data["enabled_tools"] = dict(data.get("enabled_tools", {}), blp_add=False, new_article_watch=False)
+		super(ReplayConfig, self).apply_config(data)
+		self.reporter.interval = math.inf
+		# only --write-latency limits the writes
+		self.writes.bucket.rate = 1e9
+
+
+def load_recording(path: str):
+	config, batches, exchanges = None, [], {}
+	with open(path, encoding="utf-8") as f:
+		for line in f:
+			record = json.loads(line)
+			if record["kind"] == "config":
+				config = record
+			elif record["kind"] == "batch":
+				batches.append(record["rows"])
+			elif record["kind"] == "http":
+				exchanges[record["key"]] = (record["status"], record["body"])
+	if config is None:
+		raise ValueError(f"{path} has no recorded config page")
+	return config, batches, exchanges
+
+
+def percentile(values: list, p: float) -> float:
+	if not values:
+		return 0.0
+	values = sorted(values)
+	return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def replay(path: str, model_name: str = None, concurrency: int = None,
+		   model_latency_s: float = 0, write_latency_s: float = 0) -> dict:
+	config, batches, exchanges = load_recording(path)
+	transport = ReplayTransport(exchanges, model_latency_s)
+	set_transport(transport)
+	site = FakeSite(config["lang"], config["dbname"], write_latency_s)
+	cfg = ReplayConfig(site, config["text"], model_name)
+	if concurrency:
+		cfg.scoring_concurrency = concurrency
+	pipeline = ScoringPipeline(site, cfg)
+	pipeline.change_class = ReplayChange
+
+	stages = {"score (batch)": [], "decide": [], "submit": [], "writes (batch)": [], "edit": []}
+	edits = 0
+	errors = 0
+	start = time.monotonic()
+	for infos in batches:
+		batch_start = time.monotonic()
+		changes = [ReplayChange(site, info, cfg) for info in infos]
+		pipeline.score(changes)
+		stages["score (batch)"].append(time.monotonic() - batch_start)
+		for change in changes:
+			decide_start = time.monotonic()
+			try:
+				action = change.decide()
+			except Exception as e:
+				# e.g. a score request that was not recorded
+				errors += 1
+				pywikibot.error(f"Could not decide on {change.article.title()}@{change.revid}: {e}")
+				continue
+			submit_start = time.monotonic()
+			# only queues the writes
+			change.apply(action)
+			stages["decide"].append(submit_start - decide_start)
+			stages["submit"].append(time.monotonic() - submit_start)
+		# the write queue carries them out, wait until it is done with the batch
+		writes_start = time.monotonic()
+		cfg.patrols.flush()
+		cfg.writes.join()
+		stages["writes (batch)"].append(time.monotonic() - writes_start)
+		# an edit is handled once the writes of its batch are done
+		stages["edit"].extend([time.monotonic() - batch_start] * len(changes))
+		edits += len(changes)
+	wall_s = time.monotonic() - start
+
+	api_calls = transport.calls + sum(site.calls.values())
+	return {
+		"edits": edits,
+		"wall_s": wall_s,
+		"edits_per_s": edits / wall_s if wall_s else 0,
+		"stages": {name: {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+				   for name, values in stages.items()},
+		"http_calls": transport.calls,
+		"http_misses": transport.misses,
+		"errors": errors,
+		"site_calls": site.calls,
+		"api_calls_per_edit": api_calls / edits if edits else 0,
+	}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Replay a recording through the Change pipeline.")
+	parser.add_argument("recording")
+	parser.add_argument("--model", default=None, help="override the model_name of the recorded config")
+	parser.add_argument("--concurrency", type=int, default=None, help="override scoring_concurrency")
+	parser.add_argument("--model-latency", type=float, default=0, help="seconds added to every HTTP call")
+	parser.add_argument("--write-latency", type=float, default=0, help="seconds added to every wiki call")
+	args = parser.parse_args()
+	result = replay(args.recording, args.model, args.concurrency, args.model_latency, args.write_latency)
+	print(f"{result['edits']} edits in {result['wall_s']:.2f}s: {result['edits_per_s']:.1f} edits/s")
+	for name, percentiles in result["stages"].items():
+		print(f"  {name:>14}: " + ", ".join(f"{p} {value * 1000:.1f}ms" for p, value in percentiles.items()))
+	print(f"  {result['api_calls_per_edit']:.2f} API calls per edit "
+		  f"({result['http_calls']} HTTP, {result['http_misses']} not recorded; wiki {result['site_calls']})")
+	print(f"  {result['errors']} edits could not be decided")
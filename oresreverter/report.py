@@ -6,23 +6,29 @@ import pywikibot
 from pywikibot import config
 from datetime import datetime
 from datetime import timezone
+from .writes import append_text
 
 class BotReporter(object):
 	"""A singleton alowing the bot to write reports"""
 
-	def __init__(self, report_interval_s, tz):
-		if config.family in config.usernames:
-			family = config.usernames[config.family]
+	def __init__(self, report_interval_s, tz, site=None):
+		self.site = site
+		if site is not None:
+			self.user = site.username()
 		else:
-			family = config.usernames['*']
-
-		if config.mylang in family:
-			self.user = family[config.mylang]
-		else:
-			self.user = family['*']
+			if config.family in config.usernames:
+				family = config.usernames[config.family]
+			else:
+				family = config.usernames['*']
+
+			if config.mylang in family:
+				self.user = family[config.mylang]
+			else:
+				self.user = family['*']
 		self.interval_s = report_interval_s
 		self.tz = tz
 		self.dry_run = False
+		self.stats_sources = {}
 		self.reset_report()
 
 	def reset_report(self):
@@ -79,6 +85,10 @@ class BotReporter(object):
 
 		self.maybe_publish_report()
 
+	def register_stats(self, label: str, source) -> None:
+		"""Add a line to the report; `source` is called to build its text."""
+		self.stats_sources[label] = source
+
 	def report_no_revert(self):
 		self.all_changes += 1
 		# This is by far the most common case, so no report publishing here; wait for an error instead
@@ -93,6 +103,10 @@ class BotReporter(object):
 		txt += f"*''Patrulări eșuate'': {self.patrol_fail} ({{{{dim|{self.patrol_fail * 100 / self.all_changes}|%}}}})\n"
 		txt += f"*''Schimbări verificate'': {self.all_changes} ({{{{dim|100|%}}}})\n"
 		txt += f"*''Formate BPV adăugate'': {self.bpv_added}\n"
+		for label, source in self.stats_sources.items():
+			stats = source()
+			if stats:
+				txt += f"*''{label}'': {stats}\n"
 		txt += "~~~~\n"
 		
 		return txt
@@ -113,10 +127,9 @@ class BotReporter(object):
 
 	def publish_wiki_report(self) -> None:
 		try:
-			page = pywikibot.Page(pywikibot.Site(), f"Utilizator:{self.user}/Rapoarte")
-			txt = page.get()
-			txt += self.build_report()
-			page.put(txt, "Adaug un raport de rulare")
+			site = self.site or pywikibot.Site()
+			page = pywikibot.Page(site, f"{site.namespace(2)}:{self.user}/Rapoarte")
+			append_text(page, self.build_report(), "Adaug un raport de rulare")
 			self.reset_report()
 		except Exception as e:
 			print("Exception while saving report", e)
@@ -130,11 +143,8 @@ class BotReporter(object):
 	def interval(self, report_interval_s):
 		self.interval_s = report_interval_s
 
-reporter = BotReporter(7 * 24 * 3600, timezone.utc)
-
-def get_reporter(timezone=None, dry_run=False) -> BotReporter:
-	if timezone:
-		reporter.tz = timezone
-		reporter.dry_run = dry_run
-		reporter.reset_report()
+def new_reporter(site, timezone, dry_run=False) -> BotReporter:
+	"""A reporter for one wiki, publishing on that wiki."""
+	reporter = BotReporter(7 * 24 * 3600, timezone, site=site)
+	reporter.dry_run = dry_run
 	return reporter
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+import pywikibot
+from .metrics import get_metrics
+
+
+class DelayedJobScheduler:
+	"""Run "check again in N minutes" jobs on a small fixed pool of worker threads.
+
+Jobs are (kind, arguments) pairs kept in a heap ordered by due time; the
+handler for each kind is registered at startup, so a job only holds JSON
+data. When `path` is set, the pending and running jobs are written to that
+file after every change and loaded again on the next start, so a restart
+does not lose them. Jobs that are already overdue run as soon as a worker
+is free.
+"""
+
+	def __init__(self, workers: int = 2, path: str = None):
+		self.workers = workers
+		self.path = None
+		self.executed = 0
+		self.failed = 0
+		self.last_lag_s = 0.0
+		self.max_lag_s = 0.0
+		self._heap = []
+		self._running = {}
+		self._handlers = {}
+		self._seq = itertools.count()
+		self._cond = threading.Condition()
+		self._threads = []
+		if path:
+			self.load(path)
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `delayed_jobs` section of the config page."""
+		if "workers" in config:
+			self.workers = int(config["workers"])
+			if self._threads:
+				self.start()
+		if config.get("path") and config["path"] != self.path:
+			self.load(config["path"])
+
+	def register(self, kind: str, handler) -> None:
+		"""`handler(**args)` runs the jobs of this kind."""
+		self._handlers[kind] = handler
+
+	def schedule(self, kind: str, delay_s: float, **args) -> None:
+		job = {"kind": kind, "due": time.time() + delay_s, "args": args}
+		with self._cond:
+			heapq.heappush(self._heap, (job["due"], next(self._seq), job))
+			self._save()
+			get_metrics().delayed_jobs_depth.set(self.depth)
+			self._cond.notify()
+
+	@property
+	def depth(self) -> int:
+		return len(self._heap) + len(self._running)
+
+	def load(self, path: str) -> None:
+		with self._cond:
+			self.path = path
+			if not os.path.exists(path):
+				return
+			try:
+				with open(path, encoding="utf-8") as f:
+					jobs = json.load(f)
+			except (OSError, ValueError) as e:
+				pywikibot.error(f"Could not load the delayed jobs from {path}: {e}")
+				return
+			for job in jobs:
+				heapq.heappush(self._heap, (job["due"], next(self._seq), job))
+			get_metrics().delayed_jobs_depth.set(self.depth)
+			self._cond.notify_all()
+		pywikibot.output(f"Loaded {len(jobs)} delayed jobs from {path}")
+
+	def _save(self) -> None:
+		# called with the lock held
+		if not self.path:
+			return
+		jobs = [job for _, _, job in self._heap] + list(self._running.values())
+		tmp = self.path + ".tmp"
+		try:
+			with open(tmp, "w", encoding="utf-8") as f:
+				json.dump(jobs, f)
+			os.replace(tmp, self.path)
+		except OSError as e:
+			pywikibot.error(f"Could not save the delayed jobs to {self.path}: {e}")
+
+	def start(self) -> None:
+		"""Start the workers; extra ones are added if the configured count grew."""
+		while len(self._threads) < self.workers:
+			thread = threading.Thread(target=self._work, name=f"delayed-{len(self._threads)}", daemon=True)
+			self._threads.append(thread)
+			thread.start()
+
+	def _next_job(self):
+		with self._cond:
+			while True:
+				if self._heap and self._heap[0][0] <= time.time():
+					_, seq, job = heapq.heappop(self._heap)
+					self._running[seq] = job
+					self._save()
+					return seq, job
+				timeout = self._heap[0][0] - time.time() if self._heap else None
+				self._cond.wait(timeout)
+
+	def _work(self) -> None:
+		while True:
+			seq, job = self._next_job()
+			self.last_lag_s = time.time() - job["due"]
+			self.max_lag_s = max(self.max_lag_s, self.last_lag_s)
+			get_metrics().delayed_job_lag.set(self.last_lag_s)
+			get_metrics().delayed_job_max_lag.set(self.max_lag_s)
+			handler = self._handlers.get(job["kind"])
+			try:
+				if handler is None:
+					raise KeyError(f"no handler for {job['kind']} jobs")
+				handler(**job["args"])
+				self.executed += 1
+			except Exception as e:
+				self.failed += 1
+				pywikibot.error(f"Delayed job {job['kind']} {job['args']} failed: {e}")
+			finally:
+				with self._cond:
+					del self._running[seq]
+					self._save()
+					get_metrics().delayed_jobs_depth.set(self.depth)
+
+	def summary(self) -> str:
+		return (f"{self.depth} în așteptare, {self.executed} executate, {self.failed} eșuate, "
+				f"întârziere {self.last_lag_s:.0f}s (maxim {self.max_lag_s:.0f}s)")
+
+
+scheduler = DelayedJobScheduler()
+
+def get_scheduler() -> DelayedJobScheduler:
+	return scheduler
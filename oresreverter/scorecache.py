@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ScoreCache:
+	"""Cache of model results keyed by (model, wiki, revid), `wiki` being the dbname.
+
+The scores of a revision never change, so a result obtained once can be
+reused when several models share a backend, when RC polls overlap or
+after a restart. Lookups go to an in-memory LRU first, then to an
+optional SQLite file whose rows expire after `ttl_s` seconds.
+"""
+	evict_every = 1000 # writes between two expiry passes on disk
+
+	def __init__(self, size: int = 10000, path: str = None, ttl_s: int = 7 * 24 * 3600):
+		self.size = size
+		self.ttl_s = ttl_s
+		self.path = None
+		self.hits = 0
+		self.misses = 0
+		self._memory = OrderedDict()
+		self._db = None
+		self._writes = 0
+		self._lock = threading.Lock()
+		if path:
+			self.open(path)
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `score_cache` section of the config page."""
+		with self._lock:
+			if "size" in config:
+				self.size = int(config["size"])
+				while len(self._memory) > self.size:
+					self._memory.popitem(last=False)
+			if "ttl_days" in config:
+				self.ttl_s = int(float(config["ttl_days"]) * 24 * 3600)
+		if config.get("path") and config["path"] != self.path:
+			self.open(config["path"])
+
+	def open(self, path: str) -> None:
+		db = sqlite3.connect(path, check_same_thread=False)
+		# several worker processes may share the file
+		db.execute("PRAGMA journal_mode=WAL")
+		columns = [row[1] for row in db.execute("PRAGMA table_info(scores)")]
+		if columns and "wiki" not in columns:
+			# keyed by language before, it is only a cache
+			db.execute("DROP TABLE scores")
+		db.execute("CREATE TABLE IF NOT EXISTS scores ("
+				   "model TEXT, wiki TEXT, revid INTEGER, result TEXT, created REAL, "
+				   "PRIMARY KEY (model, wiki, revid))")
+		db.commit()
+		with self._lock:
+			if self._db is not None:
+				self._db.close()
+			self._db = db
+			self.path = path
+			self._evict()
+
+	def _evict(self) -> None:
+		self._db.execute("DELETE FROM scores WHERE created < ?", (time.time() - self.ttl_s,))
+		self._db.commit()
+
+	def _remember(self, key: tuple, result: tuple) -> None:
+		self._memory[key] = result
+		self._memory.move_to_end(key)
+		if len(self._memory) > self.size:
+			self._memory.popitem(last=False)
+
+	def get(self, model: str, wiki: str, revid: int):
+		"""Return the cached (score, prediction) tuple or None."""
+		key = (model, wiki, revid)
+		with self._lock:
+			if key in self._memory:
+				self._memory.move_to_end(key)
+				self.hits += 1
+				return self._memory[key]
+			if self._db is not None:
+				row = self._db.execute("SELECT result FROM scores WHERE model = ? AND wiki = ? AND revid = ? "
+									   "AND created >= ?",
+									   (model, wiki, revid, time.time() - self.ttl_s)).fetchone()
+				if row is not None:
+					result = tuple(json.loads(row[0]))
+					self._remember(key, result)
+					self.hits += 1
+					return result
+			self.misses += 1
+			return None
+
+	def put(self, model: str, wiki: str, revid: int, result: tuple) -> None:
+		score, prediction = result
+		# don't remember failures, the next call might succeed
+		if score is None or prediction is None:
+			return
+		key = (model, wiki, revid)
+		with self._lock:
+			self._remember(key, result)
+			if self._db is None:
+				return
+			self._db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)",
+							 (model, wiki, revid, json.dumps(result), time.time()))
+			self._db.commit()
+			self._writes += 1
+			if self._writes % self.evict_every == 0:
+				self._evict()
+
+	def summary(self) -> str:
+		total = self.hits + self.misses
+		rate = self.hits * 100 / total if total else 0
+		return f"{self.hits} găsite, {self.misses} lipsă ({{{{dim|{rate:.1f}|%}}}})"
+
+
+cache = ScoreCache()
+
+def get_score_cache() -> ScoreCache:
+	return cache
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .changetrack import ChangeTracker
+from .report import BotReporter
+from .userwarn import WarningCache
+
+
+class SharedStore:
+	"""State shared by the worker processes (see workers.py), in a SQLite file in WAL mode.
+
+Each process opens its own connection; WAL lets the readers go on while
+one process writes. Every check-and-set runs in a BEGIN IMMEDIATE
+transaction, so two workers can never both decide to warn or report the
+same user. The store hands out the tracker, warning cache and reporter
+that BotConfig uses instead of its in-process ones.
+"""
+
+	def __init__(self, path: str, timeout_s: float = 30):
+		self.path = path
+		self._db = sqlite3.connect(path, timeout=timeout_s, isolation_level=None, check_same_thread=False)
+		self._db.execute("PRAGMA journal_mode=WAL")
+		self._db.execute("PRAGMA synchronous=NORMAL")
+		self._lock = threading.Lock()
+		with self.transaction() as db:
+			db.execute("CREATE TABLE IF NOT EXISTS tracked ("
+					   "wiki TEXT, page TEXT, user TEXT, at REAL, PRIMARY KEY (wiki, page, user))")
+			db.execute("CREATE INDEX IF NOT EXISTS tracked_at ON tracked (wiki, at)")
+			db.execute("CREATE TABLE IF NOT EXISTS reported ("
+					   "wiki TEXT, user TEXT, at REAL, PRIMARY KEY (wiki, user))")
+			db.execute("CREATE TABLE IF NOT EXISTS warnings ("
+					   "key TEXT PRIMARY KEY, level INTEGER, blocked INTEGER, at REAL)")
+			db.execute("CREATE TABLE IF NOT EXISTS leases ("
+					   "key TEXT PRIMARY KEY, owner TEXT, until REAL)")
+			db.execute("CREATE TABLE IF NOT EXISTS counters ("
+					   "wiki TEXT, name TEXT, value INTEGER, PRIMARY KEY (wiki, name))")
+			db.execute("CREATE TABLE IF NOT EXISTS periods (wiki TEXT PRIMARY KEY, start REAL)")
+
+	@contextlib.contextmanager
+	def transaction(self):
+		"""Run the statements of the block atomically, holding the database write lock."""
+		with self._lock:
+			self._db.execute("BEGIN IMMEDIATE")
+			try:
+				yield self._db
+			except BaseException:
+				self._db.execute("ROLLBACK")
+				raise
+			self._db.execute("COMMIT")
+
+	def tracker(self, site, tz, timeout_s: int = 120) -> ChangeTracker:
+		return SharedTracker(self, site.dbName(), tz, timeout_s)
+
+	def warnings(self, ttl_s: int = 3600) -> WarningCache:
+		return SharedWarningCache(self, ttl_s)
+
+	def reporter(self, site, tz, dry_run: bool = False) -> BotReporter:
+		reporter = SharedReporter(self, 7 * 24 * 3600, tz, site)
+		reporter.dry_run = dry_run
+		return reporter
+
+
+class SharedTracker(ChangeTracker):
+	"""ChangeTracker whose pairs and reports are kept in the SharedStore."""
+
+	def __init__(self, store: SharedStore, wiki: str, tz, timeout_s: int):
+		super(SharedTracker, self).__init__(tz, timeout_s)
+		self.store = store
+		self.wiki = wiki
+
+	def __repr__(self) -> str:
+		return f"SharedTracker({self.wiki} in {self.store.path}, timeout {self.timeout}s)"
+
+	def should_report_user(self, user) -> bool:
+		now = time.time()
+		with self.store.transaction() as db:
+			row = db.execute("SELECT at FROM reported WHERE wiki = ? AND user = ?", (self.wiki, user)).fetchone()
+			if row is not None and now - row[0] <= self.timeout:
+				return False
+			db.execute("INSERT OR REPLACE INTO reported VALUES (?, ?, ?)", (self.wiki, user, now))
+			return True
+
+	def add_change(self, page, user):
+		now = time.time()
+		with self.store.transaction() as db:
+			db.execute("INSERT OR REPLACE INTO tracked VALUES (?, ?, ?, ?)", (self.wiki, page, user, now))
+			db.execute("DELETE FROM tracked WHERE wiki = ? AND at < ?", (self.wiki, now - self.timeout))
+
+	def tracked_change(self, page, user):
+		with self.store.transaction() as db:
+			row = db.execute("SELECT at FROM tracked WHERE wiki = ? AND page = ? AND user = ?",
+							 (self.wiki, page, user)).fetchone()
+		return row is not None and time.time() - row[0] <= self.timeout
+
+	def cleanup_lists(self, now):
+		oldest = now.timestamp() - self.timeout
+		with self.store.transaction() as db:
+			db.execute("DELETE FROM tracked WHERE wiki = ? AND at < ?", (self.wiki, oldest))
+			db.execute("DELETE FROM reported WHERE wiki = ? AND at < ?", (self.wiki, oldest))
+
+
+class SharedWarningCache(WarningCache):
+	"""WarningCache kept in the SharedStore; `hold` is a lease on the user across processes."""
+
+	def __init__(self, store: SharedStore, ttl_s: int = 3600, lease_s: float = 120):
+		super(SharedWarningCache, self).__init__(ttl_s)
+		self.store = store
+		self.lease_s = lease_s
+
+	def get(self, user: str):
+		with self.store.transaction() as db:
+			row = db.execute("SELECT level, blocked, at FROM warnings WHERE key = ?", (user,)).fetchone()
+		if row is None or time.time() - row[2] > self.ttl_s:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return row[0], bool(row[1])
+
+	def set(self, user: str, level: int, blocked: bool = False) -> None:
+		with self.store.transaction() as db:
+			db.execute("INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?)", (user, level, int(blocked), time.time()))
+
+	def invalidate(self, user: str) -> None:
+		with self.store.transaction() as db:
+			db.execute("DELETE FROM warnings WHERE key = ?", (user,))
+
+	@contextlib.contextmanager
+	def hold(self, user: str):
+		owner = f"{os.getpid()}:{threading.get_ident()}"
+		while True:
+			now = time.time()
+			with self.store.transaction() as db:
+				row = db.execute("SELECT until FROM leases WHERE key = ?", (user,)).fetchone()
+				if row is None or row[0] < now:
+					# an expired lease belonged to a worker that died while warning
+					db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (user, owner, now + self.lease_s))
+					break
+			time.sleep(0.2)
+		try:
+			yield
+		finally:
+			with self.store.transaction() as db:
+				db.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (user, owner))
+
+
+class SharedReporter(BotReporter):
+	"""BotReporter adding its counts to the SharedStore; the worker that finds the
+period over publishes the report of all the workers.
+
+The counts are only written when a report_*() method would publish, so the
+frequent report_no_revert() calls stay in memory until the next one. The
+extra report lines (register_stats) come from the publishing worker.
+"""
+	counters = ("revert_success", "revert_fail", "patrol_success", "patrol_fail",
+				"near_revert", "all_changes", "bpv_added", "bpv_removed")
+
+	def __init__(self, store: SharedStore, report_interval_s, tz, site):
+		self.store = store
+		self.wiki = site.dbName()
+		super(SharedReporter, self).__init__(report_interval_s, tz, site=site)
+
+	def flush(self) -> None:
+		"""Add the local counts to the shared ones."""
+		deltas = {name: getattr(self, name) for name in self.counters if getattr(self, name)}
+		if not deltas:
+			return
+		with self.store.transaction() as db:
+			for name, value in deltas.items():
+				db.execute("INSERT INTO counters VALUES (?, ?, ?) "
+						   "ON CONFLICT (wiki, name) DO UPDATE SET value = value + excluded.value",
+						   (self.wiki, name, value))
+		for name in deltas:
+			setattr(self, name, 0)
+
+	def claim(self):
+		"""Take the shared counts if the report period is over; returns (start, counts) or None."""
+		now = time.time()
+		with self.store.transaction() as db:
+			row = db.execute("SELECT start FROM periods WHERE wiki = ?", (self.wiki,)).fetchone()
+			if row is None:
+				db.execute("INSERT INTO periods VALUES (?, ?)", (self.wiki, now))
+				return None
+			# in dry run mode, print a report every 100 changes like BotReporter does
+			if self.dry_run:
+				total = db.execute("SELECT value FROM counters WHERE wiki = ? AND name = 'all_changes'",
+								   (self.wiki,)).fetchone()
+				if total is None or total[0] < 100:
+					return None
+			elif now - row[0] < self.interval_s:
+				return None
+			counts = dict(db.execute("SELECT name, value FROM counters WHERE wiki = ?", (self.wiki,)).fetchall())
+			db.execute("DELETE FROM counters WHERE wiki = ?", (self.wiki,))
+			db.execute("UPDATE periods SET start = ? WHERE wiki = ?", (now, self.wiki))
+		return row[0], counts
+
+	def maybe_publish_report(self):
+		self.flush()
+		claimed = self.claim()
+		if claimed is None:
+			return
+		start, counts = claimed
+		for name in self.counters:
+			setattr(self, name, counts.get(name, 0))
+		self.start = datetime.fromtimestamp(start, self.tz)
+		self.end = datetime.now(self.tz)
+		if self.dry_run:
+			self.publish_cli_report()
+		else:
+			self.publish_wiki_report()
+		for name in self.counters:
+			setattr(self, name, 0)
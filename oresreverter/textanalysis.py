@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import mwparserfromhell
+import pywikibot
+from langdetect import DetectorFactory, detect_langs
+from langdetect.detector_factory import init_factory
+from langdetect.lang_detect_exception import LangDetectException
+
+MIN_LENGTH = 100 # shorter texts can't be identified reliably
+
+
+class AnalysisTimeout(Exception):
+	pass
+
+
+def _timeout(signum, frame):
+	raise AnalysisTimeout()
+
+
+def init_worker(seed: int) -> None:
+	"""Load the langdetect profiles once, when the worker process starts.
+
+langdetect is randomized; a fixed seed makes the results reproducible.
+"""
+	DetectorFactory.seed = seed
+	init_factory()
+
+
+def analyse(text: str, max_chars: int, timeout_s: float) -> dict:
+	"""Strip the wikicode of an article and detect its language. Runs in a worker process.
+
+Only the first `max_chars` characters are analysed and the analysis is
+interrupted after `timeout_s` seconds.
+"""
+	# the worker runs the task in its main thread, so SIGALRM can interrupt it
+	signal.signal(signal.SIGALRM, _timeout)
+	signal.setitimer(signal.ITIMER_REAL, timeout_s)
+	try:
+		wikicode = mwparserfromhell.parse(text[:max_chars])
+		to_check = wikicode.strip_code(keep_template_params=True)
+		detections = []
+		if len(to_check) >= MIN_LENGTH:
+			try:
+				detections = [(d.lang, d.prob) for d in detect_langs(to_check)]
+			except LangDetectException:
+				pass
+		return {"length": len(to_check), "detections": detections, "plain": wikicode.strip_code()}
+	finally:
+		signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class TextAnalyser:
+	"""Run the CPU-bound language analysis of new articles in a warm process pool.
+
+The RC loop only submits the text; the result is handed to a callback on
+a separate thread, so a long article never holds the GIL or delays the
+scoring of ordinary edits. The workers are started by a fork server: the
+bot is multithreaded by then, and a plain fork could copy a lock held by
+another thread (logging, the HTTP pool) and deadlock the worker.
+"""
+
+	def __init__(self, workers: int = 2, max_chars: int = 20000, timeout_s: float = 10, seed: int = 0):
+		self.workers = workers
+		self.seed = seed
+		self.max_chars = max_chars
+		self.timeout_s = timeout_s
+		self.timeouts = 0
+		self._processes = None
+		self._lock = threading.RLock()
+		self._callbacks = ThreadPoolExecutor(max_workers=2, thread_name_prefix="text-analysis")
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `text_analysis` section of the config page."""
+		if "max_chars" in config:
+			self.max_chars = int(config["max_chars"])
+		if "timeout_s" in config:
+			self.timeout_s = float(config["timeout_s"])
+		if "workers" in config and int(config["workers"]) != self.workers:
+			with self._lock:
+				self.workers = int(config["workers"])
+				if self._processes is not None:
+					self._processes.shutdown(wait=False)
+					self._processes = None
+					self.start()
+
+	def start(self) -> None:
+		"""Start the worker processes and wait until every one has its profiles loaded."""
+		with self._lock:
+			if self._processes is not None:
+				return
+			processes = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+											initargs=(self.seed,),
+											mp_context=multiprocessing.get_context("forkserver"))
+			warmups = [processes.submit(analyse, "", self.max_chars, self.timeout_s)
+					   for _ in range(self.workers)]
+			for future in warmups:
+				future.result()
+			# only published once warm, other callers wait on the lock meanwhile
+			self._processes = processes
+
+	def submit(self, text: str, callback) -> None:
+		"""Analyse `text` and call `callback(result)` on a callback thread."""
+		self.start()
+		future = self._processes.submit(analyse, text, self.max_chars, self.timeout_s)
+		future.add_done_callback(lambda f: self._callbacks.submit(self._deliver, f, callback))
+
+	def analyse_many(self, texts: list) -> list:
+		"""Analyse several texts in parallel and wait for them; failed ones give None."""
+		self.start()
+		futures = [self._processes.submit(analyse, text, self.max_chars, self.timeout_s) for text in texts]
+		results = []
+		for future in futures:
+			try:
+				results.append(future.result())
+			except AnalysisTimeout:
+				self.timeouts += 1
+				results.append(None)
+			except Exception as e:
+				pywikibot.error(f"Language analysis failed: {e}")
+				results.append(None)
+		return results
+
+	def _deliver(self, future, callback) -> None:
+		try:
+			result = future.result()
+		except AnalysisTimeout:
+			self.timeouts += 1
+			pywikibot.warning(f"Language analysis took more than {self.timeout_s}s, skipped")
+			return
+		except Exception as e:
+			pywikibot.error(f"Language analysis failed: {e}")
+			return
+		try:
+			callback(result)
+		except Exception as e:
+			pywikibot.error(f"Language analysis callback failed: {e}")
+
+
+analyser = TextAnalyser()
+
+def get_text_analyser() -> TextAnalyser:
+	return analyser
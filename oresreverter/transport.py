@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pywikibot
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "PatrocleBot (patroclebot@strainu.ro)"
+
+
+class Transport:
+	"""HTTP client shared by all the model and API calls.
+
+Connections are kept alive in a pool, every request has connect/read
+timeouts, at most `host_limit` requests run in parallel against the same
+host and 429/5xx answers or connection errors are retried with jittered
+exponential backoff (honouring Retry-After when the server sends it); a
+single wait never exceeds `max_backoff_s`.
+URLs starting with a prefix in `endpoints` are redirected to its target,
+which is how the model clients are pointed at the local fake server.
+"""
+	retry_statuses = {429, 500, 502, 503, 504}
+
+	def __init__(self, pool_size: int = 16, host_limit: int = 8,
+				 connect_timeout: float = 5, read_timeout: float = 30,
+				 retries: int = 3, backoff_s: float = 0.5, max_backoff_s: float = 60):
+		self.pool_size = pool_size
+		self.host_limit = host_limit
+		self.connect_timeout = connect_timeout
+		self.read_timeout = read_timeout
+		self.retries = retries
+		self.backoff_s = backoff_s
+		self.max_backoff_s = max_backoff_s
+		self._lock = threading.Lock()
+		self._host_slots = {}
+		self.endpoints = {}
+		self.session = self._new_session()
+
+	def _new_session(self) -> requests.Session:
+		session = requests.Session()
+		session.headers.update({'User-Agent': USER_AGENT})
+		adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		return session
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `http` section of the config page."""
+		with self._lock:
+			for key in ("connect_timeout", "read_timeout", "backoff_s", "max_backoff_s"):
+				if key in config:
+					setattr(self, key, float(config[key]))
+			if "endpoints" in config:
+				self.endpoints = dict(config["endpoints"])
+			if "retries" in config:
+				self.retries = int(config["retries"])
+			if "host_limit" in config and int(config["host_limit"]) != self.host_limit:
+				self.host_limit = int(config["host_limit"])
+				self._host_slots = {}
+			if "pool_size" in config and int(config["pool_size"]) != self.pool_size:
+				self.pool_size = int(config["pool_size"])
+				self.session = self._new_session()
+
+	def _slots(self, host: str) -> threading.BoundedSemaphore:
+		with self._lock:
+			if host not in self._host_slots:
+				self._host_slots[host] = threading.BoundedSemaphore(self.host_limit)
+			return self._host_slots[host]
+
+	def resolve(self, url: str) -> str:
+		for prefix, target in self.endpoints.items():
+			if url.startswith(prefix):
+				return target + url[len(prefix):]
+		return url
+
+	def backoff(self, attempt: int, response: requests.Response = None) -> float:
+		if response is not None:
+			retry_after = response.headers.get("Retry-After", "")
+			if retry_after.isdigit():
+				# a request thread must not sleep for as long as the server asks
+				return min(float(retry_after), self.max_backoff_s)
+		# "full jitter": spread the retries of parallel callers
+		return random.uniform(0, min(self.backoff_s * 2 ** attempt, self.max_backoff_s))
+
+	def request(self, method: str, url: str, **kwargs) -> requests.Response:
+		kwargs.setdefault("timeout", (self.connect_timeout, self.read_timeout))
+		url = self.resolve(url)
+		slots = self._slots(urlsplit(url).netloc)
+		attempt = 0
+		while True:
+			response = None
+			with slots:
+				try:
+					response = self.session.request(method, url, **kwargs)
+				except (requests.ConnectionError, requests.Timeout) as e:
+					if attempt >= self.retries:
+						raise
+					pywikibot.warning(f"{method} {url} failed with {e}, retrying")
+			if response is not None:
+				if response.status_code not in self.retry_statuses or attempt >= self.retries:
+					return response
+				pywikibot.warning(f"{method} {url} failed with code {response.status_code}, retrying")
+			delay = self.backoff(attempt, response)
+			if response is not None:
+				response.close()
+			time.sleep(delay)
+			attempt += 1
+
+	def get(self, url: str, **kwargs) -> requests.Response:
+		return self.request("GET", url, **kwargs)
+
+	def post(self, url: str, **kwargs) -> requests.Response:
+		return self.request("POST", url, **kwargs)
+
+
+transport = Transport()
+
+def get_transport() -> Transport:
+	return transport
+
+def set_transport(new_transport: Transport) -> None:
+	"""Replace the shared transport, e.g. to record or replay the HTTP traffic."""
+	global transport
+	transport = new_transport
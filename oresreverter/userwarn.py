@@ -1,13 +1,67 @@
 #!/usr/bin/python3
 # -*- coding: utf-8  -*-
 
-import requests
+import contextlib
+import threading
+import time
+from collections import OrderedDict
 
 import pywikibot
 from .changetrack import ChangeTracker
+from .metrics import get_metrics
+from .transport import get_transport
+from .writes import append_text, insert_after
 from pywikibot.tools import is_ip_address
 
 
+class WarningCache:
+	"""Last known warning state (level, blocked flag, timestamp) of the users we reverted.
+
+The state is updated as soon as we post a warning, so the talk page is
+only parsed again when the entry is older than `ttl_s` or was invalidated
+(e.g. after a block request, when an admin is expected to act).
+"""
+
+	def __init__(self, ttl_s: int = 3600, size: int = 10000):
+		self.ttl_s = ttl_s
+		self.size = size
+		self.hits = 0
+		self.misses = 0
+		self._states = OrderedDict() # user -> (level, blocked, timestamp)
+		self._lock = threading.Lock()
+
+	def get(self, user: str):
+		"""Return (level, blocked) or None if we have no fresh state for the user."""
+		with self._lock:
+			state = self._states.get(user)
+			if state is None or time.time() - state[2] > self.ttl_s:
+				self.misses += 1
+				return None
+			self.hits += 1
+			return state[0], state[1]
+
+	def set(self, user: str, level: int, blocked: bool = False) -> None:
+		with self._lock:
+			self._states[user] = (level, blocked, time.time())
+			self._states.move_to_end(user)
+			if len(self._states) > self.size:
+				self._states.popitem(last=False)
+
+	def invalidate(self, user: str) -> None:
+		with self._lock:
+			self._states.pop(user, None)
+
+	def hold(self, user: str):
+		"""Keep other processes from warning the user meanwhile; a no-op within one process."""
+		return contextlib.nullcontext()
+
+
+warning_cache = WarningCache()
+
+def get_warning_cache() -> WarningCache:
+	return warning_cache
+
+
 class RevertedUser:
 	black_dot = "■"
 	block_level = 5
@@ -19,39 +73,58 @@ class RevertedUser:
 	warn_description = "Avertizare de nivel {level} pentru vandalism la [[{article}]]"
 	report_timestamp = None
 
-	def __init__(self, username: str, tracker: ChangeTracker):
+	def __init__(self, username: str, site, tracker: ChangeTracker, warnings: WarningCache = None):
 		self.username = username
-		#TODO: dehardcode namespace
-		self.userpage = f"Discuție_Utilizator:{self.username}"
+		self.site = site
+		self.userpage = f"{site.namespace(3)}:{self.username}"
 		self.tracker = tracker
+		self.warnings = warnings or get_warning_cache()
+		# the cache is shared by all the wikis
+		self.key = f"{site.dbName()}:{username}"
 
 	def get_last_warning_level(self) -> int:
+		state = self.warnings.get(self.key)
+		if state is not None:
+			level, blocked = state
+			return 0 if blocked else level
+		state = self.fetch_warning_state()
+		if state is None:
+			return 0
+		level, blocked = state
+		self.warnings.set(self.key, level, blocked)
+		return level
+
+	def fetch_warning_state(self) -> (int, bool):
+		"""Parse the talk page sections to find the last warning level and whether the user was blocked since.
+
+Returns None if the talk page could not be parsed.
+"""
 		count = 0
 		try:
-			url = f"https://ro.wikipedia.org/w/api.php?action=parse&prop=sections&page={self.userpage}&format=json"
-			r = requests.get(url)
+			url = self.site.base_url(self.site.apipath())
+			params = {"action": "parse", "prop": "sections", "page": self.userpage, "format": "json"}
+			r = get_transport().get(url, params=params)
 			if r.status_code != 200:
 				raise ValueError(f"Obtaining the last warning level failed with code {r.status_code}")
 			ret = r.json()
 			if "parse" not in ret or "sections" not in ret["parse"]:
-				return 0
+				return 0, False
 			sections = ret["parse"]["sections"]
 			for s in range(len(sections) - 1, -1, -1):
 				line = sections[s]["line"]
-				print(line)
 				if line == "Blocat":
 					# user blocked, reset the warnings
-					return 0
+					return 0, True
 				loc = line.find(self.black_dot)
 				if loc > -1:
 					for idx in range(loc, loc + self.block_level):
 						if line[idx] == self.black_dot:
 							count += 1
-					return count
+					return count, False
 		except Exception as e:
-			print(e)
-			count = 0
-		return count
+			pywikibot.error(f"Could not read the warnings of {self.username}: {e}")
+			return None
+		return count, False
 
 	def warn(self, level: int, article: str):
 		article_template = ""
@@ -59,41 +132,39 @@ class RevertedUser:
 			article_template = "|" + article
 		warn_message = self.warn_message.format(level=level, article=article_template)
 		description = self.warn_description.format(level=level, article=article or "<articol necunoscut>")
-		up = pywikibot.Page(pywikibot.Site(), self.userpage)
-		text = ""
-		if up.exists():
-			text = up.get()
-		text += "\n" + warn_message
+		up = pywikibot.Page(self.site, self.userpage)
+		text = "\n" + warn_message
 		if is_ip_address(self.username):
 			text += "\n" + self.ip_advice
 		pywikibot.info(warn_message)
 		pywikibot.info(description)
-		up.put(text, summary=description)
+		with get_metrics().write.time(action="warn"):
+			append_text(up, text, summary=description)
+		self.warnings.set(self.key, level)
 
 	def report(self):
-		print(self.tracker)
 		if not self.tracker.should_report_user(self.username):
 			pywikibot.info("A report was already made recently. Skipping.")
 			return
 
 		warn_message = self.block_message.format(user=self.username)
 		description = self.block_description.format(user=self.username)
-		p = pywikibot.Page(pywikibot.Site(), self.block_notify)
-		text = ""
-		if p.exists():
-			text = p.get()
+		p = pywikibot.Page(self.site, self.block_notify)
 		# TODO: fix this hardcoding
 		end_of_header = "{{Sfârșit tabel căsuțe}}"
-		text = text.replace(end_of_header, end_of_header + "\n\n" + warn_message)
 		pywikibot.info(warn_message)
 		pywikibot.info(description)
-		p.put(text, summary=description, bot=False)
+		with get_metrics().write.time(action="report"):
+			insert_after(p, end_of_header, warn_message, summary=description, bot=False)
+		# the user is probably blocked soon, read the talk page next time
+		self.warnings.invalidate(self.key)
 
 	def warn_or_report(self, article: str):
-		level = 1 + self.get_last_warning_level()
-		if level >= self.block_level:
-			self.warn(self.block_level, article)
-			self.report()
-		else:
-			self.warn(level, article)
+		with self.warnings.hold(self.key):
+			level = 1 + self.get_last_warning_level()
+			if level >= self.block_level:
+				self.warn(self.block_level, article)
+				self.report()
+			else:
+				self.warn(level, article)
 
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+# type: ignore
+
+import atexit
+import multiprocessing
+import queue
+import zlib
+
+import pywikibot
+from .change import check_blp
+from .config import BotConfig
+from .fakeserver import fake_site
+from .models.langid import get_language_identifier
+from .pipeline import BatchStats, ScoringPipeline
+from .scheduler import get_scheduler
+from .sharedstate import SharedStore
+
+
+def shard(title: str, workers: int) -> int:
+	"""The worker treating the changes of a page; stable across runs and processes."""
+	return zlib.crc32(title.encode("utf-8")) % workers
+
+
+def work(index: int, workers: int, code: str, family: str, api_url: str, page: str, model: str,
+		 dry_run: bool, store_path: str, inbox, outbox) -> None:
+	"""Main function of a worker process: treat the batches from `inbox`, send the stats to `outbox`."""
+	site = fake_site(api_url) if api_url else pywikibot.Site(code, family)
+	site.login()
+	cfg = BotConfig(site, page=page, model_name=model, dry_run=dry_run, store=SharedStore(store_path), shard=index,
+					shards=workers)
+	pipeline = ScoringPipeline(site, cfg)
+	scheduler = get_scheduler()
+	scheduler.register("blp", lambda title, site=None: check_blp(pywikibot.Page(cfg.site, title), cfg.reporter))
+	scheduler.start()
+	if cfg.enabled_tools['new_article_watch']:
+		get_language_identifier().start()
+	pywikibot.output(f"Worker {index} started on {site} with model {cfg.model_name}")
+	for infos in iter(inbox.get, None):
+		try:
+			cfg.load_config()
+			outbox.put((index, pipeline.run(infos), None))
+		except Exception as e:
+			outbox.put((index, None, f"worker {index}: {e}"))
+
+
+class ShardedPipeline:
+	"""ScoringPipeline spreading each recent changes batch over `workers` processes.
+
+The changes are partitioned by a hash of the page title, so all the edits of
+a page go to the same worker, in RC order. Each worker has its own site,
+BotConfig, models, delayed jobs and write queue, with 1/`workers` of the
+configured write rate; the change tracker, report counters and warning
+state of the users are in a SharedStore at `store_path`. run()
+returns when every worker treated its part, so the caller advances the RC
+cursor as with a ScoringPipeline.
+"""
+
+	def __init__(self, site, page: str, model: str, workers: int, store_path: str,
+				 dry_run: bool = False, api_url: str = None):
+		self.workers = workers
+		# pywikibot is not fork-safe, the workers start from scratch
+		context = multiprocessing.get_context("spawn")
+		self._outbox = context.Queue()
+		self._inboxes = []
+		self._processes = []
+		# the store is created once, before the workers race to do it
+		SharedStore(store_path)
+		for index in range(workers):
+			inbox = context.Queue()
+			process = context.Process(target=work, name=f"worker-{index}",
+									  args=(index, workers, site.code, site.family.name, api_url, page, model, dry_run,
+											store_path, inbox, self._outbox))
+			process.start()
+			self._inboxes.append(inbox)
+			self._processes.append(process)
+		atexit.register(self.close)
+
+	def run(self, infos: list) -> BatchStats:
+		parts = [[] for _ in range(self.workers)]
+		for info in infos:
+			parts[shard(info["title"], self.workers)].append(info)
+		pending = 0
+		for inbox, part in zip(self._inboxes, parts):
+			if part:
+				inbox.put(part)
+				pending += 1
+
+		stats = BatchStats()
+		errors = []
+		while pending:
+			try:
+				index, part_stats, error = self._outbox.get(timeout=10)
+			except queue.Empty:
+				dead = [process.name for process in self._processes if not process.is_alive()]
+				if dead:
+					raise Exception(f"Worker processes exited: {', '.join(dead)}")
+				continue
+			pending -= 1
+			if error is not None:
+				errors.append(error)
+				continue
+			# the parts are treated in parallel
+			stats.count += part_stats.count
+			stats.scored += part_stats.scored
+			stats.build_s = max(stats.build_s, part_stats.build_s)
+			stats.score_s = max(stats.score_s, part_stats.score_s)
+			stats.treat_s = max(stats.treat_s, part_stats.treat_s)
+			stats.total_s = max(stats.total_s, part_stats.total_s)
+		if errors:
+			raise Exception("; ".join(errors))
+		return stats
+
+	def close(self) -> None:
+		for inbox, process in zip(self._inboxes, self._processes):
+			if process.is_alive():
+				inbox.put(None)
+		for process in self._processes:
+			process.join(timeout=30)
@@ -0,0 +1,290 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import heapq
+import itertools
+import threading
+import time
+
+import pywikibot
+from pywikibot.exceptions import APIError
+from .metrics import get_metrics
+from .writes import patrol
+
+# lower runs first; a rollback must not wait behind the patrols
+PRIORITIES = {"rollback": 0, "warn": 1, "report": 1, "tag": 1, "patrol": 2}
+# the wiki asks us to slow down
+THROTTLE_CODES = {"maxlag", "ratelimited", "readonly"}
+# the session is gone, log in again
+SESSION_CODES = {"assertuserfailed", "assertbotfailed", "notloggedin", "badtoken"}
+
+
+class TokenBucket:
+	"""Allow `rate` writes per second on average and bursts of `burst` writes.
+
+pause() stops the writes for a while, e.g. for the lag a maxlag error
+reported or the server's Retry-After. Only the writer thread uses it.
+"""
+
+	def __init__(self, rate: float = 1.0, burst: int = 5):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = float(burst)
+		self.updated = time.monotonic()
+		self.paused_until = 0.0
+
+	def pause(self, seconds: float) -> None:
+		self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+	def acquire(self) -> None:
+		while True:
+			now = time.monotonic()
+			if now < self.paused_until:
+				time.sleep(self.paused_until - now)
+				continue
+			self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+			if self.tokens >= 1:
+				self.tokens -= 1
+				return
+			time.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_after(e: Exception, default_s: float) -> float:
+	"""Seconds to wait before retrying, from the error if it says."""
+	# APIError keeps the extra fields of the error, maxlag errors have the lag
+	other = getattr(e, "other", None)
+	if isinstance(other, dict) and other.get("lag") is not None:
+		return max(float(other["lag"]), default_s)
+	response = getattr(e, "response", None)
+	header = response.headers.get("Retry-After", "") if response is not None else ""
+	if header.isdigit():
+		return float(header)
+	return default_s
+
+
+class WriteQueue:
+	"""Carry out the wiki writes of one wiki on a dedicated thread, most urgent first.
+
+Scoring and decisions only submit() a write and go on. The writer takes
+the job with the lowest priority (PRIORITIES: rollbacks, then warnings,
+reports and tags, then patrols; RC order within a priority), waits for a
+token of the bucket and runs it. Errors telling us to slow down (maxlag,
+ratelimited) pause the bucket for the lag or Retry-After and the job is
+tried again; a lost session is restored with a new login. Otherwise the
+login is only verified every `login_check_s` seconds. pywikibot's own
+put_throttle still applies to the edits.
+
+submit() blocks while `max_depth` jobs are waiting, so a slow wiki slows
+the scoring down instead of filling the memory.
+"""
+
+	def __init__(self, site, rate: float = 1.0, burst: int = 5, retries: int = 3,
+				 login_check_s: float = 300, max_depth: int = 1000):
+		self.site = site
+		self.bucket = TokenBucket(rate, burst)
+		self.retries = retries
+		self.login_check_s = login_check_s
+		self.max_depth = max_depth
+		self.done = 0
+		self.failed = 0
+		self.retried = 0
+		self.total_latency_s = 0.0
+		self._heap = []
+		self._depths = {}
+		self._running = 0
+		self._verified = None
+		self._seq = itertools.count()
+		self._cond = threading.Condition()
+		self._thread = None
+
+	def configure(self, config: dict) -> None:
+		"""Apply the `write_queue` section of the config page."""
+		if "rate" in config:
+			self.bucket.rate = float(config["rate"])
+		if "burst" in config:
+			self.bucket.burst = int(config["burst"])
+		for key in ("retries", "max_depth"):
+			if key in config:
+				setattr(self, key, int(config[key]))
+		if "login_check_s" in config:
+			self.login_check_s = float(config["login_check_s"])
+
+	@property
+	def depth(self) -> int:
+		return len(self._heap)
+
+	def submit(self, action: str, func, on_error=None) -> None:
+		"""Queue `func()`; `on_error(e)` is called if it still fails after the retries."""
+		with self._cond:
+			# the writer itself queues follow-ups (warnings, tags) and must not wait for itself
+			while len(self._heap) >= self.max_depth and threading.current_thread() is not self._thread:
+				self._cond.wait()
+			job = (PRIORITIES.get(action, 1), next(self._seq), action, func, on_error, time.monotonic(), 0)
+			self._push(job)
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._work, name="writer", daemon=True)
+				self._thread.start()
+
+	def join(self) -> None:
+		"""Wait until every queued write was carried out."""
+		with self._cond:
+			while self._heap or self._running:
+				self._cond.wait()
+
+	def _push(self, job: tuple) -> None:
+		# called with the lock held
+		heapq.heappush(self._heap, job)
+		self._count(job[2], 1)
+		self._cond.notify_all()
+
+	def _count(self, action: str, delta: int) -> None:
+		self._depths[action] = self._depths.get(action, 0) + delta
+		get_metrics().write_queue_depth.set(self._depths[action], action=action)
+
+	def _next(self) -> tuple:
+		with self._cond:
+			while not self._heap:
+				self._cond.wait()
+			job = heapq.heappop(self._heap)
+			self._count(job[2], -1)
+			self._running += 1
+			self._cond.notify_all()
+			return job
+
+	def ensure_login(self) -> None:
+		now = time.monotonic()
+		if self._verified is None or now - self._verified > self.login_check_s:
+			self.site.login()
+			self._verified = now
+
+	def _work(self) -> None:
+		while True:
+			job = self._next()
+			priority, seq, action, func, on_error, queued, attempt = job
+			self.bucket.acquire()
+			try:
+				self.ensure_login()
+				func()
+			except Exception as e:
+				code = e.code if isinstance(e, APIError) else None
+				if (code in THROTTLE_CODES or code in SESSION_CODES) and attempt < self.retries:
+					self.retried += 1
+					if code in SESSION_CODES:
+						self._verified = None
+					else:
+						self.bucket.pause(retry_after(e, 5 * 2 ** attempt))
+					pywikibot.warning(f"The {action} write was refused ({code}), retrying")
+					with self._cond:
+						self._push((priority, seq, action, func, on_error, queued, attempt + 1))
+				else:
+					self.failed += 1
+					get_metrics().write_errors.inc(action=action)
+					pywikibot.error(f"The {action} write failed: {e}")
+					try:
+						if on_error is not None:
+							on_error(e)
+					except Exception as handler_error:
+						# keep the writer alive
+						pywikibot.error(f"Error while handling the failed {action} write: {handler_error}")
+			else:
+				self.done += 1
+				latency = time.monotonic() - queued
+				self.total_latency_s += latency
+				get_metrics().write_queue_latency.observe(latency, action=action)
+			finally:
+				with self._cond:
+					self._running -= 1
+					self._cond.notify_all()
+
+	def summary(self) -> str:
+		average = self.total_latency_s / self.done if self.done else 0
+		return (f"{self.depth} în coadă, {self.done} efectuate, {self.failed} eșuate, "
+				f"{self.retried} reîncercări, latență medie {average:.1f}s")
+
+
+class PatrolCollector:
+	"""Collect the patrols of a RC batch, or of `window_s` seconds, into a single write.
+
+The patrol API takes one revision per request, so the batch is still one
+request per revision, but they share one job of the WriteQueue: one patrol
+token and one login check. Each request still takes a token of the
+bucket, so a batch does not go over the write rate. Each revision's
+result goes back to its Change, so the reporter counts the failures one
+by one. When the wiki asks to slow down, the job is retried with the
+revisions that were not patrolled yet.
+"""
+
+	def __init__(self, site, writes: WriteQueue, window_s: float = 5, size: int = 50):
+		self.site = site
+		self.writes = writes
+		self.window_s = window_s
+		self.size = size
+		self.batches = 0
+		self.patrols = 0
+		self._pending = []
+		self._timer = None
+		self._lock = threading.Lock()
+
+	def configure(self, config: dict) -> None:
+		"""Apply the patrol_* keys of the `write_queue` section."""
+		if "patrol_window_s" in config:
+			self.window_s = float(config["patrol_window_s"])
+		if "patrol_batch" in config:
+			self.size = int(config["patrol_batch"])
+
+	def add(self, change) -> None:
+		with self._lock:
+			self._pending.append(change)
+			full = len(self._pending) >= self.size
+			if not full and self._timer is None:
+				# the async engine has no batch end, flush after a while
+				self._timer = threading.Timer(self.window_s, self.flush)
+				self._timer.daemon = True
+				self._timer.start()
+		if full:
+			self.flush()
+
+	def flush(self) -> None:
+		"""Queue the collected patrols; called at the end of every RC batch."""
+		with self._lock:
+			batch, self._pending = self._pending, []
+			if self._timer is not None:
+				self._timer.cancel()
+				self._timer = None
+		if not batch:
+			return
+		self.batches += 1
+		self.patrols += len(batch)
+		self.writes.submit("patrol", lambda: self.patrol_batch(batch),
+						   on_error=lambda e: self.batch_failed(batch, e))
+
+	def patrol_batch(self, batch: list) -> None:
+		"""Run by the write queue; `batch` only keeps the changes not patrolled yet."""
+		token = self.site.tokens["patrol"]
+		first = True
+		while batch:
+			change = batch[0]
+			# the write queue took the token of the first request
+			if not first:
+				self.writes.bucket.acquire()
+			first = False
+			try:
+				with get_metrics().write.time(action="patrol"):
+					patrol(self.site, change.revid, token)
+			except APIError as e:
+				if e.code in THROTTLE_CODES or e.code in SESSION_CODES:
+					raise
+				get_metrics().write_errors.inc(action="patrol")
+				change.patrol_failed(e)
+			else:
+				change.patrol_succeeded()
+			batch.pop(0)
+
+	def batch_failed(self, batch: list, e: Exception) -> None:
+		for change in batch:
+			change.patrol_failed(e)
+
+	def summary(self) -> str:
+		average = self.patrols / self.batches if self.batches else 0
+		return f"{self.patrols} patrulări în {self.batches} loturi ({average:.1f} pe lot)"
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import pywikibot
+from pywikibot.exceptions import APIError
+
+
+def append_text(page: pywikibot.Page, text: str, summary: str, bot: bool = True) -> None:
+	"""Append text to a page with the edit API's appendtext, without downloading the page.
+
+The cost of the edit does not depend on the size of the page and there is
+no read-modify-write window in which someone else's edit could conflict.
+"""
+	page.site.editpage(page, summary=summary, appendtext=text, bot=bot)
+
+
+def rollback(page: pywikibot.Page, user: str, summary: str, markbot: bool = False) -> None:
+	"""Roll back the latest edits of `user` on the page with a single API request.
+
+Unlike APISite.rollbackpage, the page history does not have to be loaded
+first: the API itself refuses when someone else edited the page since
+(alreadyrolled) or the user is its only author (onlyauthor).
+"""
+	site = page.site
+	site.simple_request(action="rollback", title=page.title(), user=user, summary=summary,
+						markbot=markbot, token=site.tokens["rollback"]).submit()
+
+
+def patrol(site, revid: int, token: str) -> None:
+	"""Mark a revision as patrolled; the token can be reused for a whole batch."""
+	site.simple_request(action="patrol", revid=revid, token=token).submit()
+
+
+def insert_after(page: pywikibot.Page, marker: str, text: str, summary: str,
+				 bot: bool = True, section: int = 0, attempts: int = 3) -> None:
+	"""Insert text after `marker`, downloading and saving only the section that contains it.
+
+If the marker is not in that section, the text is appended to the page. The
+edit is sent with action=edit directly: APISite.editpage would load the
+whole latest revision first. On an edit conflict the section is read again.
+"""
+	site = page.site
+	for attempt in range(attempts):
+		data = site.simple_request(action="query", prop="revisions", titles=page.title(),
+								   rvprop="content|timestamp", rvslots="main",
+								   rvsection=section, formatversion=2).submit()
+		revisions = data["query"]["pages"][0].get("revisions", [])
+		content = revisions[0]["slots"]["main"]["content"] if revisions else ""
+		if marker not in content:
+			pywikibot.warning(f"{marker} not found in section {section} of {page.title()}, appending instead")
+			append_text(page, "\n\n" + text, summary, bot=bot)
+			return
+		content = content.replace(marker, marker + "\n\n" + text)
+		params = {"action": "edit", "title": page.title(), "section": section, "text": content,
+				  "summary": summary, "basetimestamp": revisions[0]["timestamp"], "nocreate": True,
+				  "token": site.tokens["csrf"]}
+		if bot:
+			params["bot"] = True
+		try:
+			site.simple_request(**params).submit()
+			return
+		except APIError as e:
+			if e.code != "editconflict" or attempt == attempts - 1:
+				raise
+			pywikibot.warning(f"Edit conflict on {page.title()}, trying again")
@@ -0,0 +1,32 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+from datetime import datetime, timedelta, timezone
+
+from oresreverter.changetrack import ChangeTracker
+
+
+def test_expired_changes_are_dropped_from_the_front():
+	tracker = ChangeTracker(timezone.utc, 60)
+	now = datetime.now(timezone.utc)
+	tracker.changelist[("Vechi", "A")] = now - timedelta(seconds=120)
+	tracker.changelist[("Recent", "B")] = now - timedelta(seconds=10)
+	assert not tracker.tracked_change("Vechi", "A")
+	assert tracker.tracked_change("Recent", "B")
+	assert list(tracker.changelist) == [("Recent", "B")]
+
+
+def test_a_tracked_change_is_moved_to_the_end():
+	tracker = ChangeTracker(timezone.utc, 60)
+	tracker.add_change("Pagina", "A")
+	tracker.add_change("Alta", "B")
+	tracker.add_change("Pagina", "A")
+	assert list(tracker.changelist) == [("Alta", "B"), ("Pagina", "A")]
+
+
+def test_a_user_is_reported_once_per_timeout():
+	tracker = ChangeTracker(timezone.utc, 60)
+	assert tracker.should_report_user("Vandal")
+	assert not tracker.should_report_user("Vandal")
+	tracker.cleanup_lists(datetime.now(timezone.utc) + timedelta(seconds=61))
+	assert tracker.should_report_user("Vandal")
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import json
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.config import BotConfig
+
+
+def wiki_config(page: str, shared: bool) -> BotConfig:
+	# only what shared_config() needs, without a site and a config page
+	cfg = BotConfig.__new__(BotConfig)
+	cfg.site = "wikipedia:" + page
+	cfg.page = page
+	cfg.shared = shared
+	return cfg
+
+
+def test_only_the_first_wiki_applies_the_shared_sections():
+	first = wiki_config("Primul", shared=True)
+	other = wiki_config("Al doilea", shared=False)
+	assert first.shared_config({"http": {"timeout": 10}, "threshold": 0.9}) == \
+		{"http": {"timeout": 10}, "threshold": 0.9}
+	assert other.shared_config({"http": {"timeout": 30}, "threshold": 0.8}) == {"threshold": 0.8}
+	# a new BotConfig does not reset what the first wiki applied
+	assert wiki_config("Al treilea", shared=False).shared_config({"http": {"timeout": 10}}) == {}
+
+
+class ConfigPage:
+	def __init__(self, revid: int, data: dict):
+		self.latest_revision_id = revid
+		self.data = data
+		self.reads = 0
+
+	def get(self) -> str:
+		self.reads += 1
+		return json.dumps(self.data)
+
+
+def reloading_config(page: ConfigPage) -> BotConfig:
+	# load_config() without a site: one revision query, then apply_config()
+	cfg = BotConfig.__new__(BotConfig)
+	cfg.reload_checks = cfg.reloads = 0
+	cfg.reload_s = 0.0
+	cfg.config_revid = None
+	cfg.applied = []
+
+	def config_revision():
+		cfg._config_page = page
+		return page.latest_revision_id
+
+	cfg.config_revision = config_revision
+	cfg.apply_config = cfg.applied.append
+	return cfg
+
+
+def test_the_config_page_is_read_again_only_when_it_changed():
+	page = ConfigPage(100, {"threshold": 0.9})
+	cfg = reloading_config(page)
+	cfg.load_config()
+	cfg.load_config()
+	assert (cfg.reload_checks, cfg.reloads, page.reads) == (2, 1, 1)
+
+	page.latest_revision_id, page.data = 101, {"threshold": 0.8}
+	cfg.load_config()
+	assert cfg.applied == [{"threshold": 0.9}, {"threshold": 0.8}]
+	assert cfg.config_revid == 101
+	cfg.load_config(force=True)
+	assert (cfg.reload_checks, cfg.reloads, page.reads) == (4, 3, 3)
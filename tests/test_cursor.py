@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+from types import SimpleNamespace
+
+import pytest
+
+pywikibot = pytest.importorskip("pywikibot")
+
+from oresreverter.cursor import RCCursor
+
+
+def info(rcid: int, second: int) -> dict:
+	return {"rcid": rcid, "timestamp": f"2026-10-18T10:00:{second:02d}Z", "title": f"Articol {rcid}"}
+
+
+def test_the_cursor_stays_at_the_oldest_held_change(tmp_path):
+	path = str(tmp_path / "cursor.json")
+	cursor = RCCursor(path)
+	batch = [info(1, 1), info(2, 2), info(3, 3)]
+	cursor.hold(batch)
+	# the newest change is done first, the older ones are still being treated
+	cursor.advance([batch[2]])
+	assert cursor.timestamp == "2026-10-18T10:00:01Z"
+	cursor.advance([batch[0]])
+	assert cursor.timestamp == "2026-10-18T10:00:02Z"
+
+	# a restart lists the changes again from there, the done ones are dropped
+	restarted = RCCursor(path)
+	assert restarted.timestamp == "2026-10-18T10:00:02Z"
+	assert restarted.filter(batch) == [batch[1]]
+
+	cursor.advance([batch[1]])
+	assert cursor.timestamp == "2026-10-18T10:00:03Z"
+	assert cursor.filter(batch) == []
+
+
+def test_changes_of_the_same_second_are_not_treated_twice(tmp_path):
+	cursor = RCCursor(str(tmp_path / "cursor.json"))
+	first = [info(1, 5), info(2, 5)]
+	cursor.advance(cursor.filter(first))
+	assert cursor.timestamp == "2026-10-18T10:00:05Z"
+	assert cursor.rcid == 2
+	# the next poll includes the cursor's second: a late edit of that second is kept
+	assert cursor.filter([*first, info(3, 5), info(4, 6)]) == [info(3, 5), info(4, 6)]
+	assert cursor.duplicates == 2
+
+
+def test_only_the_latest_rcids_are_remembered():
+	cursor = RCCursor(remembered=2)
+	cursor.advance([info(1, 1), info(2, 2), info(3, 3)])
+	assert cursor.filter([info(1, 1), info(3, 3)]) == [info(1, 1)]
+
+
+class CountingPipeline:
+	def __init__(self):
+		self.batches = []
+
+	def run(self, infos: list) -> str:
+		self.batches.append([change["rcid"] for change in infos])
+		return f"{len(infos)} changes"
+
+
+def test_catch_up_treats_the_backlog_oldest_first(tmp_path, monkeypatch):
+	backlog = [info(rcid, rcid) for rcid in range(1, 6)]
+	queries = []
+
+	def recentchanges(site, **kwargs):
+		queries.append(kwargs)
+		return iter(backlog)
+
+	monkeypatch.setattr("oresreverter.cursor.recentchanges", recentchanges)
+	cursor = RCCursor(str(tmp_path / "cursor.json"))
+	cursor.advance([backlog[0]])
+	pipeline = CountingPipeline()
+	cfg = SimpleNamespace(namespaces=[0], rc_limit=2)
+
+	assert cursor.catch_up(None, cfg, pipeline) == 4
+	# the change of the cursor's second was already treated
+	assert pipeline.batches == [[2], [3, 4], [5]]
+	assert cursor.timestamp == "2026-10-18T10:00:05Z"
+	assert queries[0]["reverse"] and queries[0]["top_only"]
+	assert queries[0]["start"] == pywikibot.Timestamp.fromISOformat("2026-10-18T10:00:01Z")
+
+
+def test_no_catch_up_without_a_cursor(monkeypatch):
+	monkeypatch.setattr("oresreverter.cursor.recentchanges", lambda site, **kwargs: iter([info(1, 1)]))
+	assert RCCursor().catch_up(None, SimpleNamespace(namespaces=[0], rc_limit=2), CountingPipeline()) == 0
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.cursor import RCCursor
+from oresreverter.engine import AsyncEngine
+from oresreverter.polling import AdaptivePoller
+
+
+def info(rcid: int, second: int, action: str = None) -> dict:
+	return {"rcid": rcid, "timestamp": f"2026-10-18T10:00:{second:02d}Z", "title": f"Articol {rcid}",
+			"action": action}
+
+
+class StagedChange:
+	"""Decides the `action` of its info; apply() waits for `gate`."""
+	SKIP = None
+	gate = threading.Event()
+	applying = threading.Event()
+
+	def __init__(self, site, info, cfg):
+		self.info = info
+		self.revid = info["rcid"]
+		self.article = SimpleNamespace(title=lambda: info["title"])
+		self.needs_score = False
+		self.lag = None
+
+	def work_on_blps(self) -> None:
+		pass
+
+	def decide(self) -> str:
+		return self.info["action"]
+
+	def apply(self, action: str) -> None:
+		self.applying.set()
+		assert self.gate.wait(5)
+
+
+def engine_config(cursor: RCCursor, rc_limit: int = 10) -> SimpleNamespace:
+	return SimpleNamespace(cursor=cursor, poller=AdaptivePoller(), rc_limit=rc_limit, namespaces=[0],
+						   active=True, scoring_concurrency=1, model=SimpleNamespace(batch_size=1))
+
+
+def test_fetch_holds_the_changes_until_they_are_treated(monkeypatch):
+	rows = [info(2, 2), info(1, 1)]
+	monkeypatch.setattr("oresreverter.engine.recentchanges", lambda site, **kwargs: iter(rows))
+	cursor = RCCursor()
+	engine = AsyncEngine(None, engine_config(cursor))
+	assert engine.fetch() == [rows]
+	# polled again before the changes were treated
+	assert engine.fetch() == [[]]
+	cursor.advance(rows)
+	assert engine.fetch() == [[]]
+	assert cursor.timestamp == "2026-10-18T10:00:02Z"
+
+
+def test_a_full_batch_fetches_the_changes_since_the_cursor_first(monkeypatch):
+	queries = []
+
+	def backlog(site, **kwargs):
+		queries.append(kwargs)
+		return iter([info(1, 1), info(2, 2), info(3, 3)])
+
+	monkeypatch.setattr("oresreverter.engine.recentchanges", lambda site, **kwargs: iter([info(5, 5), info(4, 4)]))
+	monkeypatch.setattr("oresreverter.cursor.recentchanges", backlog)
+	cursor = RCCursor()
+	cursor.advance([info(1, 1)])
+	engine = AsyncEngine(None, engine_config(cursor, rc_limit=2))
+	batches = engine.fetch()
+	assert [[change["rcid"] for change in infos] for infos in batches] == [[2], [3], [5, 4]]
+	assert str(queries[0]["end"]) == "2026-10-18T10:00:04Z"
+
+
+async def until(condition) -> None:
+	deadline = time.monotonic() + 5
+	while not condition():
+		assert time.monotonic() < deadline
+		await asyncio.sleep(0.01)
+
+
+def test_the_cursor_waits_for_the_actions_to_be_queued(monkeypatch):
+	monkeypatch.setattr("oresreverter.engine.Change", StagedChange)
+	monkeypatch.setattr("oresreverter.cursor.recentchanges",
+						lambda site, **kwargs: iter([info(1, 1, action="revert"), info(2, 2)]))
+	cursor = RCCursor()
+	cursor.advance([info(0, 0)])
+	executor = ThreadPoolExecutor(max_workers=4)
+	StagedChange.gate.clear()
+	StagedChange.applying.clear()
+
+	async def run():
+		engine = AsyncEngine(None, engine_config(cursor), executor=executor)
+		stages = [asyncio.ensure_future(stage) for stage in (engine.score(), engine.decide(), engine.write())]
+		await engine.catch_up()
+		# the newer change was skipped, the older one is still being written
+		await until(lambda: StagedChange.applying.is_set() and cursor.timestamp == "2026-10-18T10:00:01Z")
+		await asyncio.sleep(0.05)
+		assert cursor.timestamp == "2026-10-18T10:00:01Z"
+		assert cursor.filter([info(1, 1)]) == []
+		StagedChange.gate.set()
+		await until(lambda: cursor.timestamp == "2026-10-18T10:00:02Z")
+		for stage in stages:
+			stage.cancel()
+		await asyncio.gather(*stages, return_exceptions=True)
+
+	try:
+		asyncio.run(run())
+	finally:
+		StagedChange.gate.set()
+		executor.shutdown()
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.eventstream import EventStream, parse_sse
+from oresreverter.fakeserver import EditGenerator, FakeServer, FakeWiki
+
+
+def event(title="Articol", wiki="rowiki", type="edit", namespace=0, revid=1):
+	return {"wiki": wiki, "type": type, "namespace": namespace, "title": title,
+			"revision": {"new": revid, "old": revid - 1}, "user": "Utilizator", "timestamp": 1700000000}
+
+
+def new_stream(url=None, namespaces=(0,)):
+	site = SimpleNamespace(dbName=lambda: "rowiki")
+	cfg = SimpleNamespace(namespaces=list(namespaces), rc_limit=50, eventstream_url=url)
+	return EventStream(site, cfg)
+
+
+def test_parse_sse_framing():
+	lines = [
+		": heartbeat",
+		"id: 1",
+		"data: {\"a\":",
+		"data:  1}",
+		"",
+		"event: error",
+		"data: boom",
+		"",
+		"data: no id",
+		"",
+		"",
+	]
+	assert list(parse_sse(lines)) == [
+		("1", "message", "{\"a\":\n 1}"),
+		("1", "error", "boom"),
+		# the last event id stays until the server sends a new one
+		("1", "message", "no id"),
+	]
+
+
+def test_parse_sse_ignores_comments_and_empty_events():
+	assert list(parse_sse([":", ": ping", "", "id: 7", "", None])) == []
+
+
+def test_filter_by_wiki_namespace_and_type():
+	stream = new_stream(namespaces=(0, 2))
+	assert stream.matches(event())
+	assert stream.matches(event(type="new", namespace=2))
+	assert not stream.matches(event(wiki="enwiki"))
+	assert not stream.matches(event(namespace=1))
+	assert not stream.matches(event(type="log"))
+
+
+def test_top_only_keeps_the_latest_change_per_page():
+	infos = [{"title": "A", "revid": 1}, {"title": "B", "revid": 2}, {"title": "A", "revid": 3}]
+	assert [info["revid"] for info in new_stream().top_only(infos)] == [2, 3]
+
+
+@pytest.fixture
+def server():
+	wiki = FakeWiki(titles=20)
+	server = FakeServer(("127.0.0.1", 0), wiki, latency={"read": 0, "write": 0, "model": 0}, stream_limit=3)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	generator = EditGenerator(wiki, rate=50)
+	generator.start()
+	yield server
+	generator.rate = 0
+	server.shutdown()
+	server.server_close()
+
+
+def test_events_resume_with_last_event_id(server):
+	url = f"http://127.0.0.1:{server.server_address[1]}/v2/stream/recentchange"
+	stream = new_stream(url)
+	events = stream.events()
+	received = [next(events) for _ in range(10)]
+	ids = [received_event["id"] for received_event in received]
+	# the server drops the connection every 3 events; no event is lost or repeated
+	assert ids == list(range(ids[0], ids[0] + len(ids)))
+	assert stream.reconnects >= 3
+	assert server.counts["stream"] >= 4
+	assert stream.last_event_id is not None
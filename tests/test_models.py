@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+import json
+
+import requests
+
+from oresreverter.models import get_model
+from oresreverter.transport import Transport, get_transport, set_transport
+
+ORES = {"damaging": {"likely": 0.8, "possible": 0.6, "minimal": 0.2},
+		"goodfaith": {"likely": 0.8, "possible": 0.6, "minimal": 0.2}}
+
+
+def test_cascade_members_use_the_top_level_sections():
+	cascade = get_model("cascade")
+	cascade.sections = {"ores": ORES}
+	cascade.set_config({"first": "ores.damaging", "then": ["revertrisk.multilingual"]})
+	assert cascade.is_certain(0.9)
+	assert cascade.is_certain(0.1)
+	assert not cascade.is_certain(0.5)
+
+
+def test_cascade_section_overrides_the_top_level():
+	cascade = get_model("cascade")
+	cascade.sections = {"ores": ORES}
+	nested = {"damaging": {"likely": 0.95, "possible": 0.9, "minimal": 0.05}}
+	cascade.set_config({"first": "ores.damaging", "ores": nested})
+	assert not cascade.is_certain(0.9)
+
+
+def test_cascade_without_member_config_names_the_section():
+	cascade = get_model("cascade")
+	with pytest.raises(ValueError, match="ores"):
+		cascade.set_config({"first": "ores.damaging", "then": ["revertrisk.multilingual"]})
+
+
+class FlakyTransport(Transport):
+	"""Fails the first request, then answers with a damaging score for every revision."""
+
+	def __init__(self):
+		super(FlakyTransport, self).__init__()
+		self.calls = 0
+
+	def request(self, method: str, url: str, **kwargs) -> requests.Response:
+		self.calls += 1
+		if self.calls == 1:
+			raise requests.ConnectionError("connection reset")
+		revids = kwargs["params"]["revids"].split("|")
+		score = {"damaging": {"score": {"prediction": True, "probability": {"true": 0.9, "false": 0.1}}}}
+		r = requests.Response()
+		r.status_code = 200
+		r.url = url
+		r._content = json.dumps({"rowiki": {"scores": {revid: score for revid in revids}}}).encode()
+		return r
+
+
+def test_a_failed_chunk_does_not_lose_the_next_ones():
+	model = get_model("ores.damaging")
+	model.set_config(ORES)
+	transport = get_transport()
+	set_transport(FlakyTransport())
+	try:
+		results = model.fetch_results("ro", list(range(1, 61)), ["damaging"])
+	finally:
+		set_transport(transport)
+	# the first 50 revisions are left to the single requests
+	assert sorted(results) == list(range(51, 61))
+	assert results[51]["damaging"] == (0.9, True)
+
+
+def test_multi_model_members_are_in_a_stable_order():
+	names = [model.get_name() for model in get_model("multi-model").members]
+	assert names == sorted(names)
+	assert get_model("multi-model").latest_model.get_name() == names[0]
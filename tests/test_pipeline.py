@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.pipeline import ScoringPipeline
+
+
+class SlowModel:
+	"""Scores every revision with its id; revision 4 takes a while."""
+	batch_size = 1
+
+	def __init__(self):
+		self.done = {}
+
+	def get_cached_results(self, lang: str, revids: list, rcscores: dict = None, workers: int = 4,
+						   wiki: str = None) -> dict:
+		if 4 in revids:
+			time.sleep(0.3)
+		self.done.update((revid, time.monotonic()) for revid in revids)
+		return {revid: (revid / 10, False) for revid in revids}
+
+
+class RecordedChange:
+	treated = []
+	lock = threading.Lock()
+
+	def __init__(self, site, info, cfg):
+		self.revid = info["revid"]
+		self.rcscores = None
+		self.lag = None
+		self.score = None
+
+	@property
+	def needs_score(self) -> bool:
+		return self.score is None
+
+	def set_score(self, score: float) -> None:
+		self.score = score
+
+	def treat(self) -> None:
+		with self.lock:
+			self.treated.append((self.revid, self.score, time.monotonic()))
+
+
+def test_changes_are_treated_while_the_batch_is_scored():
+	model = SlowModel()
+	cfg = SimpleNamespace(model=model, scoring_concurrency=4, patrols=SimpleNamespace(flush=lambda: None))
+	site = SimpleNamespace(lang="ro", dbName=lambda: "rowiki")
+	pipeline = ScoringPipeline(site, cfg)
+	pipeline.change_class = RecordedChange
+	RecordedChange.treated = []
+
+	stats = pipeline.run([{"revid": revid} for revid in (1, 2, 3, 4, 5)])
+
+	assert stats.scored == 5
+	# RC order, each with its own score
+	assert [(revid, score) for revid, score, _ in RecordedChange.treated] == \
+		[(1, 0.1), (2, 0.2), (3, 0.3), (4, 0.4), (5, 0.5)]
+	# the first changes did not wait for the slow one
+	assert RecordedChange.treated[0][2] < model.done[4]
@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.polling import AdaptivePoller
+
+
+def info(second: int) -> dict:
+	return {"timestamp": f"2026-10-18T10:{second // 60:02d}:{second % 60:02d}Z"}
+
+
+def test_a_full_batch_polls_again_at_once():
+	poller = AdaptivePoller()
+	assert poller.next_interval(50, 50, 5, 120) == 0
+	assert poller.immediate == 1
+
+
+def test_the_interval_leaves_room_for_the_processing_time():
+	poller = AdaptivePoller(target_latency_s=30)
+	assert poller.next_interval(1, 50, 5, 120) == 60
+	poller.observe([], processing_s=10, now=0)
+	assert poller.next_interval(1, 50, 5, 120) == pytest.approx(54)
+	assert poller.next_interval(1, 50, 5, 40) == 40
+	poller.processing_s = 30
+	assert poller.next_interval(1, 50, 5, 120) == 5
+
+
+def test_the_edit_rate_is_taken_from_the_rc_timestamps():
+	poller = AdaptivePoller(target_latency_s=30, tau_s=0.01)
+	poller.observe([info(0)], now=0)
+	# 60 edits in the next minute, polled a long time after
+	poller.observe([info(second) for second in range(1, 61)], now=1000)
+	assert poller.rate == pytest.approx(1)
+	# 40 changes would already make a batch 80% full
+	assert poller.next_interval(1, 50, 5, 120) == pytest.approx(40)
+	assert "60.0 modificări/minut" in poller.summary()
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import json
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter import replay as replay_module
+from oresreverter.transport import get_transport, set_transport
+
+ORES = {"damaging": {"likely": 0.8, "possible": 0.6, "minimal": 0.2},
+		"goodfaith": {"likely": 0.8, "possible": 0.6, "minimal": 0.2}}
+CONFIG = {"model_name": "ores", "threshold": 0.95, "ores": ORES, "namespaces": [0], "rc_limit": 50,
+		  "labels_penalty": {}, "maintainer": "X", "active": True,
+		  "enabled_tools": {"revert": True, "patrol": True, "blp_add": False, "new_article_watch": False}}
+BAD = {"damaging": {"true": 0.99, "false": 0.01}, "goodfaith": {"true": 0.01, "false": 0.99}}
+GOOD = {"damaging": {"true": 0.01, "false": 0.99}, "goodfaith": {"true": 0.99, "false": 0.01}}
+
+
+def row(rcid: int, oresscores: dict) -> dict:
+	return {"type": "edit", "title": f"Articol {rcid}", "revid": 1000 + rcid, "rcid": rcid,
+			"user": f"Utilizator {rcid}", "timestamp": "2026-10-18T10:00:00Z", "tags": [],
+			"oresscores": oresscores}
+
+
+@pytest.fixture
+def recording(tmp_path):
+	path = tmp_path / "recording.jsonl"
+	# the goodfaith score of the last row is missing and was not recorded
+	rows = [row(1, BAD), row(2, GOOD), row(3, {"damaging": BAD["damaging"]})]
+	with open(path, "w", encoding="utf-8") as f:
+		f.write(json.dumps({"kind": "config", "lang": "ro", "dbname": "rowiki",
+							"text": json.dumps(CONFIG)}) + "\n")
+		f.write(json.dumps({"kind": "batch", "rows": rows}) + "\n")
+	transport = get_transport()
+	yield str(path)
+	set_transport(transport)
+
+
+def test_unrecorded_scores_are_counted(recording):
+	result = replay_module.replay(recording)
+	assert result["edits"] == 3
+	assert result["http_misses"] >= 1
+	assert result["errors"] == 1
+	assert result["site_calls"]["rollback"] == 1
+	assert result["site_calls"]["patrol"] == 1
+
+
+def test_the_stages_include_the_writes(recording):
+	result = replay_module.replay(recording, write_latency_s=0.05)
+	# the rollback and the patrol are carried out before the batch ends
+	assert result["stages"]["writes (batch)"]["p50"] >= 0.1
+	assert result["stages"]["edit"]["p50"] >= result["stages"]["writes (batch)"]["p50"]
@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.metrics import get_metrics
+from oresreverter.scheduler import DelayedJobScheduler
+
+
+def gauge(name: str) -> float:
+	return getattr(get_metrics(), name).values[()]
+
+
+def test_depth_and_lag_are_exported(tmp_path):
+	scheduler = DelayedJobScheduler(workers=1, path=str(tmp_path / "jobs.json"))
+	done = threading.Event()
+	scheduler.register("check", lambda title: done.set() if title == "B" else None)
+	scheduler.schedule("check", 0, title="A")
+	scheduler.schedule("check", 0.2, title="B")
+	assert gauge("delayed_jobs_depth") == 2
+
+	scheduler.start()
+	assert done.wait(5)
+	# the job is still counted while its handler runs
+	deadline = time.monotonic() + 5
+	while gauge("delayed_jobs_depth") and time.monotonic() < deadline:
+		time.sleep(0.01)
+	assert gauge("delayed_jobs_depth") == 0
+	assert scheduler.executed == 2
+	assert 0 <= gauge("delayed_job_lag") < 1
+	assert gauge("delayed_job_max_lag") >= gauge("delayed_job_lag")
+	assert "oresreverter_delayed_jobs_depth 0" in get_metrics().render()
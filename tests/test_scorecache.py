@@ -0,0 +1,32 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import sqlite3
+
+from oresreverter.scorecache import ScoreCache
+
+
+def test_wikis_with_the_same_language_are_kept_apart(tmp_path):
+	cache = ScoreCache(path=str(tmp_path / "scores.db"))
+	cache.put("ores.damaging", "rowiki", 1, (0.9, True))
+	assert cache.get("ores.damaging", "rowiki", 1) == (0.9, True)
+	assert cache.get("ores.damaging", "rowikisource", 1) is None
+
+	reopened = ScoreCache(path=str(tmp_path / "scores.db"))
+	assert reopened.get("ores.damaging", "rowiki", 1) == (0.9, True)
+	assert reopened.get("ores.damaging", "rowikisource", 1) is None
+
+
+def test_a_cache_keyed_by_language_is_dropped(tmp_path):
+	path = str(tmp_path / "scores.db")
+	db = sqlite3.connect(path)
+	db.execute("CREATE TABLE scores (model TEXT, lang TEXT, revid INTEGER, result TEXT, created REAL, "
+			   "PRIMARY KEY (model, lang, revid))")
+	db.execute("INSERT INTO scores VALUES ('ores.damaging', 'ro', 1, '[0.9, true]', 1e12)")
+	db.commit()
+	db.close()
+
+	cache = ScoreCache(path=path)
+	assert cache.get("ores.damaging", "ro", 1) is None
+	cache.put("ores.damaging", "rowiki", 1, (0.9, True))
+	assert cache.get("ores.damaging", "rowiki", 1) == (0.9, True)
@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+import time
+from datetime import timezone
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.replay import FakeSite
+from oresreverter.sharedstate import SharedStore
+
+
+def stores(tmp_path, count: int = 2) -> list:
+	# one connection per worker process
+	path = str(tmp_path / "shared.sqlite")
+	return [SharedStore(path) for _ in range(count)]
+
+
+def test_the_workers_share_the_tracked_changes(tmp_path):
+	first, second = stores(tmp_path)
+	site = FakeSite("ro", "rowiki")
+	first.tracker(site, timezone.utc).add_change("Pagina", "Vandal")
+	tracker = second.tracker(site, timezone.utc)
+	assert tracker.tracked_change("Pagina", "Vandal")
+	assert not tracker.tracked_change("Pagina", "Altul")
+	# the other wikis have their own
+	assert not second.tracker(FakeSite("en", "enwiki"), timezone.utc).tracked_change("Pagina", "Vandal")
+
+
+def test_a_user_is_reported_by_a_single_worker(tmp_path):
+	trackers = [store.tracker(FakeSite("ro", "rowiki"), timezone.utc) for store in stores(tmp_path, 4)]
+	results = []
+	threads = [threading.Thread(target=lambda tracker=tracker: results.append(tracker.should_report_user("Vandal")))
+			   for tracker in trackers]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert sorted(results) == [False, False, False, True]
+
+
+def test_the_warning_state_is_shared(tmp_path):
+	first, second = stores(tmp_path)
+	first.warnings().set("Vandal", 2)
+	assert second.warnings().get("Vandal") == (2, False)
+	second.warnings().invalidate("Vandal")
+	assert first.warnings().get("Vandal") is None
+
+
+def test_a_user_is_warned_by_one_worker_at_a_time(tmp_path):
+	first, second = stores(tmp_path)
+	held = threading.Event()
+	release = threading.Event()
+
+	def warn():
+		with first.warnings().hold("Vandal"):
+			held.set()
+			release.wait(5)
+
+	thread = threading.Thread(target=warn)
+	thread.start()
+	assert held.wait(5)
+	threading.Timer(0.3, release.set).start()
+	start = time.monotonic()
+	with second.warnings().hold("Vandal"):
+		assert release.is_set()
+	assert time.monotonic() - start >= 0.25
+	thread.join()
+
+
+def test_the_lease_of_a_dead_worker_expires(tmp_path):
+	first, second = stores(tmp_path)
+	with first.transaction() as db:
+		db.execute("INSERT INTO leases VALUES (?, ?, ?)", ("Vandal", "1:1", time.time() - 1))
+	start = time.monotonic()
+	with second.warnings().hold("Vandal"):
+		pass
+	assert time.monotonic() - start < 0.2
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langdetect")
+pytest.importorskip("pywikibot")
+
+from oresreverter import textanalysis
+from oresreverter.textanalysis import TextAnalyser
+
+ARTICLE = ("'''Orașul''' se află pe malul drept al râului și are o populație de câteva mii de locuitori. "
+		   "Clădirea primăriei a fost construită în secolul al XIX-lea de un arhitect local. ")
+
+
+@pytest.fixture(scope="module")
+def analyser():
+	analyser = TextAnalyser(workers=1, max_chars=500000, timeout_s=30)
+	analyser.start()
+	yield analyser
+	analyser._processes.shutdown()
+
+
+def test_submit_does_not_wait_for_the_analysis(analyser):
+	done = threading.Event()
+	results = []
+	def callback(result):
+		results.append(result)
+		done.set()
+	start = time.monotonic()
+	analyser.submit(ARTICLE * 2000, callback)
+	submitted_s = time.monotonic() - start
+	assert done.wait(60)
+	analysed_s = time.monotonic() - start
+	# the caller (the RC loop) got control back long before the result
+	assert submitted_s < analysed_s / 5
+	assert results[0]["detections"][0][0] == "ro"
+
+
+def test_scoring_thread_runs_during_the_analysis(analyser):
+	"""An ordinary edit's work (here, a CPU loop) is not slowed down by a pending analysis."""
+	def work() -> float:
+		start = time.monotonic()
+		sum(i * i for i in range(300000))
+		return time.monotonic() - start
+
+	alone = min(work() for _ in range(3))
+	done = threading.Event()
+	analyser.submit(ARTICLE * 2000, lambda result: done.set())
+	during = min(work() for _ in range(3))
+	assert during < alone * 3
+	assert done.wait(60)
+
+
+def test_analysis_is_reproducible(analyser):
+	first, second = analyser.analyse_many([ARTICLE * 3, ARTICLE * 3])
+	assert first["detections"] == second["detections"]
+
+
+def test_short_text_has_no_detection(analyser):
+	result, = analyser.analyse_many(["[[Ceva]]"])
+	assert result["detections"] == []
+
+
+def test_concurrent_starts_create_one_pool(monkeypatch):
+	pools = []
+	class CountingPool(textanalysis.ProcessPoolExecutor):
+		def __init__(self, *args, **kwargs):
+			super().__init__(*args, **kwargs)
+			pools.append(self)
+	monkeypatch.setattr(textanalysis, "ProcessPoolExecutor", CountingPool)
+	analyser = TextAnalyser(workers=1)
+	threads = [threading.Thread(target=analyser.start) for _ in range(4)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert pools == [analyser._processes]
+	analyser._processes.shutdown()
@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from oresreverter.config import BotConfig
+from oresreverter import workers
+
+
+def worker_config(shard: int, shards: int) -> BotConfig:
+	# only what shard_section() needs, without a site and a config page
+	cfg = BotConfig.__new__(BotConfig)
+	cfg.shard = shard
+	cfg.shards = shards
+	return cfg
+
+
+def test_the_workers_share_the_write_rate():
+	section = worker_config(1, 4).shard_section({"rate": 2, "burst": 6, "retries": 3})
+	assert section == {"rate": 0.5, "burst": 1, "retries": 3}
+
+
+def test_the_main_process_keeps_the_write_rate():
+	cfg = worker_config(None, 1)
+	assert cfg.shard_section({"rate": 2, "burst": 6}) == {"rate": 2, "burst": 6}
+
+
+def test_a_page_always_goes_to_the_same_worker():
+	titles = [f"Articol {idx}" for idx in range(200)]
+	shards = [workers.shard(title, 4) for title in titles]
+	assert set(shards) == {0, 1, 2, 3}
+	# not hash(): another process, with another hash seed, agrees
+	script = f"from oresreverter.workers import shard; print([shard(t, 4) for t in {titles!r}])"
+	output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+							env={**os.environ, "PYTHONHASHSEED": "12345"}).stdout
+	assert output.strip().splitlines()[-1] == str(shards)
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+# -*- coding: utf-8  -*-
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pywikibot")
+
+from pywikibot.exceptions import APIError
+from oresreverter.replay import FakeSite
+from oresreverter.writequeue import PatrolCollector, TokenBucket, WriteQueue
+
+
+class PatrolledChange:
+	def __init__(self, revid: int):
+		self.revid = revid
+		self.result = None
+
+	def patrol_succeeded(self) -> None:
+		self.result = "ok"
+
+	def patrol_failed(self, e: Exception) -> None:
+		self.result = e
+
+
+def test_the_bucket_allows_a_burst_then_the_rate():
+	bucket = TokenBucket(rate=20, burst=3)
+	start = time.monotonic()
+	for _ in range(3):
+		bucket.acquire()
+	assert time.monotonic() - start < 0.05
+	for _ in range(2):
+		bucket.acquire()
+	assert time.monotonic() - start >= 0.09
+
+
+def test_a_paused_bucket_waits():
+	bucket = TokenBucket(rate=100, burst=5)
+	bucket.pause(0.2)
+	start = time.monotonic()
+	bucket.acquire()
+	assert time.monotonic() - start >= 0.19
+
+
+def test_the_most_urgent_writes_go_first():
+	writes = WriteQueue(FakeSite("ro", "rowiki"), rate=1000, burst=10)
+	started = threading.Event()
+	release = threading.Event()
+	done = []
+
+	def first():
+		started.set()
+		release.wait(5)
+
+	writes.submit("patrol", first)
+	assert started.wait(5)
+	# queued while the writer is busy
+	for name, action in (("patrol 1", "patrol"), ("warn", "warn"), ("rollback 1", "rollback"),
+						 ("patrol 2", "patrol"), ("report", "report"), ("rollback 2", "rollback")):
+		writes.submit(action, lambda name=name: done.append(name))
+	assert writes.depth == 6
+	release.set()
+	writes.join()
+	assert done == ["rollback 1", "rollback 2", "warn", "report", "patrol 1", "patrol 2"]
+	assert writes.done == 7
+
+
+def test_a_lost_session_is_restored_and_the_write_retried():
+	site = FakeSite("ro", "rowiki")
+	writes = WriteQueue(site, rate=1000, burst=10)
+	attempts = []
+
+	def rollback():
+		attempts.append(site.calls["login"])
+		if len(attempts) == 1:
+			raise APIError("assertuserfailed", "Assertion that the user is logged in failed.")
+
+	writes.submit("rollback", rollback)
+	writes.join()
+	# logged in again before the second attempt
+	assert attempts == [1, 2]
+	assert (writes.done, writes.retried, writes.failed) == (1, 1, 0)
+
+
+def test_a_failed_write_is_reported_once():
+	writes = WriteQueue(FakeSite("ro", "rowiki"), rate=1000, burst=10, retries=3)
+	errors = []
+
+	def rollback():
+		raise APIError("protectedpage", "This page has been protected.")
+
+	writes.submit("rollback", rollback, on_error=errors.append)
+	writes.join()
+	assert [e.code for e in errors] == ["protectedpage"]
+	assert (writes.done, writes.retried, writes.failed) == (0, 0, 1)
+
+
+def test_each_patrol_request_takes_a_token():
+	site = FakeSite("ro", "rowiki")
+	writes = WriteQueue(site, rate=10, burst=1)
+	patrols = PatrolCollector(site, writes, size=100)
+	changes = [PatrolledChange(revid) for revid in range(5)]
+	start = time.monotonic()
+	for change in changes:
+		patrols.add(change)
+	patrols.flush()
+	writes.join()
+	# 5 requests at 10 per second, the first one from the burst
+	assert time.monotonic() - start >= 0.35
+	assert site.calls["patrol"] == 5
+	assert patrols.batches == 1
+	assert all(change.result == "ok" for change in changes)
+
+
+def test_a_full_collection_is_queued_at_once():
+	site = FakeSite("ro", "rowiki")
+	writes = WriteQueue(site, rate=1000, burst=10)
+	patrols = PatrolCollector(site, writes, window_s=60, size=3)
+	changes = [PatrolledChange(revid) for revid in range(4)]
+	for change in changes:
+		patrols.add(change)
+	writes.join()
+	assert [change.result for change in changes] == ["ok", "ok", "ok", None]
+	patrols.flush()
+	writes.join()
+	assert changes[3].result == "ok"
+	assert (patrols.batches, patrols.patrols) == (2, 4)
+
+
+def test_the_window_queues_a_partial_collection():
+	site = FakeSite("ro", "rowiki")
+	writes = WriteQueue(site, rate=1000, burst=10)
+	patrols = PatrolCollector(site, writes, window_s=0.05, size=50)
+	change = PatrolledChange(1)
+	patrols.add(change)
+	deadline = time.monotonic() + 5
+	while change.result is None and time.monotonic() < deadline:
+		time.sleep(0.01)
+	assert change.result == "ok"
+
+
+def test_a_retried_batch_only_patrols_the_rest(monkeypatch):
+	site = FakeSite("ro", "rowiki")
+	writes = WriteQueue(site, rate=1000, burst=10)
+	patrols = PatrolCollector(site, writes, size=100)
+	requests = []
+
+	def patrol(site, revid, token):
+		requests.append(revid)
+		if revid == 2 and requests.count(2) == 1:
+			raise APIError("badtoken", "Invalid CSRF token.")
+		if revid == 3:
+			raise APIError("permissiondenied", "You don't have permission to mark revisions as patrolled.")
+
+	monkeypatch.setattr("oresreverter.writequeue.patrol", patrol)
+	changes = [PatrolledChange(revid) for revid in range(5)]
+	for change in changes:
+		patrols.add(change)
+	patrols.flush()
+	writes.join()
+	assert requests == [0, 1, 2, 2, 3, 4]
+	assert writes.retried == 1
+	# only the revision the wiki refused is counted as failed
+	assert [change.result == "ok" for change in changes] == [True, True, True, False, True]
+	assert changes[3].result.code == "permissiondenied"